@@ -0,0 +1,99 @@
+"""
+Compares the array supertrend kernel against the previous ``iterrows`` implementation
+on a year of 1-minute bars.
+
+Usage: python -m benchmarks.bench_supertrend
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from quantrion.data.indicators import supertrend
+
+
+def generate_bars(n: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end="2022-08-01 20:00", periods=n, freq="1min", tz="UTC")
+    close = 100 + rng.normal(0, 0.1, n).cumsum()
+    open_ = close + rng.normal(0, 0.05, n)
+    return pd.DataFrame(
+        {
+            "open": open_,
+            "high": np.maximum(open_, close) + rng.random(n) * 0.1,
+            "low": np.minimum(open_, close) - rng.random(n) * 0.1,
+            "close": close,
+        },
+        index=pd.DatetimeIndex(index, name="start"),
+    )
+
+
+def iterrows_supertrend(data: pd.DataFrame, k: float) -> pd.DataFrame:
+    """
+    The supertrend implementation that the kernel replaced.
+    """
+    hla = (data["high"] + data["low"]) / 2
+    data["basic_upper"] = hla + k * data["atr"]
+    data["basic_lower"] = hla - k * data["atr"]
+    prev_row = data.iloc[0]
+    prev_final_upper, prev_final_lower, prev_supertrend = (
+        prev_row["basic_upper"],
+        prev_row["basic_lower"],
+        0,
+    )
+    result = [(0, False)]
+    for _, row in data.iloc[1:].iterrows():
+        if (
+            row["basic_upper"] < prev_final_upper
+            or prev_row["close"] > prev_final_upper
+        ):
+            curr_final_upper = row["basic_upper"]
+        else:
+            curr_final_upper = prev_final_upper
+        if (
+            row["basic_lower"] > prev_final_lower
+            or prev_row["close"] < prev_final_lower
+        ):
+            curr_final_lower = row["basic_lower"]
+        else:
+            curr_final_lower = prev_final_lower
+        if prev_supertrend == prev_final_upper:
+            bullish = row["close"] > curr_final_upper
+        else:
+            bullish = row["close"] >= curr_final_lower
+        curr_supertrend = curr_final_lower if bullish else curr_final_upper
+        prev_final_upper, prev_final_lower, prev_supertrend = (
+            curr_final_upper,
+            curr_final_lower,
+            curr_supertrend,
+        )
+        prev_row = row
+        result.append((curr_supertrend, bullish))
+    df = pd.DataFrame(result, columns=["supertrend", "bullish"], index=data.index)
+    df["bullish"] = df["bullish"].astype(bool)
+    return df
+
+
+def main(n_bars: int = 252 * 390, n: int = 20, k: float = 3.0):
+    data = generate_bars(n_bars)
+    data["atr"] = (data["high"] - data["low"]).rolling(n).mean()
+    data = data.dropna()
+    arrays = [data[col].to_numpy() for col in ["high", "low", "close", "atr"]]
+
+    t0 = time.perf_counter()
+    expected = iterrows_supertrend(data.copy(), k)
+    t_iterrows = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    values, bullish = supertrend(*arrays, k)
+    t_kernel = time.perf_counter() - t0
+
+    assert np.array_equal(values, expected["supertrend"].to_numpy())
+    assert np.array_equal(bullish, expected["bullish"].to_numpy())
+    print(f"bars: {len(data)}")
+    print(f"iterrows: {t_iterrows:.3f}s")
+    print(f"kernel:   {t_kernel:.3f}s ({t_iterrows / t_kernel:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from abc import ABC, ABCMeta, abstractmethod
 from decimal import Decimal
 from enum import Enum
-from typing import TYPE_CHECKING, Optional, TypeVar
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple, TypeVar
 
 import pandas as pd
 
@@ -9,10 +9,12 @@ if TYPE_CHECKING:
     from ..data.base import RealTimeProvider
     from ..trading.base import TradingProvider
 
+from .calendar import NYSE_CALENDAR, NYSEHolidayCalendar, TradingCalendar
 from .restriction import (
     ComposedRestriction,
     DayOfWeekRestriction,
     EmptyRestriction,
+    HolidayRestriction,
     TimeRestriction,
     TradingRestriction,
 )
@@ -31,7 +33,9 @@ class AssetMeta(ABCMeta):
         if cls._instances is None:
             cls._instances = {}
         if symbol not in cls._instances:
-            cls._instances[symbol] = super().__call__(symbol, *args, **kwargs)
+            asset = super().__call__(symbol, *args, **kwargs)
+            asset._init_args = (args, kwargs)
+            cls._instances[symbol] = asset
         return cls._instances[symbol]
 
 
@@ -49,10 +53,22 @@ class Asset(ABC, metaclass=AssetMeta):
     def symbol(self) -> str:
         return self._symbol
 
+    @property
+    def init_args(self) -> Tuple[tuple, Dict[str, Any]]:
+        """
+        The arguments the asset was created with besides the symbol, so that it can
+        be created again in another process.
+        """
+        return getattr(self, "_init_args", ((), {}))
+
     @property
     def restriction(self) -> Optional[TradingRestriction]:
         return self._restriction
 
+    @property
+    def calendar(self) -> Optional[TradingCalendar]:
+        return getattr(self, "_calendar", None)
+
     TS_OR_DF = TypeVar(
         "TS_OR_DF", pd.Timestamp, pd.Series, pd.DataFrame, pd.DatetimeIndex
     )
@@ -103,7 +119,9 @@ class USStockMixin:
         [
             TimeRestriction("16:00", "09:30", _tz),
             DayOfWeekRestriction([5, 6], _tz),
+            HolidayRestriction(NYSEHolidayCalendar(), _tz),
         ]
     )
+    _calendar = NYSE_CALENDAR
     _min_size_increment = 1
     _min_price_increment = 0.01
@@ -0,0 +1,164 @@
+from datetime import date, time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    GoodFriday,
+    Holiday,
+    USLaborDay,
+    USMartinLutherKingJr,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+
+
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        # NYSE does not close on Friday December 31st when January 1st is a Saturday
+        Holiday("New Year's Day", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday(
+            "Juneteenth",
+            month=6,
+            day=19,
+            start_date="2022-01-01",
+            observance=nearest_workday,
+        ),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def nyse_early_closes(start: date, end: date) -> Dict[date, time]:
+    """
+    Returns the NYSE sessions that close at 13:00: the day after Thanksgiving and
+    Christmas Eve and July 3rd when they are weekdays.
+    """
+    result = {}
+    for year in range(start.year, end.year + 1):
+        thanksgiving = USThanksgivingDay.dates(date(year, 1, 1), date(year, 12, 31))
+        candidates = [(thanksgiving[0] + pd.Timedelta("1d")).date()]
+        candidates += [date(year, 12, 24), date(year, 7, 3)]
+        for day in candidates:
+            if day.weekday() < 5 and start <= day <= end:
+                result[day] = time(13)
+    return result
+
+
+class TradingCalendar:
+    """
+    Precomputed trading sessions of an exchange. The session opens, closes and the
+    cumulative number of session minutes are kept as int64 arrays, so that finding
+    the timestamp n session minutes or n sessions before another one is a binary
+    search. The arrays are built on first use.
+    """
+
+    def __init__(
+        self,
+        tz: str,
+        open: str,
+        close: str,
+        holidays: Optional[AbstractHolidayCalendar] = None,
+        early_closes: Optional[Callable[[date, date], Dict[date, time]]] = None,
+        start: str = "2000-01-01",
+        end: str = "2040-12-31",
+    ) -> None:
+        self._tz = tz
+        self._open = open
+        self._close = close
+        self._holidays = holidays
+        self._early_closes = early_closes
+        self._start = start
+        self._end = end
+        self._step = pd.Timedelta("1min").value
+        self._opens: Optional[np.ndarray] = None
+
+    def _build(self):
+        if self._opens is not None:
+            return
+        days = pd.bdate_range(self._start, self._end)
+        if self._holidays is not None:
+            days = days[~days.isin(self._holidays.holidays(self._start, self._end))]
+        days = days.date
+        closes = np.full(len(days), pd.Timedelta(self._close).value, dtype=np.int64)
+        if self._early_closes is not None:
+            early = self._early_closes(days[0], days[-1])
+            for i, day in enumerate(days):
+                if day in early:
+                    closes[i] = pd.Timedelta(early[day].isoformat()).value
+        # Session times are wall clock times, so they are added before localizing
+        wall = pd.DatetimeIndex(days).asi8
+        opens = self._localize(wall + pd.Timedelta(self._open).value)
+        self._midnights = self._localize(wall)
+        self._closes = self._localize(wall + closes)
+        lengths = (self._closes - opens) // self._step
+        self._cum_minutes = np.r_[0, np.cumsum(lengths)]
+        self._opens = opens
+
+    def _localize(self, wall: np.ndarray) -> np.ndarray:
+        index = pd.DatetimeIndex(wall.view("M8[ns]")).tz_localize(self._tz)
+        return index.asi8
+
+    @property
+    def tz(self) -> str:
+        return self._tz
+
+    def _to_ts(self, value: int) -> pd.Timestamp:
+        return pd.Timestamp(value, tz="UTC").tz_convert(self._tz)
+
+    def session(self, at: pd.Timestamp) -> Optional[Tuple[pd.Timestamp, pd.Timestamp]]:
+        """
+        Returns the open and close of the session that contains at, if any.
+        """
+        self._build()
+        i = np.searchsorted(self._opens, at.value, side="right") - 1
+        if i < 0 or at.value >= self._closes[i]:
+            return None
+        return self._to_ts(self._opens[i]), self._to_ts(self._closes[i])
+
+    def is_open(self, at: pd.Timestamp) -> bool:
+        return self.session(at) is not None
+
+    def minutes_before(self, at: pd.Timestamp, n: int) -> pd.Timestamp:
+        """
+        Returns the earliest timestamp such that there are n session minutes between
+        it and at, at excluded.
+        """
+        self._build()
+        i = np.searchsorted(self._opens, at.value, side="right") - 1
+        if i < 0:
+            return self._to_ts(self._opens[0])
+        elapsed = (min(at.value, self._closes[i]) - self._opens[i]) // self._step
+        target = self._cum_minutes[i] + elapsed - n
+        if target <= 0:
+            return self._to_ts(self._opens[0])
+        j = np.searchsorted(self._cum_minutes, target, side="right") - 1
+        offset = target - self._cum_minutes[j]
+        return self._to_ts(self._opens[j] + offset * self._step)
+
+    def sessions_before(self, at: pd.Timestamp, n: int) -> pd.Timestamp:
+        """
+        Returns the midnight of the session that is n sessions before the day of at.
+        """
+        self._build()
+        i = np.searchsorted(self._midnights, at.value, side="right") - 1
+        return self._to_ts(self._midnights[max(i - n, 0)])
+
+
+NYSE_CALENDAR = TradingCalendar(
+    "US/Eastern",
+    "09:30:00",
+    "16:00:00",
+    holidays=NYSEHolidayCalendar(),
+    early_closes=nyse_early_closes,
+)
@@ -1,8 +1,18 @@
 import asyncio
+import os
+import shutil
+from typing import Awaitable, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
 
+from .. import settings
+from ..clock import SimulatedClock, set_clock
 from ..data.base import RealTimeProvider
+from ..data.pyramid import ResamplePyramid
+from ..data.queue import BarQueue, QueuePolicy
+from ..data.store import BarStore, load_columnar, save_columnar
+from ..settings import DEFAULT_TIMEFRAME as DTF
 from .base import TradableAsset, USStockMixin
 
 
@@ -10,25 +20,77 @@ class CSVProvider(RealTimeProvider):
     def __init__(self, asset: TradableAsset, path: str) -> None:
         super().__init__(asset)
         self._path = path
-        bars = pd.read_csv(self._path)
-        bars["start"] = pd.DatetimeIndex(pd.to_datetime(bars["start"], utc=True))
-        self._df = self.asset.localize(bars.set_index("start"))
+        self._df = self._load(path)
         self._curr_idx = -1
         self._task: asyncio.Task = None
+        self._replay: Optional["CSVReplay"] = None
+        self._has_queues = asyncio.Event()
+
+    def _load(self, path: str) -> pd.DataFrame:
+        """
+        Loads the bars from a memory mapped columnar copy of the CSV file, which is
+        created the first time or whenever the CSV file is newer.
+        """
+        columnar_path = f"{os.path.splitext(path)[0]}.bars"
+        if not os.path.exists(columnar_path) or os.path.getmtime(
+            columnar_path
+        ) < os.path.getmtime(path):
+            bars = pd.read_csv(path)
+            bars["start"] = pd.DatetimeIndex(pd.to_datetime(bars["start"], utc=True))
+            shutil.rmtree(columnar_path, ignore_errors=True)
+            save_columnar(columnar_path, bars.set_index("start"))
+        return load_columnar(columnar_path, tz=getattr(self.asset, "_tz", None))
 
     async def _retrieve(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
         return self._df.iloc[: self._curr_idx + 1].loc[start:end]
 
+    def history(self, freq: Optional[str] = None) -> pd.DataFrame:
+        """
+        Returns every bar of the file aggregated to freq, regardless of how far the
+        bars have been replayed. The empty buckets are included, like in :meth:`get`.
+        """
+        if freq is None or freq == DTF or self._df.empty:
+            return self._df
+        base = BarStore.from_frame(self._df)
+        pyramid = ResamplePyramid(self._bars_resample_funcs)
+        pyramid.add_level(freq, base)
+        return pyramid.get(base, freq, self._df.index[0], self._df.index[-1])
+
+    @property
+    def live(self) -> bool:
+        """
+        The bars are only added on the clock while they are replayed.
+        """
+        return self._replay is not None
+
+    def open_queue(
+        self,
+        maxsize: Optional[int] = None,
+        policy: Optional[QueuePolicy] = None,
+    ) -> BarQueue:
+        queue = super().open_queue(maxsize, policy)
+        self._has_queues.set()
+        return queue
+
+    def close_queue(self, queue: BarQueue):
+        super().close_queue(queue)
+        if not self._queues:
+            self._has_queues.clear()
+
     async def _subscribe(self) -> None:
+        if self._replay is not None:
+            # The bars are added by the replay
+            return
+
         async def start():
-            while True:
+            while self._curr_idx + 1 < len(self._df):
+                # The bars are added as fast as the open queues are read, and only
+                # while there is one, so that the first bars are not missed
+                await self._has_queues.wait()
                 self._curr_idx += 1
-                df = self._df.iloc[self._curr_idx : self._curr_idx + 1]
-                if df.empty:
-                    break
-                self.add(df)
-                while self._new_value_event.is_set():
-                    await asyncio.sleep(0)
+                self.add(self._df.iloc[self._curr_idx : self._curr_idx + 1])
+                for queue in list(self._queues.keys()):
+                    await queue.join()
 
         self._task = asyncio.create_task(start())
 
@@ -46,3 +108,75 @@ class CSVAsset(TradableAsset):
 
 class CSVUSStock(CSVAsset, USStockMixin):
     pass
+
+
+class CSVReplay:
+    """
+    Replays the bars of many CSV assets in lockstep on a :class:`SimulatedClock`, as
+    fast as they are processed. The clock jumps to the next time that a task sleeps
+    until, e.g. the next bar close of a strategy scheduler, and every asset gets the
+    bars closed by then in a single batch.
+    """
+
+    def __init__(
+        self,
+        assets: List[CSVAsset],
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+    ) -> None:
+        self._providers = [asset.bars for asset in assets]
+        self._start = start
+        self._end = end
+        self._closes = [
+            provider._df.index.asi8 + pd.Timedelta(DTF).value
+            for provider in self._providers
+        ]
+
+    def _bounds(self) -> Tuple[pd.Timestamp, pd.Timestamp]:
+        starts = [p._df.index[0] for p in self._providers if not p._df.empty]
+        ends = [p._df.index[-1] for p in self._providers if not p._df.empty]
+        start = self._start if self._start is not None else min(starts)
+        end = self._end if self._end is not None else max(ends)
+        return pd.Timestamp(start), pd.Timestamp(end) + pd.Timedelta(DTF)
+
+    def _deliver(self, until: pd.Timestamp):
+        for provider, closes in zip(self._providers, self._closes):
+            idx = int(np.searchsorted(closes, until.value, side="right")) - 1
+            if idx > provider._curr_idx:
+                data = provider._df.iloc[provider._curr_idx + 1 : idx + 1]
+                provider._curr_idx = idx
+                provider.add(data)
+
+    async def run(self, *coros: Awaitable):
+        """
+        Runs coros while the bars between start and end are replayed. The bars before
+        start are available as history. The coros are cancelled once every bar has
+        been replayed and processed.
+        """
+        start, last_close = self._bounds()
+        for provider in self._providers:
+            provider._replay = self
+            provider._curr_idx = int(provider._df.index.searchsorted(start)) - 1
+        clock = SimulatedClock(start)
+        previous = set_clock(clock)
+        grace = pd.Timedelta(seconds=settings.BAR_CLOSE_GRACE)
+        tasks = {asyncio.create_task(coro) for coro in coros}
+        try:
+            # Wait for the coros to start sleeping on the clock
+            await clock.wait_for_sleeper(tasks)
+            while (deadline := clock.next_deadline) is not None:
+                self._deliver(min(deadline, last_close))
+                await clock.advance_to(deadline)
+                # The bars closed at last_close are processed after the grace period
+                if deadline >= last_close + grace:
+                    break
+        finally:
+            set_clock(previous)
+            for task in tasks:
+                task.cancel()
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+            for provider in self._providers:
+                provider._replay = None
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
@@ -1,22 +1,124 @@
 from abc import ABC, abstractmethod
-from datetime import time
-from typing import List
+from datetime import date, time
+from typing import Iterable, List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
-import pytz
+from pandas.tseries.holiday import AbstractHolidayCalendar
+
+from ..clock import get_clock
+
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+# 1970-01-01 was a Thursday
+_EPOCH_MINUTE_OF_WEEK = 3 * MINUTES_PER_DAY
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class CompiledRestriction:
+    """
+    Trading minutes of the week as a boolean mask indexed by the wall clock minute of
+    tz, Monday 00:00 being 0, plus a sorted array of closed days. Timestamps are
+    checked by indexing the mask with their int64 nanoseconds. Restrictions of other
+    timezones that it is composed with are kept as parts checked in their own
+    timezone, since wall clock minutes of two timezones do not map to each other
+    across DST changes.
+    """
+
+    def __init__(
+        self,
+        tz: str,
+        week_mask: np.ndarray,
+        holidays: Iterable = (),
+        parts: Sequence["CompiledRestriction"] = (),
+    ) -> None:
+        self._tz = tz
+        self._week_mask = week_mask
+        self._holidays = np.unique(
+            np.array(list(holidays), dtype="datetime64[D]").astype(np.int64)
+        )
+        self._holiday_set = set(self._holidays.tolist())
+        self._parts = list(parts)
+
+    @property
+    def tz(self) -> str:
+        return self._tz
+
+    def _wall_minutes(self, index: np.ndarray) -> np.ndarray:
+        utc = pd.DatetimeIndex(index.view("M8[ns]")).tz_localize("UTC")
+        return utc.tz_convert(self._tz).tz_localize(None).asi8 // (60 * 10**9)
+
+    def _check(self, minutes: np.ndarray) -> np.ndarray:
+        result = self._week_mask[(minutes + _EPOCH_MINUTE_OF_WEEK) % MINUTES_PER_WEEK]
+        if len(self._holidays) > 0:
+            result &= ~np.isin(minutes // MINUTES_PER_DAY, self._holidays)
+        return result
+
+    def mask(self, index: pd.DatetimeIndex) -> np.ndarray:
+        if index.tz is None:
+            index = index.tz_localize("UTC")
+        result = self._check(self._wall_minutes(index.asi8))
+        for part in self._parts:
+            result &= part.mask(index)
+        return result
+
+    def is_trading(self, at: Optional[pd.Timestamp] = None) -> bool:
+        if at is None:
+            local = get_clock().now().tz_convert(self._tz)
+        elif at.tz is None:
+            local = at.tz_localize("UTC").tz_convert(self._tz)
+        else:
+            local = at.tz_convert(self._tz)
+        minute = local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+        day = local.toordinal() - _EPOCH_ORDINAL
+        if not self._week_mask[minute] or day in self._holiday_set:
+            return False
+        return all(part.is_trading(at) for part in self._parts)
+
+    def __and__(self, other: "CompiledRestriction") -> "CompiledRestriction":
+        holidays = self._holidays.astype("datetime64[D]")
+        if other.tz != self._tz:
+            parts = [*self._parts, other]
+            return CompiledRestriction(self._tz, self._week_mask, holidays, parts)
+        holidays = np.r_[self._holidays, other._holidays].astype("datetime64[D]")
+        return CompiledRestriction(
+            self._tz,
+            self._week_mask & other._week_mask,
+            holidays,
+            [*self._parts, *other._parts],
+        )
 
 
 class TradingRestriction(ABC):
+    """
+    A restriction is compiled once into a :class:`CompiledRestriction`, so that
+    :meth:`is_trading` is a constant time lookup and :meth:`filter` a single
+    vectorized lookup.
+    """
+
+    _compiled: Optional[CompiledRestriction] = None
+
     @abstractmethod
-    def is_trading(self, at: pd.Timestamp = None) -> bool:
+    def compile(self) -> CompiledRestriction:
         pass
 
-    @abstractmethod
+    @property
+    def compiled(self) -> CompiledRestriction:
+        if self._compiled is None:
+            self._compiled = self.compile()
+        return self._compiled
+
+    def is_trading(self, at: pd.Timestamp = None) -> bool:
+        return self.compiled.is_trading(at)
+
     def filter(self, df: pd.DataFrame) -> pd.DataFrame:
-        pass
+        return df[self.compiled.mask(df.index)]
 
 
 class EmptyRestriction(TradingRestriction):
+    def compile(self) -> CompiledRestriction:
+        return CompiledRestriction("UTC", np.ones(MINUTES_PER_WEEK, dtype=bool))
+
     def is_trading(self, at: pd.Timestamp = None) -> bool:
         return True
 
@@ -25,6 +127,11 @@ class EmptyRestriction(TradingRestriction):
 
 
 class TimeRestriction(TradingRestriction):
+    """
+    Trades from end to start, both included, every day. If start is before end the
+    trading period goes over midnight.
+    """
+
     def __init__(
         self,
         start: str,
@@ -36,20 +143,22 @@ class TimeRestriction(TradingRestriction):
         self._sgte = start > end
         self._tz = tz
 
-    def is_trading(self, at: pd.Timestamp = None) -> bool:
-        if at is None:
-            at = pd.Timestamp.now(tz=self._tz).time()
+    def compile(self) -> CompiledRestriction:
+        minutes = np.arange(MINUTES_PER_DAY)
+        start = self._start.hour * 60 + self._start.minute
+        end = self._end.hour * 60 + self._end.minute
         if self._sgte:
-            return self._end <= at <= self._start
-        return (self._end <= at) or (at <= self._start)
-
-    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
-        if self._sgte:
-            return df[(self._end <= df.index.time) & (df.index.time <= self._start)]
-        return df[(df.index.time <= self._start) | (self._end <= df.index.index)]
+            day_mask = (end <= minutes) & (minutes <= start)
+        else:
+            day_mask = (end <= minutes) | (minutes <= start)
+        return CompiledRestriction(self._tz, np.tile(day_mask, 7))
 
 
 class DayOfWeekRestriction(TradingRestriction):
+    """
+    Does not trade on the given days of the week, Monday being 0.
+    """
+
     def __init__(
         self,
         days: List[int],
@@ -58,13 +167,36 @@ class DayOfWeekRestriction(TradingRestriction):
         self._days = days
         self._tz = tz
 
-    def is_trading(self, at: pd.Timestamp = None) -> bool:
-        if at is None:
-            at = pd.Timestamp.now(tz=self._tz)
-        return at.dayofweek in self._days
+    def compile(self) -> CompiledRestriction:
+        week_mask = np.ones((7, MINUTES_PER_DAY), dtype=bool)
+        week_mask[self._days] = False
+        return CompiledRestriction(self._tz, week_mask.ravel())
 
-    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
-        return df[~df.index.dayofweek.isin(self._days)]
+
+class HolidayRestriction(TradingRestriction):
+    """
+    Does not trade on the holidays of a calendar between start and end.
+    """
+
+    def __init__(
+        self,
+        calendar: AbstractHolidayCalendar,
+        tz: str = "UTC",
+        start: str = "2000-01-01",
+        end: str = "2040-12-31",
+    ):
+        self._calendar = calendar
+        self._tz = tz
+        self._start = start
+        self._end = end
+
+    def compile(self) -> CompiledRestriction:
+        holidays = self._calendar.holidays(self._start, self._end)
+        return CompiledRestriction(
+            self._tz,
+            np.ones(MINUTES_PER_WEEK, dtype=bool),
+            holidays.values.astype("datetime64[D]"),
+        )
 
 
 class ComposedRestriction(TradingRestriction):
@@ -74,13 +206,15 @@ class ComposedRestriction(TradingRestriction):
     ):
         self._restrictions = restrictions
 
-    def is_trading(self, at: pd.Timestamp = None) -> bool:
-        for r in self._restrictions:
-            if not r.is_trading(at):
-                return False
-        return True
-
-    def filter(self, df: pd.DataFrame) -> pd.DataFrame:
-        for r in self._restrictions:
-            df = r.filter(df)
-        return df
+    def compile(self) -> CompiledRestriction:
+        compiled = [
+            r.compiled
+            for r in self._restrictions
+            if not isinstance(r, EmptyRestriction)
+        ]
+        if len(compiled) == 0:
+            return EmptyRestriction().compile()
+        result = compiled[0]
+        for c in compiled[1:]:
+            result = result & c
+        return result
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Callable, List, Optional, Set, Tuple, TypeVar
+
+import pandas as pd
+
+T = TypeVar("T")
+
+
+class Clock:
+    """
+    Source of the current time. Everything that reads "now" or waits for a point in
+    time goes through the clock returned by :func:`get_clock`, so that it can be
+    replaced by a :class:`SimulatedClock` in replays and tests.
+    """
+
+    def now(self) -> pd.Timestamp:
+        return pd.Timestamp.utcnow()
+
+    async def sleep_until(self, at: pd.Timestamp):
+        delay = (at - self.now()).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def wait_for(self, aw: Awaitable[T], timeout: pd.Timedelta) -> T:
+        """
+        Like :func:`asyncio.wait_for`, but the timeout elapses on the clock.
+        """
+        return await asyncio.wait_for(aw, timeout.total_seconds())
+
+
+class SimulatedClock(Clock):
+    """
+    Clock that only moves when :meth:`advance_to` is called. Tasks sleeping until a
+    time that is reached are woken, and :meth:`advance_to` returns once every one of
+    them is sleeping again or done, so that whoever drives the clock knows that the
+    woken work has been processed.
+    """
+
+    def __init__(self, start: pd.Timestamp) -> None:
+        self._now = self._to_utc(start)
+        self._sleepers: List[Tuple[int, int, asyncio.Future, asyncio.Task]] = []
+        self._counter = itertools.count()
+        self._changed: Optional[asyncio.Future] = None
+
+    @staticmethod
+    def _to_utc(ts: pd.Timestamp) -> pd.Timestamp:
+        ts = pd.Timestamp(ts)
+        return ts.tz_localize("UTC") if ts.tz is None else ts.tz_convert("UTC")
+
+    def now(self) -> pd.Timestamp:
+        return self._now
+
+    @property
+    def next_deadline(self) -> Optional[pd.Timestamp]:
+        while self._sleepers and self._sleepers[0][2].cancelled():
+            heapq.heappop(self._sleepers)
+        if not self._sleepers:
+            return None
+        return pd.Timestamp(self._sleepers[0][0], tz="UTC")
+
+    def _sleeping_tasks(self) -> Set[asyncio.Task]:
+        return {task for _, _, future, task in self._sleepers if not future.done()}
+
+    def _notify(self, *_):
+        if self._changed is not None and not self._changed.done():
+            self._changed.set_result(None)
+
+    def _push_sleeper(self, at: pd.Timestamp) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        entry = (at.value, next(self._counter), future, asyncio.current_task())
+        heapq.heappush(self._sleepers, entry)
+        self._notify()
+        return future
+
+    async def sleep_until(self, at: pd.Timestamp):
+        at = self._to_utc(at)
+        if at <= self._now:
+            await asyncio.sleep(0)
+            return
+        await self._push_sleeper(at)
+
+    async def wait_for(self, aw: Awaitable[T], timeout: pd.Timedelta) -> T:
+        """
+        Like :func:`asyncio.wait_for`, but the timeout elapses when the clock is
+        advanced past it. The caller counts as sleeping on the clock meanwhile.
+        """
+        task = asyncio.ensure_future(aw)
+        at = self._now + timeout
+        try:
+            # The caller only sleeps if aw is not done right away
+            await asyncio.sleep(0)
+            if not task.done() and at > self._now:
+                future = self._push_sleeper(at)
+                try:
+                    await asyncio.wait(
+                        {task, future}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    future.cancel()
+        finally:
+            done = task.done()
+            if not done:
+                task.cancel()
+        if not done:
+            raise asyncio.TimeoutError()
+        return task.result()
+
+    async def _wait_until(
+        self, predicate: Callable[[], bool], tasks: Set[asyncio.Task]
+    ):
+        for task in tasks:
+            task.add_done_callback(self._notify)
+        try:
+            while not predicate():
+                self._changed = asyncio.get_running_loop().create_future()
+                await self._changed
+        finally:
+            self._changed = None
+            for task in tasks:
+                task.remove_done_callback(self._notify)
+
+    async def settle(self, tasks: Set[asyncio.Task]):
+        """
+        Waits until every task is sleeping on the clock or done.
+        """
+
+        def settled() -> bool:
+            sleeping = self._sleeping_tasks()
+            return all(task.done() or task in sleeping for task in tasks)
+
+        await self._wait_until(settled, tasks)
+
+    async def wait_for_sleeper(self, tasks: Set[asyncio.Task]):
+        """
+        Waits until a task sleeps on the clock or every task is done.
+        """
+        await self._wait_until(
+            lambda: self.next_deadline is not None or all(t.done() for t in tasks),
+            tasks,
+        )
+
+    async def advance_to(self, at: pd.Timestamp):
+        at = self._to_utc(at)
+        if at > self._now:
+            self._now = at
+        woken = set()
+        while self._sleepers and self._sleepers[0][0] <= self._now.value:
+            _, _, future, task = heapq.heappop(self._sleepers)
+            if not future.done():
+                future.set_result(None)
+                woken.add(task)
+        await self.settle(woken)
+
+
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """
+    Replaces the process-wide clock and returns the previous one.
+    """
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
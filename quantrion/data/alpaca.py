@@ -1,18 +1,30 @@
 import asyncio
 import json
 from abc import abstractmethod
-from typing import Any, Dict, List, Optional, Tuple
+from datetime import date
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple, Union
 from urllib.parse import urljoin
 
 import httpx
+import numpy as np
 import pandas as pd
 import pytz
 import websockets
 
 from .. import settings
 from ..asset.base import Asset
-from ..utils import SingletonMeta, retry_request
+from ..clock import get_clock
+from ..utils import SingletonMeta, get_client, retry_request
 from .base import RealTimeProvider
+from .cache import BarsDiskCache
+
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 BAR_FIELDS_TO_NAMES = {
     "t": "start",
@@ -30,8 +42,7 @@ def _data_to_df(
     data: List[dict], field_to_names: Dict[str, str], asset: Asset
 ) -> pd.DataFrame:
     if len(data) == 0:
-        columns = set(field_to_names.values())
-        columns.remove("start")
+        columns = [name for name in field_to_names.values() if name != "start"]
         index = asset.localize(pd.DatetimeIndex([], name="start"))
         return pd.DataFrame(columns=columns, index=index)
     df = pd.DataFrame(data).rename(columns=field_to_names)
@@ -41,6 +52,38 @@ def _data_to_df(
     return asset.localize(df.set_index("start"))
 
 
+def _decode_bars(
+    messages: List[dict], field_to_names: Dict[str, str]
+) -> Dict[str, Tuple[pd.DatetimeIndex, np.ndarray]]:
+    """
+    Decodes the bars of a batch of websocket messages in one pass. The timestamps of
+    every bar are parsed at once and the values are stacked in a single float block,
+    which is then split by symbol.
+
+    Returns:
+        :obj:`Dict[str, Tuple[pd.DatetimeIndex, np.ndarray]]`: The sorted UTC index
+        and the values, with one column per field, of the bars of every symbol.
+    """
+    bars = [data for data in messages if data.get("S") is not None]
+    if len(bars) == 0:
+        return {}
+    fields = [field for field in field_to_names.keys() if field != "t"]
+    index = pd.DatetimeIndex(pd.to_datetime([bar["t"] for bar in bars], utc=True))
+    values = np.array(
+        [[bar.get(field, np.nan) for field in fields] for bar in bars],
+        dtype=np.float64,
+    )
+    rows: Dict[str, List[int]] = dict()
+    for i, bar in enumerate(bars):
+        rows.setdefault(bar["S"], []).append(i)
+    result = dict()
+    for symbol, symbol_rows in rows.items():
+        symbol_index = index[symbol_rows]
+        order = np.argsort(symbol_index.asi8, kind="stable")
+        result[symbol] = (symbol_index[order], values[symbol_rows][order])
+    return result
+
+
 class AlpacaWebSocket(metaclass=SingletonMeta):
     def __init__(self, url: str) -> None:
         self._socket = None
@@ -65,6 +108,21 @@ class AlpacaWebSocket(metaclass=SingletonMeta):
         await self._subscribe_internal([bars.asset.symbol])
         self._symbol_to_provider[bars.asset.symbol] = bars
 
+    def _on_message(self, msg: Union[str, bytes]) -> List["AlpacaBarsProvider"]:
+        """
+        Adds the bars of a message to their providers and returns the providers.
+        """
+        names = [name for field, name in BAR_FIELDS_TO_NAMES.items() if field != "t"]
+        bars = _decode_bars(_json_loads(msg), BAR_FIELDS_TO_NAMES)
+        providers = []
+        for symbol, (index, values) in bars.items():
+            if (provider := self._symbol_to_provider.get(symbol)) is None:
+                continue
+            index = provider.asset.localize(index.rename("start"))
+            provider.add(pd.DataFrame(values, index=index, columns=names, copy=False))
+            providers.append(provider)
+        return providers
+
     async def start(self):
         async for sock in websockets.connect(self._url):
             self._socket = sock
@@ -81,13 +139,8 @@ class AlpacaWebSocket(metaclass=SingletonMeta):
                 symbols = list(self._symbol_to_provider.keys())
                 await self._subscribe_internal(symbols)
                 async for msg in sock:
-                    messages = json.loads(msg)
-                    for data in messages:
-                        if (symbol := data.get("S")) is None:
-                            continue
-                        provider = self._symbol_to_provider[symbol]
-                        df = _data_to_df([data], BAR_FIELDS_TO_NAMES, provider.asset)
-                        provider.add(df)
+                    for provider in self._on_message(msg):
+                        await provider.drain()
             except websockets.ConnectionClosed:
                 continue
 
@@ -97,6 +150,97 @@ class AlpacaUSStockWebSocket(AlpacaWebSocket):
         super().__init__(urljoin(settings.ALPACA_STREAMING_URL, f"/v2/sip"))
 
 
+class AlpacaBarsBatcher(metaclass=SingletonMeta):
+    """
+    Groups the historical bars retrievals of different symbols that ask for the same
+    window and serves them with the multi-symbol bars endpoint. Retrievals wait
+    ``RETRIEVE_BATCH_WINDOW`` seconds for others to join before the batch is sent.
+    """
+
+    def __init__(self) -> None:
+        self._pending: Dict[tuple, Dict[str, List[asyncio.Future]]] = dict()
+        self._tasks = set()
+
+    async def retrieve(
+        self,
+        provider: "AlpacaBarsProvider",
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+    ) -> list:
+        params = provider._get_params(start, end)
+        key = (provider._get_batch_url(), tuple(sorted(params.items())))
+        future = asyncio.get_running_loop().create_future()
+        if key not in self._pending:
+            self._pending[key] = dict()
+            task = asyncio.create_task(self._flush(key, provider))
+            self._tasks.add(task)
+            task.add_done_callback(partial(self._on_flushed, key, self._pending[key]))
+        self._pending[key].setdefault(provider.asset.symbol, []).append(future)
+        return await future
+
+    async def _flush(self, key: tuple, provider: "AlpacaBarsProvider"):
+        await asyncio.sleep(settings.RETRIEVE_BATCH_WINDOW)
+        pending = self._pending.pop(key)
+        url, params = key[0], dict(key[1])
+        symbols = list(pending.keys())
+        size = settings.RETRIEVE_BATCH_MAX_SYMBOLS
+        batches = [symbols[i : i + size] for i in range(0, len(symbols), size)]
+        results = await asyncio.gather(
+            *[self._retrieve_batch(provider, url, params, b) for b in batches],
+            return_exceptions=True,
+        )
+        for batch, result in zip(batches, results):
+            for symbol in batch:
+                for future in pending[symbol]:
+                    if future.done():
+                        continue
+                    if isinstance(result, BaseException):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(list(result.get(symbol, [])))
+
+    def _on_flushed(
+        self, key: tuple, pending: Dict[str, List[asyncio.Future]], task: asyncio.Task
+    ):
+        """
+        Fails the retrievals of a batch that was cancelled or failed before being
+        dispatched, even if its task never started, so that they do not wait forever.
+        """
+        self._tasks.discard(task)
+        if self._pending.get(key) is pending:
+            del self._pending[key]
+        if task.cancelled():
+            error = RuntimeError("The batched bars retrieval was cancelled")
+        else:
+            error = task.exception() or RuntimeError("The batch was not dispatched")
+        for futures in pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _retrieve_batch(
+        self,
+        provider: "AlpacaBarsProvider",
+        url: str,
+        params: Dict[str, Any],
+        symbols: List[str],
+    ) -> Dict[str, list]:
+        params = {"symbols": ",".join(symbols), **params}
+        headers = provider._get_headers()
+        rows: Dict[str, list] = dict()
+        next_token = None
+        client = get_client()
+        while True:
+            response = await provider._next_page(
+                client, url, params=params, headers=headers, next_token=next_token
+            )
+            next_token, new_rows = provider._process_batch_response(response)
+            for symbol, symbol_rows in new_rows.items():
+                rows.setdefault(symbol, []).extend(symbol_rows)
+            if next_token is None:
+                return rows
+
+
 class AlpacaBarsProvider(RealTimeProvider):
     _bars_resample_funcs = {
         **RealTimeProvider._bars_resample_funcs,
@@ -117,42 +261,149 @@ class AlpacaBarsProvider(RealTimeProvider):
         return response
 
     async def _retrieve(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        if settings.BARS_CACHE_DIR is None or start >= end:
+            return await self._retrieve_range(start, end)
+        return await self._retrieve_cached(
+            BarsDiskCache(settings.BARS_CACHE_DIR), start, end
+        )
+
+    async def _retrieve_cached(
+        self, cache: BarsDiskCache, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
+        """
+        Serves the fully closed days from the disk cache and retrieves the rest. Missing
+        days are retrieved whole, so that they can be cached, in one request per run
+        of consecutive days.
+        """
+        start, end = self.asset.localize(start), self.asset.localize(end)
+        tz = start.tz
+        today = self.asset.localize(get_clock().now()).date()
+        key = (
+            self.asset.symbol,
+            settings.DEFAULT_TIMEFRAME,
+            self._get_extra_params().get("adjustment", "raw"),
+        )
+        frames, runs = [], []
+        for day in pd.date_range(start.date(), end.date(), freq="D").date:
+            df = cache.load(*key, day, tz) if day < today else None
+            if df is not None:
+                frames.append(df)
+            elif len(runs) > 0 and runs[-1][-1] == day - pd.Timedelta("1d"):
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+
+        def run_range(run: List[date]) -> Tuple[pd.Timestamp, pd.Timestamp]:
+            run_start = pd.Timestamp(run[0], tz=tz)
+            run_end = (
+                pd.Timestamp(run[-1], tz=tz)
+                + pd.Timedelta("1d")
+                - pd.Timedelta(settings.DEFAULT_TIMEFRAME)
+            )
+            if run[0] >= today:
+                run_start = max(run_start, start)
+            if run[-1] >= today:
+                run_end = min(run_end, end)
+            return run_start, run_end
+
+        results = await asyncio.gather(
+            *[self._retrieve_range(*run_range(run)) for run in runs]
+        )
+        for run, df in zip(runs, results):
+            frames.append(df)
+            for day in run:
+                if day >= today:
+                    continue
+                day_start = pd.Timestamp(day, tz=tz)
+                day_end = day_start + pd.Timedelta("1d") - pd.Timedelta("1ns")
+                cache.save(*key, day, df.loc[day_start:day_end])
+        frames = sorted(
+            (df for df in frames if not df.empty), key=lambda df: df.index[0]
+        )
+        if len(frames) == 0:
+            return _data_to_df([], BAR_FIELDS_TO_NAMES, self.asset)
+        return pd.concat(frames).loc[start:end]
+
+    async def _retrieve_range(
+        self, start: pd.Timestamp, end: pd.Timestamp
+    ) -> pd.DataFrame:
         if start >= end:
             return _data_to_df([], BAR_FIELDS_TO_NAMES, self.asset)
-        async with httpx.AsyncClient() as client:
-            url = self._get_historical_url()
-            headers = {
-                "APCA-API-KEY-ID": settings.ALPACA_API_KEY_ID,
-                "APCA-API-SECRET-KEY": settings.ALPACA_API_KEY_SECRET,
-            }
-            if start.tz is None:
-                start = start.tz_localize(pytz.UTC)
-                end = end.tz_localize(pytz.UTC)
-            else:
-                start = start.astimezone(pytz.UTC)
-                end = end.astimezone(pytz.UTC)
-            params = {
-                "timeframe": settings.DEFAULT_TIMEFRAME,
-                "start": start.isoformat(),
-                "end": end.isoformat(),
-                **self._get_extra_params(),
-            }
+        chunk_size = settings.RETRIEVE_CHUNK_SIZE
+        if chunk_size is None or end - start < pd.Timedelta(chunk_size):
+            rows = await self._retrieve_rows(start, end)
+            return _data_to_df(rows, BAR_FIELDS_TO_NAMES, self.asset)
+        chunk_starts = pd.date_range(start, end, freq=chunk_size)
+        chunk_ends = [
+            chunk_start - pd.Timedelta(settings.DEFAULT_TIMEFRAME)
+            for chunk_start in chunk_starts[1:]
+        ] + [end]
+        semaphore = asyncio.Semaphore(settings.RETRIEVE_MAX_CONCURRENCY)
+
+        async def retrieve_chunk(chunk_start: pd.Timestamp, chunk_end: pd.Timestamp):
+            async with semaphore:
+                return await self._retrieve_rows(chunk_start, chunk_end)
+
+        chunks = await asyncio.gather(
+            *[retrieve_chunk(s, e) for s, e in zip(chunk_starts, chunk_ends)]
+        )
+        rows = [row for chunk in chunks for row in chunk]
+        return _data_to_df(rows, BAR_FIELDS_TO_NAMES, self.asset)
+
+    def _get_headers(self) -> Dict[str, str]:
+        return {
+            "APCA-API-KEY-ID": settings.ALPACA_API_KEY_ID,
+            "APCA-API-SECRET-KEY": settings.ALPACA_API_KEY_SECRET,
+        }
+
+    def _get_params(self, start: pd.Timestamp, end: pd.Timestamp) -> Dict[str, Any]:
+        if start.tz is None:
+            start = start.tz_localize(pytz.UTC)
+            end = end.tz_localize(pytz.UTC)
+        else:
+            start = start.astimezone(pytz.UTC)
+            end = end.astimezone(pytz.UTC)
+        return {
+            "timeframe": settings.DEFAULT_TIMEFRAME,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            **self._get_extra_params(),
+        }
+
+    async def _retrieve_rows(self, start: pd.Timestamp, end: pd.Timestamp) -> list:
+        """
+        Follows the pages of the historical bars endpoint for [start, end].
+        """
+        if (
+            settings.RETRIEVE_BATCH_WINDOW is not None
+            and self._get_batch_url() is not None
+        ):
+            return await AlpacaBarsBatcher().retrieve(self, start, end)
+        client = get_client()
+        url = self._get_historical_url()
+        headers = self._get_headers()
+        params = self._get_params(start, end)
+        response = await self._next_page(client, url, params=params, headers=headers)
+        next_token, rows = self._process_response(response)
+        while next_token is not None:
             response = await self._next_page(
-                client, url, params=params, headers=headers
+                client, url, params=params, headers=headers, next_token=next_token
             )
-            next_token, rows = self._process_response(response)
-            while next_token is not None:
-                response = await self._next_page(
-                    client, url, params=params, headers=headers, next_token=next_token
-                )
-                next_token, new_rows = self._process_response(response)
-                rows.extend(new_rows)
-            return _data_to_df(rows, BAR_FIELDS_TO_NAMES, self.asset)
+            next_token, new_rows = self._process_response(response)
+            rows.extend(new_rows)
+        return rows
 
     @abstractmethod
     def _get_historical_url(self) -> str:
         pass
 
+    def _get_batch_url(self) -> Optional[str]:
+        """
+        Returns the URL of the multi-symbol historical bars endpoint, or None if
+        retrievals of this provider can not be batched.
+        """
+        return None
+
     def _get_extra_params(self) -> Dict[str, Any]:
         return {}
 
@@ -164,6 +415,16 @@ class AlpacaBarsProvider(RealTimeProvider):
     def _process_response(self, response: httpx.Response) -> Tuple[Optional[str], list]:
         pass
 
+    def _process_batch_response(
+        self, response: httpx.Response
+    ) -> Tuple[Optional[str], Dict[str, list]]:
+        """
+        Returns the next page token and the bars of every symbol of a response of the
+        multi-symbol endpoint, which groups the bars by symbol.
+        """
+        data = response.json()
+        return data.get("next_page_token"), data.get("bars", {}) or {}
+
     async def _subscribe(self) -> None:
         ws = self._get_web_socket()
         await ws.subscribe(self)
@@ -173,6 +434,9 @@ class AlpacaUSStockBarsProvider(AlpacaBarsProvider):
     def _get_historical_url(self) -> str:
         return urljoin(settings.ALPACA_DATA_URL, f"/v2/stocks/{self.asset.symbol}/bars")
 
+    def _get_batch_url(self) -> str:
+        return urljoin(settings.ALPACA_DATA_URL, "/v2/stocks/bars")
+
     def _get_extra_params(self) -> Dict[str, Any]:
         return {"adjustment": "all"}
 
@@ -2,12 +2,22 @@ import asyncio
 import math
 import re
 from abc import ABC, abstractmethod
-from typing import Awaitable, Callable, List, Optional, Tuple
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 import pandas as pd
 
+from .. import settings
 from ..asset.base import Asset
+from ..clock import get_clock
 from ..settings import DEFAULT_TIMEFRAME as DTF
+from .indicators import supertrend, supertrend_grid
+from .intervals import IntervalSet
+from .pyramid import ResamplePyramid
+from .queue import BarQueue, QueuePolicy
+from .store import BarStore
+from .streaming import Bar, StreamingIndicator, StreamingResampler
 
 
 class AssetListProvider(ABC):
@@ -16,6 +26,20 @@ class AssetListProvider(ABC):
         pass
 
 
+class StaticAssetListProvider(AssetListProvider):
+    def __init__(self, assets: List[Asset]) -> None:
+        self._assets = assets
+
+    async def list_assets(self) -> List[Asset]:
+        return self._assets
+
+
+def _copy_result(value: Any) -> Any:
+    if isinstance(value, tuple):
+        return tuple(_copy_result(v) for v in value)
+    return value.copy()
+
+
 class GenericBarsProvider(ABC):
     _bars_resample_funcs = {
         "open": "first",
@@ -36,42 +60,273 @@ class GenericBarsProvider(ABC):
         self._asset = asset
         self._lock = asyncio.Lock()
         self._subscribed = False
-        self._bars = None
-        self._retrieved_range: Optional[Tuple[pd.Timestamp, pd.Timestamp]] = None
-        self._new_value_event = asyncio.Event()
+        self._store: Optional[BarStore] = None
+        self._pyramid = ResamplePyramid(self._bars_resample_funcs)
+        self._retrieved = IntervalSet(pd.Timedelta(DTF))
+        self._indicators: Dict[
+            str, Tuple[StreamingIndicator, Optional[StreamingResampler]]
+        ] = {}
+        self._streamed_until: Optional[pd.Timestamp] = None
+        self._in_flight: Dict[Tuple[pd.Timestamp, pd.Timestamp], asyncio.Task] = {}
+        self._listeners: List[Callable[[pd.DataFrame], None]] = []
+        self._memo: "OrderedDict[tuple, Tuple[pd.Timestamp, Any]]" = OrderedDict()
+        self._n_added = 0
+        self._memo_hits = 0
+        self._memo_misses = 0
 
     @property
     def asset(self) -> Asset:
         return self._asset
 
-    def add(self, data: pd.DataFrame):
-        self._new_value_event.set()
-        if self._bars is None:
-            self._bars = data
-            self._retrieved_range = (data.index[0], data.index[-1])
+    @property
+    def _bars(self) -> pd.DataFrame:
+        if self._store is None:
+            columns = list(self._bars_resample_funcs.keys())
+            df = pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="start"))
+            return self.asset.localize(df)
+        return self._store.frame()
+
+    @property
+    def memo_stats(self) -> Dict[str, int]:
+        return {
+            "hits": self._memo_hits,
+            "misses": self._memo_misses,
+            "size": len(self._memo),
+        }
+
+    def _invalidate(self, since: Optional[pd.Timestamp] = None):
+        """
+        Forgets the memoized indicators whose data ends at or after since, or every
+        memoized indicator if since is not given.
+        """
+        if since is None:
+            self._memo.clear()
+            return
+        for key in [k for k, (end, _) in self._memo.items() if end >= since]:
+            del self._memo[key]
+
+    async def _memoized(
+        self,
+        key: tuple,
+        start: pd.Timestamp,
+        end: Optional[pd.Timestamp],
+        freq: Optional[str],
+        compute: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Returns a copy of the memoized result of compute for the indicator key and
+        range, computing it if needed. Results are evicted in LRU order beyond
+        ``INDICATOR_CACHE_SIZE`` and invalidated when bars are committed before their
+        end.
+        """
+        _, norm_end = self._get_required_start_end(start, end, freq)
+        key = (*key, freq, start, norm_end)
+        if (entry := self._memo.get(key)) is not None:
+            self._memo.move_to_end(key)
+            self._memo_hits += 1
+            return _copy_result(entry[1])
+        self._memo_misses += 1
+        n_added = self._n_added
+        value = await compute()
+        # Retrievals only fill the gaps that compute waits for, but real time bars
+        # added while it was awaiting might have been missed
+        if n_added == self._n_added and settings.INDICATOR_CACHE_SIZE > 0:
+            self._memo[key] = (norm_end, _copy_result(value))
+            while len(self._memo) > settings.INDICATOR_CACHE_SIZE:
+                self._memo.popitem(last=False)
+        return value
+
+    def _commit(self, data: pd.DataFrame):
+        if data.empty:
+            return
+        first, last = data.index[0], data.index[-1]
+        self._invalidate(first)
+        # Bars missing before the streamed ones, e.g. a gap of the real time feed that
+        # is filled later, were never seen by the streaming indicators
+        reseed = False
+        if self._indicators and self._streamed_until is not None:
+            index = data.index.asi8[
+                : data.index.searchsorted(self._streamed_until, "right")
+            ]
+            stored = self._store.index if self._store is not None else index[:0]
+            reseed = not np.isin(index, stored).all()
+        if self._store is None:
+            self._store = BarStore.from_frame(data)
         else:
-            self._bars = pd.concat([self._bars, data])
-            self._retrieved_range = (self._retrieved_range[0], data.index[-1])
+            self._store.extend_frame(data)
+        self._pyramid.update(self._store, first.value, last.value)
+        if reseed:
+            self._reseed_indicators()
+
+    def add(self, data: pd.DataFrame):
+        self._n_added += 1
+        self._commit(data)
+        if data.empty:
+            return
+        start, end = data.index[0], data.index[-1]
+        if self._retrieved and self._retrieved.end < start:
+            # The real time feed covers every bar since the last one, even the
+            # periods without trades
+            start = self._retrieved.end
+        self._retrieved.add(start, end)
+        self._stream(data)
+        for listener in self._listeners:
+            listener(data)
+
+    def add_listener(self, listener: Callable[[pd.DataFrame], None]):
+        """
+        Registers a callback that receives the bars passed to :meth:`add`.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[pd.DataFrame], None]):
+        self._listeners.remove(listener)
+
+    def drop(self, before: pd.Timestamp):
+        """
+        Drops the bars older than before so that they are retrieved again if needed.
+        """
+        self._invalidate()
+        if self._store is not None:
+            self._store.drop_before(before.value)
+            self._pyramid.drop_before(self._store, before.value)
+        if self._retrieved:
+            self._retrieved.remove(self._retrieved.start, before - pd.Timedelta(DTF))
+
+    @staticmethod
+    def _feed_indicator(
+        indicator: StreamingIndicator,
+        resampler: Optional[StreamingResampler],
+        ts: pd.Timestamp,
+        bar: Bar,
+    ):
+        if resampler is None:
+            indicator.update(bar)
+            return
+        for _, closed_bar in resampler.update(ts, bar):
+            indicator.update(closed_bar)
+
+    def _stream(self, data: pd.DataFrame):
+        """
+        Feeds the registered streaming indicators with the bars of data that are newer
+        than the last streamed bar. Older bars that were missing are replayed by
+        :meth:`_commit`.
+        """
+        if len(self._indicators) == 0 or data.empty:
+            return
+        if self._streamed_until is not None:
+            data = data.loc[data.index > self._streamed_until]
+            if data.empty:
+                return
+        self._replay(data, list(self._indicators.values()))
+        self._streamed_until = data.index[-1]
+
+    def _replay(
+        self,
+        data: pd.DataFrame,
+        indicators: List[Tuple[StreamingIndicator, Optional[StreamingResampler]]],
+    ):
+        columns = list(data.columns)
+        for ts, *values in data.itertuples():
+            bar = dict(zip(columns, values))
+            for indicator, resampler in indicators:
+                self._feed_indicator(indicator, resampler, ts, bar)
+
+    def _reseed_indicators(self):
+        """
+        Resets the registered streaming indicators and feeds them again with the
+        stored bars up to the last streamed one.
+        """
+        indicators = list(self._indicators.values())
+        for indicator, resampler in indicators:
+            indicator.reset()
+            if resampler is not None:
+                resampler.reset()
+        self._replay(self._bars.loc[: self._streamed_until], indicators)
+
+    def register_indicator(
+        self,
+        name: str,
+        indicator: StreamingIndicator,
+        freq: Optional[str] = None,
+    ) -> StreamingIndicator:
+        """
+        Registers a streaming indicator that is updated once per closed bar of freq.
+        The indicator is warmed up with the bars that were already streamed.
+        """
+        resampler = None
+        if freq is not None and freq != DTF:
+            resampler = StreamingResampler(freq, self._bars_resample_funcs)
+        if not self._bars.empty:
+            if self._streamed_until is None:
+                self._streamed_until = self._bars.index[-1]
+            history = self._bars.loc[: self._streamed_until]
+            self._replay(history, [(indicator, resampler)])
+        self._indicators[name] = (indicator, resampler)
+        return indicator
+
+    def get_indicator(self, name: str) -> Optional[StreamingIndicator]:
+        if name not in self._indicators:
+            return None
+        return self._indicators[name][0]
+
+    def flush_indicators(self, until: pd.Timestamp):
+        """
+        Closes the open buckets of the streaming indicators that end before until.
+        """
+        for indicator, resampler in self._indicators.values():
+            if resampler is None:
+                continue
+            for _, closed_bar in resampler.flush(until):
+                indicator.update(closed_bar)
+
+    async def _retrieve_and_commit(self, start: pd.Timestamp, end: pd.Timestamp):
+        try:
+            new_data = await self._retrieve(start, end)
+            # Ranges are committed in order, so that the streaming indicators get the
+            # bars of a range that finished before an earlier one
+            while earlier := [t for (s, _), t in self._in_flight.items() if s < start]:
+                await asyncio.wait(earlier)
+            self._commit(new_data)
+            self._retrieved.add(start, end)
+            self._stream(new_data)
+        finally:
+            self._in_flight.pop((start, end), None)
 
     async def _update_data(
         self,
         start: pd.Timestamp,
         end: pd.Timestamp,
     ):
-        if self._retrieved_range is None:
-            self._bars = await self._retrieve(start, end)
-            self._retrieved_range = (start, end)
+        """
+        Retrieves the bars in [start, end] that are neither stored nor being retrieved
+        and waits for the in flight retrievals that overlap the interval, so that
+        concurrent calls never retrieve the same bars twice.
+        """
+        missing = self._retrieved.missing(start, end)
+        if len(missing) == 0:
             return
-        curr_start, curr_end = self._retrieved_range
-        if start < curr_start:
-            new_data = await self._retrieve(start, curr_start - pd.Timedelta(DTF))
-            self._bars = pd.concat([new_data, self._bars])
-            self._retrieved_range = (start, curr_end)
-        if end > curr_end:
-            new_data = await self._retrieve(curr_end + pd.Timedelta(DTF), end)
-            self._bars = pd.concat([self._bars, new_data])
-            self._retrieved_range = (self._retrieved_range[0], end)
-        return
+        step = pd.Timedelta(DTF)
+        in_flight = sorted(self._in_flight.items(), key=lambda item: item[0])
+        tasks = []
+        for s, e in missing:
+            curr = s
+            for (task_start, task_end), task in in_flight:
+                if task_end < curr or task_start > e:
+                    continue
+                tasks.append(task)
+                if task_start > curr:
+                    tasks.append(self._start_retrieval(curr, task_start - step))
+                curr = max(curr, task_end + step)
+            if curr <= e:
+                tasks.append(self._start_retrieval(curr, e))
+        # Shielded so that a cancelled caller does not cancel a shared retrieval
+        await asyncio.shield(asyncio.gather(*set(tasks)))
+
+    def _start_retrieval(self, start: pd.Timestamp, end: pd.Timestamp) -> asyncio.Task:
+        task = asyncio.create_task(self._retrieve_and_commit(start, end))
+        self._in_flight[(start, end)] = task
+        return task
 
     def _get_required_start_end(
         self,
@@ -83,13 +338,14 @@ class GenericBarsProvider(ABC):
         """
         Returns the normalized start and end timestamps.
         1. A normalized start is the ce start timestamp that ensures having n periods of data before the start timestamp and that lies on a freq.
+           If the asset has a trading calendar, the start is the exact session minute that leaves n periods of trading time before start.
         2. A normalized end is the closest end timestamp that lies on a freq. If no end is given, the max timestamp is returned.
         3. The max timestamp is the floor of the current timestamp minus the freq.
 
         """
         _freq = freq or DTF
         start = start.ceil(_freq)
-        now = self.asset.localize(pd.Timestamp.utcnow())
+        now = self.asset.localize(get_clock().now())
         max_end = now.floor(_freq) - pd.Timedelta(DTF)
         if end is not None:
             end = end.floor(_freq)
@@ -107,6 +363,11 @@ class GenericBarsProvider(ABC):
         n_retrieve_periods = n * periods
         if len(_bars_before := self._bars.loc[:start]) >= n_retrieve_periods + 1:
             return _bars_before.index[-n_retrieve_periods - 1], end
+        if (calendar := self.asset.calendar) is not None:
+            if unit == "d":
+                return calendar.sessions_before(start, n_retrieve_periods), end
+            n_minutes = n_retrieve_periods * (60 if unit == "h" else 1)
+            return calendar.minutes_before(start, n_minutes).floor(_freq), end
         n_weeks = math.ceil(n_retrieve_periods / 7)
         timespan_to_delta = {
             # We multiply the number of periods by 2 to count on missing data
@@ -145,15 +406,43 @@ class GenericBarsProvider(ABC):
             df = pd.DataFrame(columns=columns, index=pd.DatetimeIndex([]))
             return self.asset.localize(df)
         await self._update_data(start, end)
-        data = self._bars.loc[start:end].copy()
         if freq is None:
-            return data
-        data = self._resample(data, freq)
+            data = self._bars.loc[start:end].copy()
+            if self._store is None:
+                return data
+            return self._store.restore_dtypes(data)
+        if self._store is None:
+            data = self._resample(self._bars.loc[start:end].copy(), freq)
+        else:
+            if freq not in self._pyramid:
+                self._pyramid.add_level(freq, self._store)
+            data = self._pyramid.get(self._store, freq, start, end)
         if lag == 0 or len(lag_data := data.loc[: start - pd.Timedelta(DTF)]) < lag:
             return data
         start = lag_data.index[-lag]
         return data.loc[start:end]
 
+    def get_stored_bar(
+        self, start: pd.Timestamp, freq: Optional[str] = None
+    ) -> Optional[pd.Series]:
+        """
+        Returns the stored bar of freq that starts at start without retrieving any
+        data, or None if there is none.
+        """
+        if self._store is None:
+            return None
+        store = self._store
+        if freq is not None and freq != DTF:
+            if freq not in self._pyramid:
+                self._pyramid.add_level(freq, self._store)
+            store = self._pyramid.level(freq)
+        i = int(np.searchsorted(store.index, start.value))
+        if i == len(store) or store.index[i] != start.value:
+            return None
+        return pd.Series(
+            store.values[:, i].copy(), index=store.column_index, name=start
+        )
+
     async def get_sma(
         self,
         start: pd.Timestamp,
@@ -162,8 +451,11 @@ class GenericBarsProvider(ABC):
         n: int = 20,
         candle_key: str = "close",
     ) -> pd.Series:
-        data = await self.get(start, end, freq, n - 1)
-        return data[candle_key].dropna().rolling(n).mean()[start:]
+        async def compute() -> pd.Series:
+            data = await self.get(start, end, freq, n - 1)
+            return data[candle_key].dropna().rolling(n).mean()[start:]
+
+        return await self._memoized(("sma", n, candle_key), start, end, freq, compute)
 
     async def get_bollinger_bands(
         self,
@@ -174,13 +466,17 @@ class GenericBarsProvider(ABC):
         k: float = 2,
         candle_key: str = "close",
     ) -> Tuple[pd.Series, pd.Series, pd.Series]:
-        data = await self.get(start, end, freq, n - 1)
-        rolling = data[candle_key].dropna().rolling(n)
-        sma = rolling.mean()[start:]
-        std = rolling.std()[start:]
-        upper = sma + k * std
-        lower = sma - k * std
-        return lower, sma, upper
+        async def compute() -> Tuple[pd.Series, pd.Series, pd.Series]:
+            data = await self.get(start, end, freq, n - 1)
+            rolling = data[candle_key].dropna().rolling(n)
+            sma = rolling.mean()[start:]
+            std = rolling.std()[start:]
+            upper = sma + k * std
+            lower = sma - k * std
+            return lower, sma, upper
+
+        key = ("bollinger_bands", n, k, candle_key)
+        return await self._memoized(key, start, end, freq, compute)
 
     async def get_atr(
         self,
@@ -189,13 +485,16 @@ class GenericBarsProvider(ABC):
         freq: str = None,
         n: int = 20,
     ) -> pd.Series:
-        data = (await self.get(start, end, freq, n)).dropna()
-        data["high_low"] = data["high"] - data["low"]
-        prev_close = data["close"].shift(1)
-        data["high_pc"] = (data["high"] - prev_close).abs()
-        data["low_pc"] = (data["low"] - prev_close).abs()
-        tr = data[["high_low", "high_pc", "low_pc"]].max(axis=1)
-        return tr.rolling(n).mean()[start:]
+        async def compute() -> pd.Series:
+            data = (await self.get(start, end, freq, n)).dropna()
+            data["high_low"] = data["high"] - data["low"]
+            prev_close = data["close"].shift(1)
+            data["high_pc"] = (data["high"] - prev_close).abs()
+            data["low_pc"] = (data["low"] - prev_close).abs()
+            tr = data[["high_low", "high_pc", "low_pc"]].max(axis=1)
+            return tr.rolling(n).mean()[start:]
+
+        return await self._memoized(("atr", n), start, end, freq, compute)
 
     async def get_supertrend(
         self,
@@ -205,62 +504,64 @@ class GenericBarsProvider(ABC):
         n: int = 20,
         k: float = 2,
     ) -> pd.DataFrame:
-        data = await self.get(start, end, freq, 1)
-        cols = ["supertrend", "bullish"]
-        default_result = pd.DataFrame(
-            [],
-            columns=cols,
-            index=pd.DatetimeIndex([]),
-            dtype=float,
-        )
-        default_result = self.asset.localize(default_result)
-        if data.empty:
-            return default_result
-        data["atr"] = await self.get_atr(data.index[0], end, freq, n)
-        data = data.dropna()
-        if data.empty:
-            return default_result
-        hla = (data["high"] + data["low"]) / 2
-        data["basic_upper"] = hla + k * data["atr"]
-        data["basic_lower"] = hla - k * data["atr"]
-        prev_row = data.iloc[0]
-        prev_final_upper, prev_final_lower, prev_supertrend = (
-            prev_row["basic_upper"],
-            prev_row["basic_lower"],
-            0,
-        )
-        supertrend = [(0, False)]
-        for _, row in data.iloc[1:].iterrows():
-            if (
-                row["basic_upper"] < prev_final_upper
-                or prev_row["close"] > prev_final_upper
-            ):
-                curr_final_upper = row["basic_upper"]
-            else:
-                curr_final_upper = prev_final_upper
-            if (
-                row["basic_lower"] > prev_final_lower
-                or prev_row["close"] < prev_final_lower
-            ):
-                curr_final_lower = row["basic_lower"]
-            else:
-                curr_final_lower = prev_final_lower
-            # Supertrend calculation
-            if prev_supertrend == prev_final_upper:
-                bullish = row["close"] > curr_final_upper
-            else:
-                bullish = row["close"] >= curr_final_lower
-            curr_supertrend = curr_final_lower if bullish else curr_final_upper
-            prev_final_upper, prev_final_lower, prev_supertrend = (
-                curr_final_upper,
-                curr_final_lower,
-                curr_supertrend,
+        async def compute() -> pd.DataFrame:
+            data = await self.get(start, end, freq, 1)
+            cols = ["supertrend", "bullish"]
+            default_result = pd.DataFrame(
+                [],
+                columns=cols,
+                index=pd.DatetimeIndex([]),
+                dtype=float,
             )
-            prev_row = row
-            supertrend.append((curr_supertrend, bullish))
-        df = pd.DataFrame(supertrend, columns=cols, index=data.index)
-        df["bullish"] = df["bullish"].astype(bool)
-        return df[df["supertrend"] != 0].loc[start:]
+            default_result = self.asset.localize(default_result)
+            if data.empty:
+                return default_result
+            data["atr"] = await self.get_atr(data.index[0], end, freq, n)
+            data = data.dropna()
+            if data.empty:
+                return default_result
+            values, bullish = supertrend(
+                data["high"].to_numpy(dtype=float),
+                data["low"].to_numpy(dtype=float),
+                data["close"].to_numpy(dtype=float),
+                data["atr"].to_numpy(dtype=float),
+                k,
+            )
+            df = pd.DataFrame(
+                {"supertrend": values, "bullish": bullish}, index=data.index
+            )
+            return df[df["supertrend"] != 0].loc[start:]
+
+        return await self._memoized(("supertrend", n, k), start, end, freq, compute)
+
+    async def get_supertrend_grid(
+        self,
+        start: pd.Timestamp,
+        end: Optional[pd.Timestamp] = None,
+        freq: str = None,
+        params: Sequence[Tuple[int, float]] = ((20, 2),),
+    ) -> Tuple[pd.DatetimeIndex, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates the ATR and the supertrend of every (n, k) in params from a single
+        retrieval and resample of the bars. Every row is seeded max(n) bars before
+        start, so its first values may differ from :meth:`get_supertrend`, which seeds
+        one bar before start.
+
+        Returns:
+            :obj:`Tuple[pd.DatetimeIndex, np.ndarray, np.ndarray, np.ndarray]`: The
+            bar timestamps from start and the ATR, supertrend and bullish arrays with
+            shape (len(params), len(index)). See :func:`supertrend_grid`.
+        """
+        max_n = max(n for n, _ in params)
+        data = (await self.get(start, end, freq, max_n)).dropna()
+        atr, values, bullish = supertrend_grid(
+            data["high"].to_numpy(dtype=float),
+            data["low"].to_numpy(dtype=float),
+            data["close"].to_numpy(dtype=float),
+            params,
+        )
+        lo = int(data.index.searchsorted(start))
+        return data.index[lo:], atr[:, lo:], values[:, lo:], bullish[:, lo:]
 
 
 class RealTimeMixin:
@@ -268,9 +569,13 @@ class RealTimeMixin:
     _lock: asyncio.Lock
     _bars: pd.DataFrame
     _subscribed: bool
-    _new_value_event: asyncio.Event
-    _retrieved_range: Tuple[pd.Timestamp, pd.Timestamp]
+    _retrieved: IntervalSet
     _update_data: Callable[[pd.Timestamp, pd.Timestamp], Awaitable[None]]
+    _queues: Dict[BarQueue, Callable[[pd.DataFrame], None]]
+    _queue: Optional[BarQueue]
+    flush_indicators: Callable[[pd.Timestamp], None]
+    add_listener: Callable[[Callable[[pd.DataFrame], None]], None]
+    remove_listener: Callable[[Callable[[pd.DataFrame], None]], None]
 
     @abstractmethod
     async def _subscribe(self) -> None:
@@ -279,48 +584,101 @@ class RealTimeMixin:
         to append data to the provider.
         """
 
+    @property
+    def live(self) -> bool:
+        """
+        Whether the bars are added as they close on the clock, so that the closed
+        bars can be dispatched at the bucket close times.
+        """
+        return True
+
     async def subscribe(self) -> None:
         async with self._lock:
             if self._subscribed:
                 return
             await self._subscribe()
-            now = self.asset.localize(pd.Timestamp.utcnow())
+            now = self.asset.localize(get_clock().now())
             curr_ts = now.floor(DTF) - pd.Timedelta(DTF)
-            if (
-                self._retrieved_range is not None
-                and (curr_end := self._retrieved_range[1]) < curr_ts
-            ):
+            if self._retrieved and (curr_end := self._retrieved.end) < curr_ts:
                 await self._update_data(curr_end, curr_ts)
             self._subscribed = True
 
-    async def wait_for_next(self, freq: Optional[str] = None) -> pd.Series:
-        await self._new_value_event.wait()
-        self._new_value_event.clear()
-        last_bar = self._bars.iloc[-1]
+    def open_queue(
+        self,
+        maxsize: Optional[int] = None,
+        policy: Optional[QueuePolicy] = None,
+    ) -> BarQueue:
+        """
+        Returns a new queue that receives every bar added to the provider from now on.
+        """
+        queue = BarQueue(maxsize, policy)
+
+        def push(data: pd.DataFrame):
+            columns = data.columns
+            values = data.to_numpy(dtype=np.float64)
+            for ts, row in zip(data.index, values):
+                queue.put_nowait(pd.Series(row, index=columns, name=ts))
+
+        self._queues[queue] = push
+        self.add_listener(push)
+        return queue
+
+    def close_queue(self, queue: BarQueue):
+        self.remove_listener(self._queues.pop(queue))
+        queue.close()
+        if queue is self._queue:
+            self._queue = None
+
+    def _get_queue(self) -> BarQueue:
+        if self._queue is None:
+            self._queue = self.open_queue()
+        return self._queue
+
+    async def drain(self):
+        """
+        Waits until the blocking queues of the provider have room for new bars. Real
+        time feeds await it before reading more data, so that slow consumers push
+        back on the feed instead of losing bars.
+        """
+        for queue in list(self._queues.keys()):
+            await queue.wait_not_full()
+
+    async def wait_for_next(
+        self, freq: Optional[str] = None, queue: Optional[BarQueue] = None
+    ) -> pd.Series:
+        """
+        Returns the next bar, or the next closed bar of freq. Bars are read from
+        queue, or from a queue that is opened on the first call, so that bars that
+        arrive while the caller is busy are not skipped.
+        """
+        if queue is None:
+            queue = self._get_queue()
+        last_bar = await queue.get()
         if freq is None:
             return last_bar
         now: pd.Timestamp = last_bar.name
         start = now.floor(freq)
         end = start + pd.Timedelta(freq) - pd.Timedelta(DTF)
-        while True:
-            timeout = end.timestamp() - now.timestamp()
+        clock = get_clock()
+        while now < end:
+            timeout = end - now + pd.Timedelta(seconds=2)
             try:
-                if timeout <= 0:
-                    break
-                await asyncio.wait_for(
-                    self._new_value_event.wait(),
-                    timeout=timeout + 2,
-                    # Wait up to 2 seconds after the current interval is over
-                )
-                last_bar = self._bars.iloc[-1]
-                now = last_bar.name
+                # Wait up to 2 seconds after the current interval is over
+                bar = await clock.wait_for(queue.get(), timeout)
             except asyncio.TimeoutError:
                 break
-            finally:
-                self._new_value_event.clear()
+            if bar.name > end:
+                # The bar belongs to the next interval
+                queue.put_back(bar)
+                break
+            now = bar.name
+        self.flush_indicators(end + pd.Timedelta(DTF))
         df = await self.get(start, end, freq=freq)
         return df.iloc[-1]
 
 
 class RealTimeProvider(GenericBarsProvider, RealTimeMixin):
-    ...
+    def __init__(self, asset: Asset) -> None:
+        super().__init__(asset)
+        self._queues = {}
+        self._queue = None
@@ -0,0 +1,63 @@
+import os
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class BarsDiskCache:
+    """
+    Local cache of bars with one file per (symbol, timeframe, adjustment, day). Every
+    file is an uncompressed npz archive holding the int64 UTC nanosecond index, the
+    float64 values with one row per column and the column names.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = root
+
+    def _path(self, symbol: str, timeframe: str, adjustment: str, day: date) -> str:
+        symbol = symbol.replace("/", "_")
+        return os.path.join(
+            self._root, symbol, timeframe, adjustment, f"{day.isoformat()}.npz"
+        )
+
+    def load(
+        self,
+        symbol: str,
+        timeframe: str,
+        adjustment: str,
+        day: date,
+        tz: Optional[str] = None,
+    ) -> Optional[pd.DataFrame]:
+        path = self._path(symbol, timeframe, adjustment, day)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            index = pd.DatetimeIndex(data["index"].view("M8[ns]"), name="start")
+            df = pd.DataFrame(
+                data["values"].T, index=index, columns=data["columns"].tolist()
+            )
+        df.index = df.index.tz_localize("UTC")
+        if tz is not None:
+            df.index = df.index.tz_convert(tz)
+        return df
+
+    def save(
+        self,
+        symbol: str,
+        timeframe: str,
+        adjustment: str,
+        day: date,
+        df: pd.DataFrame,
+    ):
+        path = self._path(symbol, timeframe, adjustment, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path,
+            index=df.index.asi8,
+            values=df.to_numpy(dtype=np.float64).T,
+            columns=np.array(df.columns, dtype=str),
+        )
+        os.replace(tmp_path, path)
@@ -0,0 +1,197 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def supertrend(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    atr: np.ndarray,
+    k: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the supertrend over raw float64 arrays without NaNs.
+
+    The final bands depend on their previous value, so the recursion is run as a tight
+    scalar loop over plain floats. The first element is the seed of the recursion and
+    always has a supertrend of 0.
+
+    Args:
+        high: (:obj:`np.ndarray`) The high prices.
+        low: (:obj:`np.ndarray`) The low prices.
+        close: (:obj:`np.ndarray`) The close prices.
+        atr: (:obj:`np.ndarray`) The average true range aligned with the prices.
+        k: (:obj:`float`) The multiplier of the ATR used for the bands.
+
+    Returns:
+        :obj:`Tuple[np.ndarray, np.ndarray]`: The supertrend values and whether each
+        bar is bullish.
+    """
+    n = len(close)
+    result = np.zeros(n, dtype=np.float64)
+    bullish = np.zeros(n, dtype=bool)
+    if n == 0:
+        return result, bullish
+    hla = (np.asarray(high, dtype=np.float64) + np.asarray(low, dtype=np.float64)) / 2
+    atr = np.asarray(atr, dtype=np.float64)
+    basic_upper = (hla + k * atr).tolist()
+    basic_lower = (hla - k * atr).tolist()
+    closes = np.asarray(close, dtype=np.float64).tolist()
+    st_values = result.tolist()
+    bullish_values = bullish.tolist()
+    prev_final_upper, prev_final_lower, prev_supertrend = (
+        basic_upper[0],
+        basic_lower[0],
+        0.0,
+    )
+    prev_close = closes[0]
+    for i in range(1, n):
+        curr_close = closes[i]
+        curr_upper = basic_upper[i]
+        curr_lower = basic_lower[i]
+        if curr_upper < prev_final_upper or prev_close > prev_final_upper:
+            curr_final_upper = curr_upper
+        else:
+            curr_final_upper = prev_final_upper
+        if curr_lower > prev_final_lower or prev_close < prev_final_lower:
+            curr_final_lower = curr_lower
+        else:
+            curr_final_lower = prev_final_lower
+        if prev_supertrend == prev_final_upper:
+            is_bullish = curr_close > curr_final_upper
+        else:
+            is_bullish = curr_close >= curr_final_lower
+        prev_supertrend = curr_final_lower if is_bullish else curr_final_upper
+        prev_final_upper, prev_final_lower = curr_final_upper, curr_final_lower
+        prev_close = curr_close
+        st_values[i] = prev_supertrend
+        bullish_values[i] = is_bullish
+    return (
+        np.array(st_values, dtype=np.float64),
+        np.array(bullish_values, dtype=bool),
+    )
+
+
+def seeded_supertrend(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    atr: np.ndarray,
+    k: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the supertrend of every bar seeded on the bar before it, which is what
+    :func:`supertrend` returns for the last of two bars. Every bar is evaluated at
+    once, without the recursion over the whole history.
+
+    Args:
+        high: (:obj:`np.ndarray`) The high prices.
+        low: (:obj:`np.ndarray`) The low prices.
+        close: (:obj:`np.ndarray`) The close prices.
+        atr: (:obj:`np.ndarray`) The average true range aligned with the prices.
+        k: (:obj:`float`) The multiplier of the ATR used for the bands.
+
+    Returns:
+        :obj:`Tuple[np.ndarray, np.ndarray]`: The supertrend values and whether each
+        bar is bullish. The supertrend is 0 for the first bar and for the bars whose
+        ATR or previous ATR is NaN.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    atr = np.asarray(atr, dtype=np.float64)
+    result = np.zeros(len(close), dtype=np.float64)
+    bullish = np.zeros(len(close), dtype=bool)
+    if len(close) < 2:
+        return result, bullish
+    hla = (high + low) / 2
+    basic_upper, basic_lower = hla + k * atr, hla - k * atr
+    prev_upper, prev_lower, prev_close = basic_upper[:-1], basic_lower[:-1], close[:-1]
+    upper, lower = basic_upper[1:], basic_lower[1:]
+    final_upper = np.where(
+        (upper < prev_upper) | (prev_close > prev_upper), upper, prev_upper
+    )
+    final_lower = np.where(
+        (lower > prev_lower) | (prev_close < prev_lower), lower, prev_lower
+    )
+    # The seed has a supertrend of 0
+    is_bullish = np.where(
+        prev_upper == 0, close[1:] > final_upper, close[1:] >= final_lower
+    )
+    valid = ~np.isnan(atr[:-1]) & ~np.isnan(atr[1:])
+    result[1:] = np.where(valid, np.where(is_bullish, final_lower, final_upper), 0.0)
+    bullish[1:] = valid & is_bullish
+    return result, bullish
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """
+    Computes the true range. The first element has no previous close and is the
+    high low range.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    tr = high - low
+    if len(tr) > 1:
+        prev_close = close[:-1]
+        tr[1:] = np.maximum.reduce(
+            [tr[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)]
+        )
+    return tr
+
+
+def rolling_mean(values: np.ndarray, n: int) -> np.ndarray:
+    """
+    Computes the mean of every window of n values with a cumulative sum. The first
+    n - 1 elements are NaN.
+    """
+    result = np.full(len(values), np.nan)
+    if len(values) < n:
+        return result
+    cumsum = np.cumsum(np.r_[0.0, values])
+    result[n - 1 :] = (cumsum[n:] - cumsum[:-n]) / n
+    return result
+
+
+def supertrend_grid(
+    high: np.ndarray,
+    low: np.ndarray,
+    close: np.ndarray,
+    params: Sequence[Tuple[int, float]],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Computes the ATR and the supertrend of every (n, k) in params over the same bars.
+    The true range is computed once and the ATR once per distinct n. Every row is
+    seeded at its first valid ATR like :func:`supertrend`.
+
+    Args:
+        high: (:obj:`np.ndarray`) The high prices.
+        low: (:obj:`np.ndarray`) The low prices.
+        close: (:obj:`np.ndarray`) The close prices.
+        params: (:obj:`Sequence[Tuple[int, float]]`) The (n, k) pairs to evaluate.
+
+    Returns:
+        :obj:`Tuple[np.ndarray, np.ndarray, np.ndarray]`: The ATR, the supertrend
+        values and whether each bar is bullish, with shape (len(params), len(close)).
+        The ATR is NaN and the supertrend 0 before they are available.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    n_params, n_bars = len(params), len(close)
+    tr = true_range(high, low, close)
+    atr_by_n = {n: rolling_mean(tr, n) for n in set(n for n, _ in params)}
+    atr = np.empty((n_params, n_bars), dtype=np.float64)
+    for i, (n, _) in enumerate(params):
+        atr[i] = atr_by_n[n]
+    result = np.zeros((n_params, n_bars), dtype=np.float64)
+    bullish = np.zeros((n_params, n_bars), dtype=bool)
+    for i, (n, k) in enumerate(params):
+        if n > n_bars:
+            continue
+        result[i, n - 1 :], bullish[i, n - 1 :] = supertrend(
+            high[n - 1 :], low[n - 1 :], close[n - 1 :], atr[i, n - 1 :], k
+        )
+    return atr, result, bullish
@@ -0,0 +1,85 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+Interval = Tuple[pd.Timestamp, pd.Timestamp]
+
+
+class IntervalSet:
+    """
+    Sorted set of disjoint closed intervals on a grid of ``step``. Intervals that
+    overlap or are adjacent on the grid are merged.
+    """
+
+    def __init__(self, step: pd.Timedelta) -> None:
+        self._step = step
+        self._starts: List[pd.Timestamp] = []
+        self._ends: List[pd.Timestamp] = []
+
+    def __iter__(self) -> Iterator[Interval]:
+        return iter(zip(self._starts, self._ends))
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __bool__(self) -> bool:
+        return len(self._starts) > 0
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({list(self)})"
+
+    @property
+    def start(self) -> Optional[pd.Timestamp]:
+        return self._starts[0] if self._starts else None
+
+    @property
+    def end(self) -> Optional[pd.Timestamp]:
+        return self._ends[-1] if self._ends else None
+
+    def add(self, start: pd.Timestamp, end: pd.Timestamp):
+        if start > end:
+            return
+        lo = bisect_left(self._ends, start - self._step)
+        hi = bisect_right(self._starts, end + self._step)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def remove(self, start: pd.Timestamp, end: pd.Timestamp):
+        if start > end:
+            return
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        starts, ends = [], []
+        if lo < hi and self._starts[lo] < start:
+            starts.append(self._starts[lo])
+            ends.append(start - self._step)
+        if lo < hi and self._ends[hi - 1] > end:
+            starts.append(end + self._step)
+            ends.append(self._ends[hi - 1])
+        self._starts[lo:hi] = starts
+        self._ends[lo:hi] = ends
+
+    def contains(self, start: pd.Timestamp, end: pd.Timestamp) -> bool:
+        return len(self.missing(start, end)) == 0
+
+    def missing(self, start: pd.Timestamp, end: pd.Timestamp) -> List[Interval]:
+        """
+        Returns the sorted sub-intervals of [start, end] that are not covered.
+        """
+        if start > end:
+            return []
+        result = []
+        lo = bisect_left(self._ends, start)
+        hi = bisect_right(self._starts, end)
+        curr = start
+        for s, e in zip(self._starts[lo:hi], self._ends[lo:hi]):
+            if s > curr:
+                result.append((curr, s - self._step))
+            curr = max(curr, e + self._step)
+        if curr <= end:
+            result.append((curr, end))
+        return result
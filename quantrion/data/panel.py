@@ -0,0 +1,128 @@
+import warnings
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ..settings import DEFAULT_TIMEFRAME as DTF
+from .base import GenericBarsProvider
+
+PANEL_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+class BarPanel:
+    """
+    Symbols x fields x time array of the latest bars of many assets, aligned on a
+    shared grid of the default timeframe. The time axis is a ring of ``window``
+    slots, so the panel keeps constant memory while bars are added, and every query
+    is a single NumPy operation over all the symbols. Bars that are missing for a
+    symbol are NaN.
+    """
+
+    def __init__(
+        self,
+        fields: Sequence[str] = PANEL_FIELDS,
+        window: int = 390,
+        capacity: int = 64,
+    ) -> None:
+        self._fields = list(fields)
+        self._field_to_idx = {field: i for i, field in enumerate(self._fields)}
+        self._window = window
+        self._step = pd.Timedelta(DTF).value
+        self._symbols: List[str] = []
+        self._symbol_to_idx: Dict[str, int] = {}
+        self._values = np.full((capacity, len(self._fields), window), np.nan)
+        self._slot_ts = np.full(window, np.iinfo(np.int64).min, dtype=np.int64)
+        self._end: Optional[int] = None
+        self._tz = None
+
+    @property
+    def symbols(self) -> List[str]:
+        return self._symbols
+
+    @property
+    def fields(self) -> List[str]:
+        return self._fields
+
+    @property
+    def end(self) -> Optional[pd.Timestamp]:
+        if self._end is None:
+            return None
+        return pd.Timestamp(self._end, tz="UTC").tz_convert(self._tz)
+
+    def _row(self, symbol: str) -> int:
+        if (row := self._symbol_to_idx.get(symbol)) is not None:
+            return row
+        row = len(self._symbols)
+        if row == len(self._values):
+            values = np.full((2 * row, *self._values.shape[1:]), np.nan)
+            values[:row] = self._values
+            self._values = values
+        self._symbols.append(symbol)
+        self._symbol_to_idx[symbol] = row
+        return row
+
+    def update(self, symbol: str, data: pd.DataFrame):
+        """
+        Writes the bars of a symbol. Bars older than the window are ignored.
+        """
+        row = self._row(symbol)
+        if data.empty:
+            return
+        if self._tz is None:
+            self._tz = getattr(data.index, "tz", None)
+        ts = data.index.asi8
+        end = max(ts[-1], self._end) if self._end is not None else ts[-1]
+        keep = ts > end - self._window * self._step
+        ts = ts[keep]
+        if len(ts) == 0:
+            return
+        slots = (ts // self._step) % self._window
+        stale = slots[self._slot_ts[slots] != ts]
+        # Slots reused by a newer timestamp forget the bars of every symbol
+        self._values[:, :, stale] = np.nan
+        self._slot_ts[slots] = ts
+        columns = [field for field in self._fields if field in data.columns]
+        fields = [self._field_to_idx[field] for field in columns]
+        values = data[columns].to_numpy(dtype=np.float64)[keep]
+        self._values[row, np.array(fields)[:, None], slots] = values.T
+        self._end = end
+
+    def attach(self, provider: GenericBarsProvider):
+        """
+        Fills the panel with the stored bars of a provider and keeps it updated from
+        the bars that are added to the provider.
+        """
+        symbol = provider.asset.symbol
+        self.update(symbol, provider._bars.iloc[-self._window :])
+        provider.add_listener(lambda data: self.update(symbol, data))
+
+    def values(self, field: str, n: int = 1) -> np.ndarray:
+        """
+        Returns the last n bars of field for every symbol with shape (symbols, n),
+        the last column being the latest bar of the panel.
+        """
+        if self._end is None or n > self._window:
+            return np.full((len(self._symbols), n), np.nan)
+        ts = self._end - np.arange(n - 1, -1, -1) * self._step
+        slots = (ts // self._step) % self._window
+        result = self._values[: len(self._symbols), self._field_to_idx[field], slots]
+        result[:, self._slot_ts[slots] != ts] = np.nan
+        return result
+
+    def last(self, field: str) -> np.ndarray:
+        return self.values(field, 1)[:, 0]
+
+    def zscore(self, field: str, n: int = 20) -> np.ndarray:
+        """
+        Returns the z-score of the last bar of field against the n previous bars, for
+        every symbol.
+        """
+        values = self.values(field, n + 1)
+        history = values[:, :-1]
+        with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+            # Symbols without bars in the window are NaN
+            warnings.simplefilter("ignore", RuntimeWarning)
+            mean = np.nanmean(history, axis=1)
+            std = np.nanstd(history, axis=1, ddof=1)
+            return (values[:, -1] - mean) / std
@@ -0,0 +1,198 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .store import BarStore
+
+_CONSTANT_OFFSET_SPAN = pd.Timedelta("1d").value
+
+
+_QUARTER_HOUR = pd.Timedelta("15min").value
+
+
+@lru_cache(maxsize=None)
+def _freq_value(freq: str) -> int:
+    return pd.Timedelta(freq).value
+
+
+@lru_cache(maxsize=4096)
+def _quarter_utc_offset(quarter: int, tz: str) -> int:
+    ts = pd.Timestamp(quarter * _QUARTER_HOUR, tz="UTC").tz_convert(tz)
+    return pd.Timedelta(ts.utcoffset()).value
+
+
+def _utc_offset(value: int, tz: str) -> int:
+    # Offsets only change at quarters of an hour
+    return _quarter_utc_offset(int(value) // _QUARTER_HOUR, tz)
+
+
+def bucket_labels(index: np.ndarray, freq: str, tz: Optional[str] = None) -> np.ndarray:
+    """
+    Returns the UTC nanosecond start of the freq bucket of every timestamp. Buckets
+    are aligned on the wall clock of tz, like :meth:`pd.Timestamp.floor`.
+    """
+    step = _freq_value(freq)
+    if tz is None:
+        return index - index % step
+    if len(index) > 0 and index[-1] - index[0] < _CONSTANT_OFFSET_SPAN:
+        offset = _utc_offset(index[0], tz)
+        # Timezones never change their offset twice in a day, so equal offsets at
+        # both ends mean a constant offset over the span
+        if offset == _utc_offset(index[-1], tz):
+            return index - (index + offset) % step
+    utc = pd.DatetimeIndex(index.view("M8[ns]")).tz_localize("UTC")
+    wall = utc.tz_convert(tz).tz_localize(None).asi8
+    return index - wall % step
+
+
+def aggregate_bars(
+    values: np.ndarray,
+    columns: List[str],
+    labels: np.ndarray,
+    resample_funcs: Dict[str, str],
+) -> np.ndarray:
+    """
+    Aggregates sorted base bars into one row per distinct label, following the
+    aggregation functions of resample_funcs. The price is aggregated as the volume
+    weighted average.
+
+    Args:
+        values: (:obj:`np.ndarray`) The base values with shape (n_columns, n).
+        columns: (:obj:`List[str]`) The names of the rows of values.
+        labels: (:obj:`np.ndarray`) The sorted bucket label of every base bar.
+        resample_funcs: (:obj:`Dict[str, str]`) The aggregation of every column.
+
+    Returns:
+        :obj:`np.ndarray`: The aggregated values with shape (n_columns, n_buckets).
+    """
+    changes = np.empty(len(labels), dtype=bool)
+    changes[0] = True
+    np.not_equal(labels[1:], labels[:-1], out=changes[1:])
+    starts = np.flatnonzero(changes)
+    ends = np.append(starts[1:], len(labels)) - 1
+    result = np.empty((len(columns), len(starts)), dtype=np.float64)
+    for i, column in enumerate(columns):
+        func = resample_funcs[column]
+        if column == "price" and "volume" in columns:
+            volume = values[columns.index("volume")]
+            pv = np.add.reduceat(values[i] * volume, starts)
+            total_volume = np.add.reduceat(volume, starts)
+            result[i] = pv / np.where(total_volume == 0, 1e-9, total_volume)
+        elif func == "first":
+            result[i] = values[i, starts]
+        elif func == "last":
+            result[i] = values[i, ends]
+        elif func == "max":
+            result[i] = np.maximum.reduceat(values[i], starts)
+        elif func == "min":
+            result[i] = np.minimum.reduceat(values[i], starts)
+        elif func == "sum":
+            result[i] = np.add.reduceat(values[i], starts)
+        else:
+            raise ValueError(f"Unsupported resample function {func} for {column}")
+    return result
+
+
+class ResamplePyramid:
+    """
+    Keeps pre-aggregated bars for every requested frequency. When base bars are
+    committed only the buckets they fall in are aggregated again, so that queries at
+    those frequencies become slice lookups.
+    """
+
+    def __init__(self, resample_funcs: Dict[str, str]) -> None:
+        self._funcs = resample_funcs
+        self._levels: Dict[str, BarStore] = {}
+
+    def __contains__(self, freq: str) -> bool:
+        return freq in self._levels
+
+    def level(self, freq: str) -> BarStore:
+        return self._levels[freq]
+
+    def _columns(self, base: BarStore) -> List[str]:
+        return [column for column in self._funcs.keys() if column in base.columns]
+
+    def _aggregate(
+        self, base: BarStore, freq: str, start: int, end: int
+    ) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        lo, hi = np.searchsorted(base.index, [start, end + 1])
+        if lo >= hi:
+            return None
+        labels = bucket_labels(base.index[lo:hi], freq, base.tz)
+        columns = self._columns(base)
+        rows = [base.columns.index(column) for column in columns]
+        values = base.values[rows, lo:hi]
+        return labels, aggregate_bars(values, columns, labels, self._funcs)
+
+    def add_level(self, freq: str, base: BarStore):
+        level = BarStore(
+            self._columns(base), tz=base.tz, name=base.name, dtypes=base.dtypes
+        )
+        self._levels[freq] = level
+        if len(base) > 0:
+            self.update(base, base.index[0], base.index[-1], [freq])
+
+    def update(
+        self,
+        base: BarStore,
+        start: int,
+        end: int,
+        freqs: Optional[List[str]] = None,
+    ):
+        """
+        Aggregates again the buckets that contain base bars between start and end.
+        """
+        for freq in freqs or list(self._levels.keys()):
+            start_label, end_label = bucket_labels(
+                np.array([start, end]), freq, base.tz
+            )
+            end_label += _freq_value(freq) - 1
+            aggregated = self._aggregate(base, freq, start_label, end_label)
+            if aggregated is None:
+                continue
+            labels, values = aggregated
+            self._levels[freq].extend(np.unique(labels), values)
+
+    def drop_before(self, base: BarStore, before: int):
+        for freq, level in self._levels.items():
+            label = bucket_labels(np.array([before]), freq, base.tz)[0]
+            level.drop_before(label + 1)
+            if len(base) > 0:
+                self.update(base, base.index[0], base.index[0], [freq])
+
+    def get(
+        self,
+        base: BarStore,
+        freq: str,
+        start: pd.Timestamp,
+        end: pd.Timestamp,
+    ) -> pd.DataFrame:
+        """
+        Returns the bars of freq between the buckets of start and end, including the
+        empty buckets like :meth:`pd.DataFrame.resample` does. If start is not
+        aligned on freq the first bucket only aggregates the base bars after start.
+        """
+        level = self._levels[freq]
+        start_label = bucket_labels(np.array([start.value]), freq, base.tz)[0]
+        data = level.frame()
+        lo, hi = np.searchsorted(level.index, [start_label, end.value + 1])
+        data = data.iloc[lo:hi].copy()
+        if start.value != start_label and not data.empty:
+            bucket_end = start_label + _freq_value(freq) - 1
+            partial = self._aggregate(base, freq, start.value, bucket_end)
+            if partial is not None and partial[0][0] == data.index[0].value:
+                data.iloc[0] = partial[1][:, 0]
+            else:
+                data = data.iloc[1:]
+        if data.empty:
+            return level.restore_dtypes(data)
+        index = pd.date_range(
+            data.index[0], data.index[-1], freq=freq, name=data.index.name
+        )
+        data = data.reindex(index)
+        sum_columns = [c for c in data.columns if self._funcs[c] == "sum"]
+        data[sum_columns] = data[sum_columns].fillna(0)
+        return level.restore_dtypes(data)
@@ -0,0 +1,127 @@
+import asyncio
+from collections import deque
+from enum import Enum
+from typing import Deque, Dict, Optional
+
+import pandas as pd
+
+from .. import settings
+
+
+class QueuePolicy(str, Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    COALESCE = "coalesce"
+
+
+class BarQueue:
+    """
+    Bounded queue of the bars received by one subscriber. When the consumer falls
+    behind and the queue is full the policy decides what happens:
+
+    * ``BLOCK`` keeps every bar and makes the producer wait in :meth:`wait_not_full`.
+    * ``DROP_OLDEST`` drops the oldest pending bar.
+    * ``COALESCE`` drops every pending bar and keeps only the latest one.
+    """
+
+    def __init__(
+        self,
+        maxsize: Optional[int] = None,
+        policy: Optional[QueuePolicy] = None,
+    ) -> None:
+        self._maxsize = maxsize or settings.BAR_QUEUE_SIZE
+        self._policy = QueuePolicy(policy or settings.BAR_QUEUE_POLICY)
+        self._bars: Deque[pd.Series] = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._empty = asyncio.Event()
+        self._empty.set()
+        self._n_put = 0
+        self._n_dropped = 0
+        self._max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._bars)
+
+    @property
+    def policy(self) -> QueuePolicy:
+        return self._policy
+
+    @property
+    def full(self) -> bool:
+        return len(self._bars) >= self._maxsize
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "depth": len(self._bars),
+            "max_depth": self._max_depth,
+            "put": self._n_put,
+            "dropped": self._n_dropped,
+        }
+
+    def put_nowait(self, bar: pd.Series):
+        self._n_put += 1
+        if self.full:
+            if self._policy == QueuePolicy.DROP_OLDEST:
+                self._bars.popleft()
+                self._n_dropped += 1
+            elif self._policy == QueuePolicy.COALESCE:
+                self._n_dropped += len(self._bars)
+                self._bars.clear()
+        self._bars.append(bar)
+        self._max_depth = max(self._max_depth, len(self._bars))
+        self._not_empty.set()
+        self._empty.clear()
+        if self.full:
+            self._not_full.clear()
+
+    def put_back(self, bar: pd.Series):
+        """
+        Returns a bar that was read ahead to the front of the queue.
+        """
+        self._bars.appendleft(bar)
+        self._not_empty.set()
+        self._empty.clear()
+        if self.full:
+            self._not_full.clear()
+
+    def get_nowait(self) -> Optional[pd.Series]:
+        if len(self._bars) == 0:
+            return None
+        bar = self._bars.popleft()
+        if len(self._bars) == 0:
+            self._not_empty.clear()
+            self._empty.set()
+        if not self.full:
+            self._not_full.set()
+        return bar
+
+    async def get(self) -> pd.Series:
+        while len(self._bars) == 0:
+            await self._not_empty.wait()
+        return self.get_nowait()
+
+    async def wait_not_full(self):
+        """
+        Waits until a blocking queue has room for new bars.
+        """
+        if self._policy == QueuePolicy.BLOCK:
+            await self._not_full.wait()
+
+    def close(self):
+        """
+        Drops the pending bars, so that the producers waiting on the queue go on.
+        """
+        self._n_dropped += len(self._bars)
+        self._bars.clear()
+        self._not_empty.clear()
+        self._not_full.set()
+        self._empty.set()
+
+    async def join(self):
+        """
+        Waits until every bar in the queue has been read.
+        """
+        await self._empty.wait()
@@ -0,0 +1,236 @@
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+class BarStore:
+    """
+    Growable columnar store of bars: an int64 array of UTC nanosecond timestamps and a
+    float64 block with one row per field. The buffers keep headroom on both ends so
+    that appending new bars and prepending history are amortized O(1), and
+    :meth:`frame` returns a DataFrame that shares memory with the buffers. The dtypes
+    of the integer columns are kept so that :meth:`restore_dtypes` can cast the
+    frames handed out back to them.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        tz: Optional[str] = None,
+        name: Optional[str] = "start",
+        capacity: int = 1024,
+        dtypes: Optional[Dict[str, np.dtype]] = None,
+    ) -> None:
+        self._columns = list(columns)
+        self._column_index = pd.Index(self._columns)
+        self._dtypes = {
+            column: np.dtype(dtype)
+            for column, dtype in (dtypes or {}).items()
+            if column in self._columns and np.issubdtype(dtype, np.integer)
+        }
+        self._tz = tz
+        self._name = name
+        self._index = np.empty(capacity, dtype=np.int64)
+        self._values = np.empty((len(self._columns), capacity), dtype=np.float64)
+        self._lo = self._hi = capacity // 2
+        self._frame: Optional[pd.DataFrame] = None
+        # Whether frames sharing the buffers have been returned
+        self._shared = False
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, capacity: int = 1024) -> "BarStore":
+        store = cls(
+            df.columns,
+            tz=getattr(df.index, "tz", None),
+            name=df.index.name,
+            capacity=max(capacity, 2 * len(df)),
+            dtypes=df.dtypes.to_dict(),
+        )
+        store.extend_frame(df)
+        return store
+
+    def __len__(self) -> int:
+        return self._hi - self._lo
+
+    @property
+    def columns(self) -> List[str]:
+        return self._columns
+
+    @property
+    def column_index(self) -> pd.Index:
+        return self._column_index
+
+    @property
+    def tz(self) -> Optional[str]:
+        return self._tz
+
+    @property
+    def name(self) -> Optional[str]:
+        return self._name
+
+    @property
+    def dtypes(self) -> Dict[str, np.dtype]:
+        return self._dtypes
+
+    @property
+    def index(self) -> np.ndarray:
+        return self._index[self._lo : self._hi]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[:, self._lo : self._hi]
+
+    def _reserve(self, n_front: int, n_back: int):
+        if self._lo >= n_front and self._hi + n_back <= len(self._index):
+            return
+        size = len(self) + n_front + n_back
+        capacity = max(2 * len(self._index), 2 * size)
+        lo = n_front + (capacity - size) // 2
+        index = np.empty(capacity, dtype=np.int64)
+        values = np.empty((len(self._columns), capacity), dtype=np.float64)
+        index[lo : lo + len(self)] = self.index
+        values[:, lo : lo + len(self)] = self.values
+        self._index, self._values = index, values
+        self._lo, self._hi = lo, lo + size - n_front - n_back
+
+    def extend(self, index: np.ndarray, values: np.ndarray):
+        """
+        Inserts sorted bars. Bars newer than the stored ones are appended, older bars are
+        prepended and overlapping bars are merged, replacing stored bars with the same
+        timestamp.
+
+        Args:
+            index: (:obj:`np.ndarray`) The sorted int64 UTC nanosecond timestamps.
+            values: (:obj:`np.ndarray`) The float64 values with shape (n_columns, n).
+        """
+        n = len(index)
+        if n == 0:
+            return
+        self._frame = None
+        if len(self) > 0 and index[0] == self._index[self._hi - 1]:
+            # Replaces the last bar, e.g. the open bucket of a resampled series
+            if self._shared:
+                # Copied on write so that previously returned frames keep their data
+                self._index, self._values = self._index.copy(), self._values.copy()
+                self._shared = False
+            self._values[:, self._hi - 1] = values[:, 0]
+            index, values = index[1:], values[:, 1:]
+            n -= 1
+            if n == 0:
+                return
+        if len(self) == 0 or index[0] > self._index[self._hi - 1]:
+            self._reserve(0, n)
+            self._index[self._hi : self._hi + n] = index
+            self._values[:, self._hi : self._hi + n] = values
+            self._hi += n
+        elif index[-1] < self._index[self._lo]:
+            self._reserve(n, 0)
+            self._index[self._lo - n : self._lo] = index
+            self._values[:, self._lo - n : self._lo] = values
+            self._lo -= n
+        else:
+            self._merge(index, values)
+
+    def _merge(self, index: np.ndarray, values: np.ndarray):
+        curr_index, curr_values = self.index, self.values
+        keep = ~np.isin(curr_index, index)
+        curr_index, curr_values = curr_index[keep], curr_values[:, keep]
+        positions = np.searchsorted(curr_index, index)
+        new_index = np.insert(curr_index, positions, index)
+        new_values = np.insert(curr_values, positions, values, axis=1)
+        # Start from fresh buffers so that previously returned frames keep their data
+        self._index = np.empty(0, dtype=np.int64)
+        self._values = np.empty((len(self._columns), 0), dtype=np.float64)
+        self._lo = self._hi = 0
+        self.extend(new_index, new_values)
+
+    def extend_frame(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        if list(df.columns) != self._columns:
+            df = df.reindex(columns=self._columns)
+        values = df.to_numpy(dtype=np.float64).T
+        self.extend(df.index.asi8, values)
+
+    def drop_before(self, ts: int):
+        self._frame = None
+        self._lo += int(np.searchsorted(self.index, ts))
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Returns a DataFrame view of the stored bars. The view is cached until the
+        store is modified and must be treated as read only.
+        """
+        if self._frame is None:
+            dtype = np.dtype("M8[ns]")
+            if self._tz is not None:
+                dtype = pd.DatetimeTZDtype(tz=self._tz)
+            index = pd.DatetimeIndex(
+                pd.arrays.DatetimeArray(self.index, dtype=dtype, copy=False),
+                name=self._name,
+                copy=False,
+            )
+            self._frame = pd.DataFrame(
+                self.values.T, index=index, columns=self._column_index, copy=False
+            )
+        self._shared = True
+        return self._frame
+
+    def restore_dtypes(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Casts the integer columns of df, a frame of the stored bars, back from float64
+        to their original dtypes. Columns with missing values are left as floats.
+        """
+        dtypes = {
+            column: dtype
+            for column, dtype in self._dtypes.items()
+            if column in df.columns and not df[column].isna().any()
+        }
+        if len(dtypes) == 0:
+            return df
+        return df.astype(dtypes, copy=False)
+
+
+def save_columnar(path: str, df: pd.DataFrame):
+    """
+    Saves the numeric columns of df in a directory that can be memory mapped by
+    :func:`load_columnar`: ``index.npy`` holds the int64 UTC nanosecond timestamps,
+    ``values.npy`` the float64 values with one row per column and ``columns.npy``
+    the column names. The directory is written aside and renamed so that concurrent
+    readers never see a partial conversion.
+    """
+    df = df.select_dtypes("number")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, "index.npy"), df.index.asi8)
+    np.save(
+        os.path.join(tmp_path, "values.npy"),
+        np.ascontiguousarray(df.to_numpy(dtype=np.float64).T),
+    )
+    np.save(os.path.join(tmp_path, "columns.npy"), np.array(df.columns, dtype=str))
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another process finished the same conversion first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_columnar(
+    path: str, tz: Optional[str] = None, name: Optional[str] = "start"
+) -> pd.DataFrame:
+    """
+    Opens a directory written by :func:`save_columnar` as a read only DataFrame backed
+    by memory mapped files, without copying the data. The index is converted to tz,
+    or left as naive UTC if no tz is given.
+    """
+    index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+    values = np.load(os.path.join(path, "values.npy"), mmap_mode="r")
+    columns = np.load(os.path.join(path, "columns.npy")).tolist()
+    dtype = np.dtype("M8[ns]") if tz is None else pd.DatetimeTZDtype(tz=tz)
+    index = pd.DatetimeIndex(
+        pd.arrays.DatetimeArray(index, dtype=dtype, copy=False), name=name, copy=False
+    )
+    return pd.DataFrame(values.T, index=index, columns=columns, copy=False)
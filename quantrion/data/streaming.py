@@ -0,0 +1,270 @@
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from ..settings import DEFAULT_TIMEFRAME as DTF
+
+Bar = Mapping[str, float]
+
+
+class StreamingIndicator(ABC):
+    """
+    An indicator that keeps running state and is updated once per closed bar.
+    Both updating and reading the latest value take constant time.
+    """
+
+    @abstractmethod
+    def update(self, bar: Bar) -> None:
+        pass
+
+    @abstractmethod
+    def reset(self) -> None:
+        """
+        Forgets every bar the indicator was updated with.
+        """
+
+    @property
+    @abstractmethod
+    def ready(self) -> bool:
+        pass
+
+    @property
+    @abstractmethod
+    def value(self):
+        pass
+
+
+class _RollingWindow:
+    """
+    Fixed size window that tracks the mean and the sum of squared deviations
+    with Welford's algorithm.
+    """
+
+    def __init__(self, n: int) -> None:
+        self._n = n
+        self._values = deque(maxlen=n)
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def clear(self) -> None:
+        self._values.clear()
+        self._mean = 0.0
+        self._m2 = 0.0
+
+    def push(self, value: float) -> None:
+        if len(self._values) == self._n:
+            old = self._values[0]
+            count = self._n - 1
+            if count == 0:
+                self._mean, self._m2 = 0.0, 0.0
+            else:
+                delta = old - self._mean
+                self._mean -= delta / count
+                self._m2 -= delta * (old - self._mean)
+        self._values.append(value)
+        delta = value - self._mean
+        self._mean += delta / len(self._values)
+        self._m2 += delta * (value - self._mean)
+
+    @property
+    def full(self) -> bool:
+        return len(self._values) == self._n
+
+    @property
+    def mean(self) -> float:
+        return self._mean if self.full else math.nan
+
+    @property
+    def std(self) -> float:
+        if not self.full or self._n < 2:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self._n - 1))
+
+
+class StreamingSMA(StreamingIndicator):
+    def __init__(self, n: int = 20, candle_key: str = "close") -> None:
+        self._window = _RollingWindow(n)
+        self._candle_key = candle_key
+
+    def update(self, bar: Bar) -> None:
+        self._window.push(bar[self._candle_key])
+
+    def reset(self) -> None:
+        self._window.clear()
+
+    @property
+    def ready(self) -> bool:
+        return self._window.full
+
+    @property
+    def value(self) -> float:
+        return self._window.mean
+
+
+class StreamingBollingerBands(StreamingIndicator):
+    def __init__(self, n: int = 20, k: float = 2, candle_key: str = "close") -> None:
+        self._window = _RollingWindow(n)
+        self._k = k
+        self._candle_key = candle_key
+
+    def update(self, bar: Bar) -> None:
+        self._window.push(bar[self._candle_key])
+
+    def reset(self) -> None:
+        self._window.clear()
+
+    @property
+    def ready(self) -> bool:
+        return self._window.full
+
+    @property
+    def value(self) -> Tuple[float, float, float]:
+        sma, std = self._window.mean, self._window.std
+        return sma - self._k * std, sma, sma + self._k * std
+
+
+class StreamingATR(StreamingIndicator):
+    def __init__(self, n: int = 20) -> None:
+        self._window = _RollingWindow(n)
+        self._prev_close: Optional[float] = None
+
+    def update(self, bar: Bar) -> None:
+        high, low = bar["high"], bar["low"]
+        tr = high - low
+        if self._prev_close is not None:
+            tr = max(tr, abs(high - self._prev_close), abs(low - self._prev_close))
+        self._prev_close = bar["close"]
+        self._window.push(tr)
+
+    def reset(self) -> None:
+        self._window.clear()
+        self._prev_close = None
+
+    @property
+    def ready(self) -> bool:
+        return self._window.full
+
+    @property
+    def value(self) -> float:
+        return self._window.mean
+
+
+class StreamingSupertrend(StreamingIndicator):
+    def __init__(self, n: int = 20, k: float = 2) -> None:
+        self._atr = StreamingATR(n)
+        self._k = k
+        self._final_upper: Optional[float] = None
+        self._final_lower: Optional[float] = None
+        self._prev_close: Optional[float] = None
+        self._supertrend = 0.0
+        self._bullish = False
+
+    def update(self, bar: Bar) -> None:
+        self._atr.update(bar)
+        if not self._atr.ready:
+            return
+        hla = (bar["high"] + bar["low"]) / 2
+        atr = self._atr.value
+        basic_upper, basic_lower = hla + self._k * atr, hla - self._k * atr
+        close = bar["close"]
+        if self._final_upper is None:
+            self._final_upper, self._final_lower = basic_upper, basic_lower
+            self._prev_close = close
+            return
+        if basic_upper < self._final_upper or self._prev_close > self._final_upper:
+            final_upper = basic_upper
+        else:
+            final_upper = self._final_upper
+        if basic_lower > self._final_lower or self._prev_close < self._final_lower:
+            final_lower = basic_lower
+        else:
+            final_lower = self._final_lower
+        if self._supertrend == self._final_upper:
+            self._bullish = close > final_upper
+        else:
+            self._bullish = close >= final_lower
+        self._supertrend = final_lower if self._bullish else final_upper
+        self._final_upper, self._final_lower = final_upper, final_lower
+        self._prev_close = close
+
+    def reset(self) -> None:
+        self._atr.reset()
+        self._final_upper = self._final_lower = self._prev_close = None
+        self._supertrend = 0.0
+        self._bullish = False
+
+    @property
+    def ready(self) -> bool:
+        return self._supertrend != 0
+
+    @property
+    def value(self) -> Tuple[float, bool]:
+        return self._supertrend, self._bullish
+
+
+class StreamingResampler:
+    """
+    Aggregates base timeframe bars into buckets of ``freq`` and emits every bucket
+    once it is closed, either because its last base bar arrived, because a bar of a
+    later bucket arrived or because it was explicitly flushed.
+    """
+
+    def __init__(self, freq: str, resample_funcs: Dict[str, str]) -> None:
+        self._freq = freq
+        self._funcs = resample_funcs
+        self._bucket_start: Optional[pd.Timestamp] = None
+        self._bucket: Dict[str, float] = {}
+        self._pv = 0.0
+
+    def _close(self) -> Tuple[pd.Timestamp, Dict[str, float]]:
+        bucket = self._bucket
+        if "price" in bucket:
+            bucket["price"] = self._pv / (bucket.get("volume") or 1e-9)
+        result = (self._bucket_start, bucket)
+        self._bucket_start, self._bucket, self._pv = None, {}, 0.0
+        return result
+
+    def reset(self) -> None:
+        self._bucket_start, self._bucket, self._pv = None, {}, 0.0
+
+    def flush(
+        self, until: Optional[pd.Timestamp] = None
+    ) -> List[Tuple[pd.Timestamp, Dict[str, float]]]:
+        if self._bucket_start is None:
+            return []
+        if until is not None and self._bucket_start + pd.Timedelta(self._freq) > until:
+            return []
+        return [self._close()]
+
+    def update(
+        self, ts: pd.Timestamp, bar: Bar
+    ) -> List[Tuple[pd.Timestamp, Dict[str, float]]]:
+        closed = []
+        bucket_start = ts.floor(self._freq)
+        if self._bucket_start is not None and bucket_start != self._bucket_start:
+            closed.append(self._close())
+        if self._bucket_start is None:
+            self._bucket_start = bucket_start
+            self._bucket = {key: bar[key] for key in self._funcs.keys() if key in bar}
+            self._pv = bar.get("price", 0.0) * bar.get("volume", 0.0)
+        else:
+            bucket = self._bucket
+            for key, func in self._funcs.items():
+                if key not in bar:
+                    continue
+                if func == "max":
+                    bucket[key] = max(bucket[key], bar[key])
+                elif func == "min":
+                    bucket[key] = min(bucket[key], bar[key])
+                elif func == "last":
+                    bucket[key] = bar[key]
+                elif func == "sum":
+                    bucket[key] += bar[key]
+            self._pv += bar.get("price", 0.0) * bar.get("volume", 0.0)
+        bucket_end = bucket_start + pd.Timedelta(self._freq)
+        if ts + pd.Timedelta(DTF) >= bucket_end:
+            closed.append(self._close())
+        return closed
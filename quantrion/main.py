@@ -9,6 +9,7 @@ import yaml
 from quantrion.asset.alpaca import AlpacaUSStock
 from quantrion.data.file import CSVAssetListProvider
 from quantrion.strategy.supertrend import SupertrendStrategy
+from quantrion.utils import close_client
 
 with open("logging.yaml", "r") as log_config_file:
     config = yaml.load(log_config_file, Loader=yaml.FullLoader)
@@ -34,7 +35,10 @@ async def _run():
         risk_multiplier=1.5,
         win_to_loss_ratio=2,
     )
-    await strategy.run()
+    try:
+        await strategy.run()
+    finally:
+        await close_client()
 
 
 def run():
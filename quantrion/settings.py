@@ -10,8 +10,37 @@ DEBUG = True
 DEFAULT_TIMEFRAME = "1min"
 DEFAULT_POLL_INTERVAL = 0.001
 MAX_RETRIES = 3
+# Size and overflow policy ("block", "drop_oldest" or "coalesce") of the queues of
+# real time bars of every subscriber
+BAR_QUEUE_SIZE = 1000
+BAR_QUEUE_POLICY = "drop_oldest"
+# Seconds that closed bars wait for late real time bars before being dispatched
+BAR_CLOSE_GRACE = 2
+# Number of assets whose history is retrieved at the same time before a strategy
+# starts dispatching real time bars
+WARMUP_MAX_CONCURRENCY = 16
+# Initial size of the requests token bucket. It is updated from the rate limit
+# headers of the responses
+RATE_LIMIT_PER_MINUTE = 200
 GLOBAL_MAX_RISK_PERC = 0.1  # 0.1% of total portfolio value
 GLOBAL_MAX_PORTFOLIO_PERC = 1  # 1% of total portfolio value
+# Number of indicator results memoized per bars provider
+INDICATOR_CACHE_SIZE = 128
+# Directory of the on-disk bars cache. The cache is disabled if not set
+BARS_CACHE_DIR = os.environ.get("BARS_CACHE_DIR")
+# Size of the time chunks that historical bars are retrieved in concurrently, e.g.
+# "1d" or "7d". Every request follows its own pages if not set
+RETRIEVE_CHUNK_SIZE = os.getenv("RETRIEVE_CHUNK_SIZE")
+RETRIEVE_MAX_CONCURRENCY = int(os.getenv("RETRIEVE_MAX_CONCURRENCY", 4))
+# Seconds that historical retrievals wait to be batched with the retrievals of other
+# symbols for the same window. Every symbol is retrieved on its own if not set
+RETRIEVE_BATCH_WINDOW = None
+RETRIEVE_BATCH_MAX_SYMBOLS = 100
+# Connection pool of the shared HTTP client. HTTP/2 requires the h2 package
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+HTTP_KEEPALIVE_EXPIRY = 60
+HTTP2 = False
 # Alpaca settings
 ALPACA_API_KEY_ID = os.environ["ALPACA_API_KEY_ID"]
 ALPACA_API_KEY_SECRET = os.environ["ALPACA_API_KEY_SECRET"]
@@ -0,0 +1,189 @@
+from typing import TYPE_CHECKING, Dict
+
+import numpy as np
+import pandas as pd
+
+from .. import settings
+from ..trading.schemas import Side
+from .func import get_risk_order_size, get_stop_profit_range
+
+if TYPE_CHECKING:
+    from .supertrend import SupertrendStrategy
+
+
+def first_crossing(
+    values: np.ndarray,
+    starts: np.ndarray,
+    levels: np.ndarray,
+    above: bool,
+) -> np.ndarray:
+    """
+    Finds, for every start, the first index from start on where values reach the level
+    of the start, i.e. are greater or equal to it if above or less or equal otherwise.
+
+    A table of the extrema of every window of 2^l values is built once, and all the
+    starts are advanced together by binary lifting, so the search costs
+    O(n log n + m log n) array operations for n values and m starts.
+
+    Args:
+        values: (:obj:`np.ndarray`) The values to search.
+        starts: (:obj:`np.ndarray`) The int indices that the searches start at.
+        levels: (:obj:`np.ndarray`) The level of every search.
+        above: (:obj:`bool`) Whether the levels are reached from below.
+
+    Returns:
+        :obj:`np.ndarray`: The index of the first crossing of every start, or
+        len(values) if the level is never reached.
+    """
+    n = len(values)
+    pos = np.asarray(starts, dtype=np.int64).copy()
+    if n == 0 or len(pos) == 0:
+        return np.full(len(pos), n, dtype=np.int64)
+    extremum = np.maximum if above else np.minimum
+    # tables[l][i] is the extremum of values[i : i + 2 ** l]
+    tables = [np.asarray(values, dtype=np.float64)]
+    while 2 ** len(tables) <= n:
+        prev, size = tables[-1], 2 ** (len(tables) - 1)
+        tables.append(extremum(prev[:-size], prev[size:]))
+    for level in reversed(range(len(tables))):
+        table = tables[level]
+        window = table[np.minimum(pos, len(table) - 1)]
+        not_reached = window < levels if above else window > levels
+        pos += np.where((pos < len(table)) & not_reached, 2**level, 0)
+    return pos
+
+
+class BacktestResult:
+    """
+    Trades and equity curve of a backtest. Every trade is sized against the same
+    capital, so the equity curve is the capital plus the realized profit.
+    """
+
+    def __init__(self, trades: pd.DataFrame, equity: pd.Series) -> None:
+        self.trades = trades
+        self.equity = equity
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        pnl = self.trades["pnl"]
+        drawdown = (self.equity.cummax() - self.equity).max()
+        return {
+            "trades": len(pnl),
+            "hit_ratio": (pnl > 0).mean() if len(pnl) > 0 else np.nan,
+            "pnl": pnl.sum(),
+            "max_drawdown": 0.0 if np.isnan(drawdown) else drawdown,
+        }
+
+
+def simulate_oco(
+    bars: pd.DataFrame,
+    entries: np.ndarray,
+    long: np.ndarray,
+    risk: np.ndarray,
+    win_to_loss_ratio: float,
+    capital: float = 100000.0,
+) -> BacktestResult:
+    """
+    Simulates a market order at the close of every entry bar followed by an OCO order
+    with the stop and profit prices of :func:`get_stop_profit_range`, like
+    :class:`BasicTradeMixin` does. An exit fills at its price, or at the open of the
+    bar if the price gapped through it. If both prices are reached in the same bar
+    the stop is assumed to fill first. Trades still open at the last bar are closed
+    at its close.
+
+    Args:
+        bars: (:obj:`pd.DataFrame`) The open, high, low and close of the bars.
+        entries: (:obj:`np.ndarray`) Whether a trade is opened at each bar.
+        long: (:obj:`np.ndarray`) Whether the trade opened at each bar is long.
+        risk: (:obj:`np.ndarray`) The risk of the trade opened at each bar.
+        win_to_loss_ratio: (:obj:`float`) The win to loss ratio of the exits.
+        capital: (:obj:`float`) The portfolio value that trades are sized against.
+
+    Returns:
+        :obj:`BacktestResult`: The trades and the equity curve.
+    """
+    n = len(bars)
+    open_ = bars["open"].to_numpy(dtype=np.float64)
+    high = bars["high"].to_numpy(dtype=np.float64)
+    low = bars["low"].to_numpy(dtype=np.float64)
+    close = bars["close"].to_numpy(dtype=np.float64)
+    entry_idx = np.flatnonzero(np.asarray(entries, dtype=bool) & (np.asarray(risk) > 0))
+    is_long = np.asarray(long, dtype=bool)[entry_idx]
+    trade_risk = np.asarray(risk, dtype=np.float64)[entry_idx]
+    price = close[entry_idx]
+    buy_stop, buy_profit = get_stop_profit_range(
+        Side.BUY, win_to_loss_ratio, trade_risk, price
+    )
+    sell_stop, sell_profit = get_stop_profit_range(
+        Side.SELL, win_to_loss_ratio, trade_risk, price
+    )
+    stop = np.where(is_long, buy_stop, sell_stop)
+    profit = np.where(is_long, buy_profit, sell_profit)
+    # Long stops and short profits are reached from above by the lows
+    low_level = np.where(is_long, stop, profit)
+    high_level = np.where(is_long, profit, stop)
+    low_hit = first_crossing(low, entry_idx + 1, low_level, above=False)
+    high_hit = first_crossing(high, entry_idx + 1, high_level, above=True)
+    stop_idx = np.where(is_long, low_hit, high_hit)
+    profit_idx = np.where(is_long, high_hit, low_hit)
+    stopped = stop_idx <= profit_idx
+    exit_idx = np.minimum(stop_idx, profit_idx)
+    ended = exit_idx >= n
+    exit_idx = np.minimum(exit_idx, n - 1)
+    level = np.where(stopped, stop, profit)
+    exit_open = open_[exit_idx]
+    exit_price = np.where(
+        stopped == is_long, np.minimum(exit_open, level), np.maximum(exit_open, level)
+    )
+    exit_price = np.where(ended, close[exit_idx], exit_price)
+    size = get_risk_order_size(
+        capital,
+        np.inf,
+        settings.GLOBAL_MAX_RISK_PERC,
+        settings.GLOBAL_MAX_PORTFOLIO_PERC,
+        trade_risk,
+        price,
+    )
+    direction = np.where(is_long, 1.0, -1.0)
+    pnl = size * direction * (exit_price - price)
+    trades = pd.DataFrame(
+        {
+            "entry_time": bars.index[entry_idx],
+            "exit_time": bars.index[exit_idx],
+            "side": np.where(is_long, Side.BUY.value, Side.SELL.value),
+            "size": size,
+            "entry_price": price,
+            "stop_price": stop,
+            "profit_price": profit,
+            "exit_price": exit_price,
+            "exit_reason": np.where(ended, "end", np.where(stopped, "stop", "profit")),
+            "pnl": pnl,
+        }
+    )
+    realized = np.bincount(exit_idx, weights=pnl, minlength=n)
+    equity = pd.Series(capital + np.cumsum(realized), index=bars.index, name="equity")
+    return BacktestResult(trades, equity)
+
+
+def backtest_universe(
+    strategy: "SupertrendStrategy",
+    bars: Dict[str, pd.DataFrame],
+    capital: float = 100000.0,
+    **kwargs,
+) -> BacktestResult:
+    """
+    Backtests strategy over the bars of every symbol. The trades of every symbol are
+    sized against the same capital and the equity curves are added up.
+    """
+    trades, profits = [], []
+    for symbol, symbol_bars in bars.items():
+        result = strategy.backtest(symbol_bars, capital=capital, **kwargs)
+        trades.append(result.trades.assign(symbol=symbol))
+        profits.append((result.equity - capital).rename(symbol))
+    if len(trades) == 0:
+        return BacktestResult(pd.DataFrame(), pd.Series(dtype=float, name="equity"))
+    trades = pd.concat(trades, ignore_index=True).sort_values(
+        ["entry_time", "symbol"], ignore_index=True
+    )
+    profit = pd.concat(profits, axis=1).sort_index().ffill().fillna(0).sum(axis=1)
+    return BacktestResult(trades, (capital + profit).rename("equity"))
@@ -1,30 +1,114 @@
 import asyncio
 import logging
+import time
 from abc import ABC, abstractmethod
 from enum import Enum
+from typing import List, Optional
 
 import pandas as pd
 
+from .. import settings
 from ..asset.base import Asset, TradableAsset
+from ..clock import get_clock
 from ..data.base import AssetListProvider
+from ..settings import DEFAULT_TIMEFRAME as DTF
+from ..utils import close_client
+from .scheduler import BarCloseScheduler, Batch
 
 logger = logging.getLogger(__name__)
 
 
 class Strategy(ABC):
-    def __init__(self, tl_provider: AssetListProvider, freq: str = None):
+    def __init__(
+        self, tl_provider: Optional[AssetListProvider] = None, freq: str = None
+    ):
         self._tl_provider = tl_provider
         self._freq = freq
         self._tasks = []
+        self._scheduler = BarCloseScheduler(freq)
 
     async def run(self):
         assets = await self._tl_provider.list_assets()
         logger.info("Running strategy for %s assets", len(assets))
-        self._tasks = [
-            asyncio.create_task(self.run_for_asset(asset)) for asset in assets
-        ]
+        await self.warm_up(assets)
+        # The assets that are not live subscribe once they are run
+        await asyncio.gather(
+            *[asset.bars.subscribe() for asset in assets if asset.bars.live]
+        )
+        return await self.run_assets(assets)
+
+    async def run_assets(self, assets: List[TradableAsset]):
+        """
+        Dispatches the closed bars of assets that are already being fed with bars.
+        The closed bars of live assets are dispatched in batches at the bucket close
+        times, the others as soon as their bars are added, e.g. the bars of a file.
+        """
+        self._tasks = []
+        for asset in assets:
+            if asset.bars.live:
+                self._scheduler.register(asset)
+            else:
+                self._tasks.append(asyncio.create_task(self.run_for_asset(asset)))
+        if len(self._tasks) < len(assets):
+            self._tasks.append(asyncio.create_task(self._scheduler.run(self._dispatch)))
         return await asyncio.gather(*self._tasks)
 
+    @property
+    def lookback(self) -> int:
+        """
+        Number of bars of freq that the strategy needs before the current one.
+        """
+        return 0
+
+    async def warm_up_asset(self, asset: TradableAsset):
+        """
+        Retrieves the lookback of the last closed bar of asset.
+        """
+        freq = self._freq or DTF
+        now = asset.localize(get_clock().now())
+        start = now.floor(freq) - pd.Timedelta(freq)
+        await asset.bars.get(start, start, self._freq, lag=self.lookback)
+
+    async def warm_up(self, assets: List[TradableAsset]):
+        """
+        Retrieves the history that the strategy needs for every asset, at most
+        ``WARMUP_MAX_CONCURRENCY`` assets at a time, so that it is not retrieved
+        while the first real time bars are processed.
+        """
+        if self.lookback == 0 or len(assets) == 0:
+            return
+        semaphore = asyncio.Semaphore(settings.WARMUP_MAX_CONCURRENCY)
+        started = time.monotonic()
+        step = max(len(assets) // 10, 1)
+        n_done = 0
+
+        async def warm_up_asset(asset: TradableAsset):
+            nonlocal n_done
+            async with semaphore:
+                try:
+                    await self.warm_up_asset(asset)
+                except Exception:
+                    logger.exception("Failed to warm up %s", asset)
+            n_done += 1
+            if n_done % step == 0 or n_done == len(assets):
+                logger.info(
+                    "Warmed up %s/%s assets in %.1fs",
+                    n_done,
+                    len(assets),
+                    time.monotonic() - started,
+                )
+
+        await asyncio.gather(*[warm_up_asset(asset) for asset in assets])
+
+    async def _dispatch(self, batch: Batch):
+        results = await asyncio.gather(
+            *[self.next(asset, last_bar) for asset, last_bar in batch],
+            return_exceptions=True,
+        )
+        for (asset, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                logger.error("Failed to process %s", asset, exc_info=result)
+
     async def stop(self):
         for task in self._tasks:
             task.cancel()
@@ -32,12 +116,18 @@ class Strategy(ABC):
                 await task
             except asyncio.CancelledError:
                 pass
+        await close_client()
 
     async def run_for_asset(self, asset: TradableAsset):
-        while True:
+        # The queue is opened before subscribing, so that no bar is missed
+        queue = asset.bars.open_queue()
+        try:
             await asset.bars.subscribe()
-            last_bar = await asset.bars.wait_for_next(self._freq)
-            await self.next(asset, last_bar)
+            while True:
+                last_bar = await asset.bars.wait_for_next(self._freq, queue)
+                await self.next(asset, last_bar)
+        finally:
+            asset.bars.close_queue(queue)
 
     @abstractmethod
     async def next(self, asset: Asset, last_bar: pd.Series):
@@ -1,6 +1,8 @@
 import math
 from typing import Tuple
 
+import numpy as np
+
 from ..asset.base import TradableAsset
 from ..trading.schemas import Side
 
@@ -15,7 +17,8 @@ def get_risk_order_size(
 ) -> float:
     size = portfolio_perc / 100 * portfolio_value / risk
     max_size = max_portfolio_perc / 100 * portfolio_value / price
-    return min(size, max_size, buying_power)
+    # Works element-wise on arrays for the backtests
+    return np.minimum(np.minimum(size, max_size), buying_power)
 
 
 def get_stop_profit_range(
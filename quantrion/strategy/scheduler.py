@@ -0,0 +1,88 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from .. import settings
+from ..asset.base import TradableAsset
+from ..clock import get_clock
+from ..settings import DEFAULT_TIMEFRAME as DTF
+
+logger = logging.getLogger(__name__)
+
+Batch = List[Tuple[TradableAsset, pd.Series]]
+
+
+class BarCloseScheduler:
+    """
+    Tracks the bucket boundaries of freq with a single timer for every registered
+    asset. Once a bucket is closed and ``BAR_CLOSE_GRACE`` seconds have passed for
+    late bars, the closed bar of every asset that received bars in the bucket is
+    dispatched in one batch.
+    """
+
+    def __init__(self, freq: Optional[str] = None) -> None:
+        self._freq = freq or DTF
+        self._period = pd.Timedelta(self._freq)
+        self._assets: Dict[str, TradableAsset] = {}
+
+    @property
+    def freq(self) -> str:
+        return self._freq
+
+    def register(self, asset: TradableAsset):
+        self._assets[asset.symbol] = asset
+
+    def next_close(self, now: pd.Timestamp) -> pd.Timestamp:
+        """
+        Returns the end of the bucket that contains now.
+        """
+        return now.floor(self._freq) + self._period
+
+    async def _closed_bar(
+        self, asset: TradableAsset, close: pd.Timestamp
+    ) -> Optional[pd.Series]:
+        bars = asset.bars
+        start = asset.localize(close) - self._period
+        store = bars._store
+        if store is None or len(store) == 0 or store.index[-1] < start.value:
+            return None
+        bars.flush_indicators(start + self._period)
+        end = start + self._period - pd.Timedelta(DTF)
+        freq = None if self._freq == DTF else self._freq
+        if bars._retrieved.contains(start, end):
+            # The bucket is aggregated from the stored bars as they are added
+            return bars.get_stored_bar(start, freq)
+        df = await bars.get(start, end, freq=freq)
+        if df.empty:
+            return None
+        return df.iloc[-1]
+
+    async def collect(self, close: pd.Timestamp) -> Batch:
+        """
+        Returns the closed bar of the bucket that ends at close for every asset that
+        has bars in it.
+        """
+        assets = list(self._assets.values())
+        last_bars = await asyncio.gather(
+            *[self._closed_bar(asset, close) for asset in assets]
+        )
+        return [
+            (asset, last_bar)
+            for asset, last_bar in zip(assets, last_bars)
+            if last_bar is not None
+        ]
+
+    async def run(self, dispatch: Callable[[Batch], Awaitable[None]]):
+        grace = pd.Timedelta(seconds=settings.BAR_CLOSE_GRACE)
+        clock = get_clock()
+        close = self.next_close(clock.now())
+        while True:
+            await clock.sleep_until(close + grace)
+            batch = await self.collect(close)
+            logger.debug("Dispatching %s bars closed at %s", len(batch), close)
+            if len(batch) > 0:
+                await dispatch(batch)
+            # Buckets are never skipped, even if dispatching took longer than freq
+            close += pd.Timedelta(self._freq)
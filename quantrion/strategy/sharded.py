@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+
+from .. import settings
+from ..asset.base import TradableAsset
+from ..data.base import AssetListProvider, StaticAssetListProvider
+from ..data.queue import QueuePolicy
+from ..utils import close_client
+from .base import Strategy
+
+logger = logging.getLogger(__name__)
+
+# Bars of one symbol as UTC int64 timestamps, column names and a 2D values array
+Payload = Tuple[str, np.ndarray, List[str], np.ndarray]
+# Class, symbol and the other constructor arguments of an asset
+AssetSpec = Tuple[Type[TradableAsset], str, tuple, Dict[str, Any]]
+
+
+def partition(assets: List[TradableAsset], n: int) -> List[List[TradableAsset]]:
+    """
+    Splits assets in n shards of the same size.
+    """
+    return [assets[i::n] for i in range(n)]
+
+
+def encode_bars(symbol: str, data: pd.DataFrame) -> Payload:
+    return (
+        symbol,
+        data.index.asi8,
+        list(data.columns),
+        data.to_numpy(dtype=np.float64),
+    )
+
+
+def decode_bars(asset: TradableAsset, payload: Payload) -> pd.DataFrame:
+    _, ts, columns, values = payload
+    index = pd.DatetimeIndex(ts, tz="UTC", name="start")
+    return pd.DataFrame(values, index=asset.localize(index), columns=columns)
+
+
+class BarFanOut:
+    """
+    Forwards the bars added to the providers of the parent process to the worker
+    that owns each symbol. The bars added in the same event loop iteration, e.g. the
+    bars of one websocket message, are sent to every worker in a single message.
+
+    Messages are sent by a writer thread per worker, so that a worker that falls
+    behind does not block the event loop. Once maxsize messages are pending for a
+    worker the policy decides what happens, like in :class:`BarQueue`, except that
+    ``BLOCK`` keeps every message instead of waiting.
+    """
+
+    def __init__(
+        self,
+        conns: List[Connection],
+        maxsize: Optional[int] = None,
+        policy: Optional[QueuePolicy] = None,
+    ) -> None:
+        self._conns = conns
+        self._maxsize = maxsize or settings.BAR_QUEUE_SIZE
+        self._policy = QueuePolicy(policy or settings.BAR_QUEUE_POLICY)
+        self._buffers: List[List[Payload]] = [[] for _ in conns]
+        self._listeners: List[Tuple[TradableAsset, Callable]] = []
+        self._handle: Optional[asyncio.Handle] = None
+        self._pending: List[Deque[Optional[List[Payload]]]] = [deque() for _ in conns]
+        self._condition = threading.Condition()
+        self._n_dropped = 0
+        self._writers = [
+            threading.Thread(target=self._write, args=(worker,), daemon=True)
+            for worker in range(len(conns))
+        ]
+        for writer in self._writers:
+            writer.start()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "pending": sum(len(pending) for pending in self._pending),
+                "dropped": self._n_dropped,
+            }
+
+    def attach(self, asset: TradableAsset, worker: int):
+        symbol = asset.symbol
+
+        def listener(data: pd.DataFrame):
+            self._on_bars(worker, symbol, data)
+
+        asset.bars.add_listener(listener)
+        self._listeners.append((asset, listener))
+
+    def _on_bars(self, worker: int, symbol: str, data: pd.DataFrame):
+        self._buffers[worker].append(encode_bars(symbol, data))
+        if self._handle is None:
+            self._handle = asyncio.get_running_loop().call_soon(self.flush)
+
+    def _send(self, worker: int, message: Optional[List[Payload]]):
+        with self._condition:
+            pending = self._pending[worker]
+            if message is not None and len(pending) >= self._maxsize:
+                if self._policy == QueuePolicy.DROP_OLDEST:
+                    pending.popleft()
+                    self._n_dropped += 1
+                elif self._policy == QueuePolicy.COALESCE:
+                    self._n_dropped += len(pending)
+                    pending.clear()
+            pending.append(message)
+            self._condition.notify_all()
+
+    def _write(self, worker: int):
+        conn = self._conns[worker]
+        pending = self._pending[worker]
+        while True:
+            with self._condition:
+                while len(pending) == 0:
+                    self._condition.wait()
+                message = pending.popleft()
+            try:
+                conn.send(message)
+            except (BrokenPipeError, OSError):
+                logger.error("Could not send bars to worker %s", worker)
+            if message is None:
+                conn.close()
+                return
+
+    def flush(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for worker, buffer in enumerate(self._buffers):
+            if len(buffer) > 0:
+                self._send(worker, buffer.copy())
+                buffer.clear()
+
+    def close(self):
+        """
+        Stops forwarding bars. The pending messages are still sent, followed by the
+        end of the channel of every worker.
+        """
+        for asset, listener in self._listeners:
+            asset.bars.remove_listener(listener)
+        self._listeners = []
+        self.flush()
+        for worker in range(len(self._conns)):
+            self._send(worker, None)
+
+    def join(self, timeout: Optional[float] = None):
+        """
+        Waits until the writers are done after :meth:`close`.
+        """
+        for writer in self._writers:
+            writer.join(timeout)
+
+
+async def receive_bars(conn: Connection, assets: Dict[str, TradableAsset]):
+    """
+    Adds the bars received from the parent process to the providers of the worker
+    until the parent closes the channel.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            batch = await loop.run_in_executor(None, conn.recv)
+        except EOFError:
+            return
+        if batch is None:
+            return
+        for payload in batch:
+            if (asset := assets.get(payload[0])) is not None:
+                asset.bars.add(decode_bars(asset, payload))
+
+
+async def _run_shard(
+    strategy_class: Type[Strategy],
+    kwargs: Dict[str, Any],
+    shard: List[AssetSpec],
+    conn: Connection,
+):
+    assets = [
+        asset_class(symbol, *asset_args, **asset_kwargs)
+        for asset_class, symbol, asset_args, asset_kwargs in shard
+    ]
+    strategy = strategy_class(StaticAssetListProvider(assets), **kwargs)
+    logger.info("Worker %s running strategy for %s assets", os.getpid(), len(assets))
+
+    async def run():
+        # Bars keep being received while the history is retrieved
+        await strategy.warm_up(assets)
+        await strategy.run_assets(assets)
+
+    task = asyncio.create_task(run())
+    try:
+        await receive_bars(conn, {asset.symbol: asset for asset in assets})
+    finally:
+        await strategy.stop()
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def _worker_main(
+    strategy_class: Type[Strategy],
+    kwargs: Dict[str, Any],
+    shard: List[AssetSpec],
+    conn: Connection,
+    log_queue: mp.Queue,
+    log_level: int,
+    rate_limit: int,
+):
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(log_level)
+    # Every worker has its own requests scheduler, so they share the rate limit
+    settings.RATE_LIMIT_PER_MINUTE = rate_limit
+    asyncio.run(_run_shard(strategy_class, kwargs, shard, conn))
+
+
+class ShardedStrategyRunner:
+    """
+    Runs a strategy in n_workers processes, each one with its own event loop and a
+    shard of the assets. The parent process owns the real time subscriptions and
+    sends the bars of each asset to its worker through a pipe. Workers retrieve
+    history and place orders on their own, and their logs are handled by the
+    handlers of the parent process.
+    """
+
+    def __init__(
+        self,
+        strategy_class: Type[Strategy],
+        tl_provider: AssetListProvider,
+        n_workers: Optional[int] = None,
+        **kwargs,
+    ) -> None:
+        self._strategy_class = strategy_class
+        self._tl_provider = tl_provider
+        self._n_workers = n_workers or os.cpu_count() or 1
+        self._kwargs = kwargs
+        self._processes: List[mp.Process] = []
+
+    async def run(self):
+        assets = await self._tl_provider.list_assets()
+        n_workers = min(self._n_workers, len(assets))
+        shards = partition(assets, n_workers)
+        ctx = mp.get_context("spawn")
+        root = logging.getLogger()
+        log_queue = ctx.Queue()
+        listener = QueueListener(log_queue, *root.handlers, respect_handler_level=True)
+        listener.start()
+        rate_limit = max(1, settings.RATE_LIMIT_PER_MINUTE // n_workers)
+        conns = []
+        for shard in shards:
+            reader, writer = ctx.Pipe(duplex=False)
+            process = ctx.Process(
+                target=_worker_main,
+                args=(
+                    self._strategy_class,
+                    self._kwargs,
+                    [(type(asset), asset.symbol, *asset.init_args) for asset in shard],
+                    reader,
+                    log_queue,
+                    root.level,
+                    rate_limit,
+                ),
+                daemon=True,
+            )
+            process.start()
+            reader.close()
+            conns.append(writer)
+            self._processes.append(process)
+        logger.info(
+            "Running strategy for %s assets in %s workers", len(assets), n_workers
+        )
+        fan_out = BarFanOut(conns)
+        try:
+            for worker, shard in enumerate(shards):
+                for asset in shard:
+                    fan_out.attach(asset, worker)
+            await asyncio.gather(*[asset.bars.subscribe() for asset in assets])
+            sentinels = [process.sentinel for process in self._processes]
+            await asyncio.get_running_loop().run_in_executor(None, wait, sentinels)
+            for process in self._processes:
+                if process.exitcode:
+                    logger.error(
+                        "Worker %s exited with code %s", process.pid, process.exitcode
+                    )
+        finally:
+            fan_out.close()
+            await asyncio.get_running_loop().run_in_executor(None, fan_out.join, 10)
+            for process in self._processes:
+                process.join(timeout=10)
+                if process.is_alive():
+                    process.terminate()
+            self._processes = []
+            listener.stop()
+            await close_client()
@@ -1,14 +1,17 @@
 import logging
 import math
-from typing import Optional
+from typing import Optional, Tuple
 
 import numpy as np
 import pandas as pd
 
 from ..asset.base import TradableAsset
+from ..asset.restriction import TradingRestriction
 from ..data.base import AssetListProvider
+from ..data.indicators import rolling_mean, seeded_supertrend, true_range
 from ..trading.base import TradingError
 from ..trading.mixins import BasicTradeMixin
+from .backtest import BacktestResult, simulate_oco
 from .base import Strategy
 
 logger = logging.getLogger(__name__)
@@ -17,7 +20,7 @@ logger = logging.getLogger(__name__)
 class SupertrendStrategy(Strategy, BasicTradeMixin):
     def __init__(
         self,
-        tl_provider: AssetListProvider,
+        tl_provider: Optional[AssetListProvider] = None,
         freq: Optional[str] = None,
         short_n: int = 20,
         short_k: float = 3.0,
@@ -36,6 +39,10 @@ class SupertrendStrategy(Strategy, BasicTradeMixin):
         self._risk_multiplier = risk_multiplier
         self._win_to_loss_ratio = win_to_loss_ratio
 
+    @property
+    def lookback(self) -> int:
+        return self._long_n
+
     async def next(
         self,
         asset: TradableAsset,
@@ -59,7 +66,7 @@ class SupertrendStrategy(Strategy, BasicTradeMixin):
         lst = await asset.bars.get_supertrend(
             start, end, self._freq, self._long_n, self._long_k
         )
-        if lst.empty:
+        if st.empty or lst.empty:
             return
         st_bullish = st.iloc[-1]["bullish"]
         lst_bullish = lst.iloc[-1]["bullish"]
@@ -74,3 +81,80 @@ class SupertrendStrategy(Strategy, BasicTradeMixin):
             await self.trade(asset, last_bar["close"], risk, st_bullish)
         except TradingError as e:
             logger.exception(e)
+
+    def entry_signals(
+        self,
+        bars: pd.DataFrame,
+        restriction: Optional[TradingRestriction] = None,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evaluates the entry rules of :meth:`next` over every bar at once. Like the
+        bars of ``get``, bars may include the empty buckets, which count as zero
+        volume in the volume window and are never entered. The ATR and supertrend
+        are computed over the other bars, so they can still differ from :meth:`next`
+        within long_n bars after an empty bucket.
+
+        Args:
+            bars: (:obj:`pd.DataFrame`) The bars of freq.
+            restriction: (:obj:`TradingRestriction`) The bars outside of it are not
+                entered.
+
+        Returns:
+            :obj:`Tuple[np.ndarray, np.ndarray, np.ndarray]`: Whether each bar is
+            entered, whether the trade is long and its risk.
+        """
+        valid = bars["close"].notna().to_numpy()
+        high = bars["high"].to_numpy(dtype=np.float64)[valid]
+        low = bars["low"].to_numpy(dtype=np.float64)[valid]
+        close = bars["close"].to_numpy(dtype=np.float64)[valid]
+        # Like get_supertrend in next, every supertrend is seeded on the previous bar
+        tr = true_range(high, low, close)
+        short_atr = rolling_mean(tr, self._short_n)
+        long_atr = rolling_mean(tr, self._long_n)
+        st, short_bullish = seeded_supertrend(
+            high, low, close, short_atr, self._short_k
+        )
+        lst, long_bullish = seeded_supertrend(high, low, close, long_atr, self._long_k)
+        entries = np.zeros(len(bars), dtype=bool)
+        entries[valid] = (st != 0) & (lst != 0) & (short_bullish == long_bullish)
+        bullish = np.zeros(len(bars), dtype=bool)
+        bullish[valid] = short_bullish
+        atr = np.full(len(bars), np.nan)
+        atr[valid] = long_atr
+        # The volume of each bar is compared with the long_n previous buckets
+        n = self._long_n
+        log_vol = np.log(bars["volume"].to_numpy(dtype=np.float64) + 1e-3)
+        high_volume = np.zeros(len(bars), dtype=bool)
+        if len(bars) > n:
+            windows = np.lib.stride_tricks.sliding_window_view(log_vol[:-1], n)
+            threshold = windows.mean(axis=1) + self._volume_k_std * windows.std(
+                axis=1, ddof=1
+            )
+            high_volume[n:] = log_vol[n:] >= threshold
+        entries &= high_volume
+        if restriction is not None:
+            entries &= restriction.compiled.mask(bars.index)
+        return entries, bullish, self._risk_multiplier * atr
+
+    def backtest(
+        self,
+        bars: pd.DataFrame,
+        restriction: Optional[TradingRestriction] = None,
+        capital: float = 100000.0,
+    ) -> BacktestResult:
+        """
+        Backtests the strategy over bars of freq without going through the event loop.
+        Every entry opens a trade with an OCO exit, like :meth:`next` does. The empty
+        buckets of bars are only used for the volume window of :meth:`entry_signals`.
+        """
+        entries, long, risk = self.entry_signals(bars, restriction)
+        # The empty buckets have no prices to trade at
+        valid = bars["close"].notna().to_numpy()
+        return simulate_oco(
+            bars[valid],
+            entries[valid],
+            long[valid],
+            risk[valid],
+            self._win_to_loss_ratio,
+            capital=capital,
+        )
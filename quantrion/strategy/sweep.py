@@ -0,0 +1,298 @@
+import asyncio
+import gc
+import itertools
+import json
+import logging
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.util import Finalize
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Type, Union
+
+import numpy as np
+import pandas as pd
+
+from ..asset.file import CSVAsset
+from ..asset.restriction import TradingRestriction
+from .backtest import backtest_universe
+from .supertrend import SupertrendStrategy
+
+logger = logging.getLogger(__name__)
+
+Params = Dict[str, Any]
+# Name of the block, symbols, row offsets, column names and timezones
+SharedBarsSpec = Tuple[str, List[str], List[int], List[str], List[Optional[str]]]
+
+
+def parameter_grid(space: Dict[str, Iterable]) -> List[Params]:
+    """
+    Returns every combination of the values of space.
+    """
+    names = list(space.keys())
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*[list(space[name]) for name in names])
+    ]
+
+
+class SharedBars:
+    """
+    Bars of many symbols packed in a single shared memory block, so that every
+    process of a pool reads the same copy. The block holds the int64 UTC nanosecond
+    timestamps of every bar followed by their float64 values, one row per bar.
+    """
+
+    def __init__(self, shm: SharedMemory, spec: SharedBarsSpec) -> None:
+        self._shm = shm
+        self._spec = spec
+
+    @classmethod
+    def create(cls, bars: Dict[str, pd.DataFrame]) -> "SharedBars":
+        symbols = list(bars.keys())
+        columns = list(bars[symbols[0]].columns) if symbols else []
+        for symbol, df in bars.items():
+            if set(df.columns) != set(columns):
+                raise ValueError(
+                    f"The bars of {symbol} have columns {list(df.columns)}, "
+                    f"but the bars of {symbols[0]} have {columns}"
+                )
+        offsets = np.r_[0, np.cumsum([len(df) for df in bars.values()])].tolist()
+        size = offsets[-1] * (1 + len(columns)) * 8
+        shm = SharedMemory(create=True, size=max(size, 1))
+        tzs = [
+            None if df.index.tz is None else str(df.index.tz) for df in bars.values()
+        ]
+        shared = cls(shm, (shm.name, symbols, offsets, columns, tzs))
+        index, values = shared._arrays()
+        for symbol, lo, hi in zip(symbols, offsets[:-1], offsets[1:]):
+            index[lo:hi] = bars[symbol].index.asi8
+            values[lo:hi] = bars[symbol][columns].to_numpy(dtype=np.float64)
+        return shared
+
+    @classmethod
+    def attach(cls, spec: SharedBarsSpec) -> "SharedBars":
+        return cls(SharedMemory(name=spec[0]), spec)
+
+    @property
+    def spec(self) -> SharedBarsSpec:
+        return self._spec
+
+    def _arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        _, _, offsets, columns, _ = self._spec
+        n = offsets[-1]
+        index = np.ndarray((n,), dtype=np.int64, buffer=self._shm.buf)
+        values = np.ndarray(
+            (n, len(columns)), dtype=np.float64, buffer=self._shm.buf, offset=n * 8
+        )
+        return index, values
+
+    def frames(self) -> Dict[str, pd.DataFrame]:
+        """
+        Returns the bars of every symbol as read only DataFrames backed by the shared
+        block, without copying the data.
+        """
+        _, symbols, offsets, columns, tzs = self._spec
+        index, values = self._arrays()
+        index.flags.writeable = False
+        values.flags.writeable = False
+        frames = {}
+        for symbol, lo, hi, tz in zip(symbols, offsets[:-1], offsets[1:], tzs):
+            symbol_index = pd.DatetimeIndex(index[lo:hi].view("M8[ns]"), name="start")
+            if tz is not None:
+                symbol_index = symbol_index.tz_localize("UTC").tz_convert(tz)
+            frames[symbol] = pd.DataFrame(
+                values[lo:hi], index=symbol_index, columns=columns, copy=False
+            )
+        return frames
+
+    def close(self):
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class ResultsStore:
+    """
+    Results of a sweep as a JSON lines file with the parameters and the backtest
+    stats of one trial per line. Every result is written as soon as it is known, so
+    that an interrupted sweep can be resumed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+
+    @staticmethod
+    def key(params: Params) -> Tuple:
+        return tuple(sorted(params.items()))
+
+    @staticmethod
+    def _json_value(value: Any) -> Any:
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+        value = float(value)
+        # NaN is not valid JSON
+        return None if np.isnan(value) else value
+
+    def append(self, params: Params, stats: Dict[str, float]):
+        record = {
+            **params,
+            **{name: self._json_value(value) for name, value in stats.items()},
+        }
+        with open(self._path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def load(self) -> pd.DataFrame:
+        if not os.path.exists(self._path) or os.path.getsize(self._path) == 0:
+            return pd.DataFrame()
+        return pd.read_json(self._path, lines=True)
+
+    def completed(self, names: Iterable[str]) -> Set[Tuple]:
+        """
+        Returns the keys of the trials already in the store.
+        """
+        df = self.load()
+        names = list(names)
+        if df.empty or any(name not in df.columns for name in names):
+            return set()
+        return {self.key(record) for record in df[names].to_dict("records")}
+
+
+# Set in every worker of the pool by _init_worker
+_shared: Optional[SharedBars] = None
+_bars: Dict[str, pd.DataFrame] = {}
+
+
+def _init_worker(spec: SharedBarsSpec):
+    global _shared, _bars
+    _shared = SharedBars.attach(spec)
+    _bars = _shared.frames()
+    # Pool workers exit without running atexit, but with the finalizers
+    Finalize(None, _close_worker, exitpriority=10)
+
+
+def _close_worker():
+    global _shared, _bars
+    # The frames are views of the block, which can not be closed while they exist
+    _bars = {}
+    gc.collect()
+    if _shared is not None:
+        _shared.close()
+        _shared = None
+
+
+def _run_trial(
+    strategy_class: Type[SupertrendStrategy],
+    freq: Optional[str],
+    params: Params,
+    restriction: Optional[TradingRestriction],
+    capital: float,
+) -> Dict[str, float]:
+    # The assets are not listed by backtests
+    strategy = strategy_class(freq=freq, **params)
+    return backtest_universe(
+        strategy, _bars, capital=capital, restriction=restriction
+    ).stats
+
+
+class ParameterSweep:
+    """
+    Backtests a strategy over the bars of many CSV assets for every parameter set of
+    a space, in a pool of n_workers processes. The bars are aggregated to freq and
+    loaded once in shared memory, and the stats of every trial are appended to the
+    :class:`ResultsStore` at results_path as soon as they are known. Trials already
+    in the store are skipped. The strategy is backtested with its ``backtest``
+    method, like :class:`SupertrendStrategy`.
+    """
+
+    def __init__(
+        self,
+        strategy_class: Type[SupertrendStrategy],
+        assets: List[CSVAsset],
+        space: Union[Dict[str, Iterable], List[Params]],
+        results_path: str,
+        freq: Optional[str] = None,
+        start: Optional[pd.Timestamp] = None,
+        end: Optional[pd.Timestamp] = None,
+        restriction: Optional[TradingRestriction] = None,
+        capital: float = 100000.0,
+        n_workers: Optional[int] = None,
+    ) -> None:
+        if not callable(getattr(strategy_class, "backtest", None)):
+            raise TypeError(f"{strategy_class.__name__} can not be backtested")
+        self._strategy_class = strategy_class
+        self._assets = assets
+        self._trials = parameter_grid(space) if isinstance(space, dict) else space
+        self._store = ResultsStore(results_path)
+        self._freq = freq
+        self._start = start
+        self._end = end
+        self._restriction = restriction
+        self._capital = capital
+        self._n_workers = n_workers or os.cpu_count() or 1
+
+    @property
+    def store(self) -> ResultsStore:
+        return self._store
+
+    def _load_bars(self) -> Dict[str, pd.DataFrame]:
+        # The empty buckets are kept, like in get, for the volume window of the entries
+        return {
+            asset.symbol: asset.bars.history(self._freq).loc[self._start : self._end]
+            for asset in self._assets
+        }
+
+    async def run(self) -> pd.DataFrame:
+        """
+        Runs the pending trials and returns every result of the store.
+        """
+        names = {name for params in self._trials for name in params.keys()}
+        completed = self._store.completed(names)
+        trials = [p for p in self._trials if self._store.key(p) not in completed]
+        logger.info(
+            "Running %s trials, %s already completed",
+            len(trials),
+            len(self._trials) - len(trials),
+        )
+        if len(trials) == 0:
+            return self._store.load()
+        shared = SharedBars.create(self._load_bars())
+        loop = asyncio.get_running_loop()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=min(self._n_workers, len(trials)),
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(shared.spec,),
+            ) as pool:
+
+                async def trial(
+                    params: Params,
+                ) -> Tuple[Params, Optional[Dict[str, float]]]:
+                    try:
+                        stats = await loop.run_in_executor(
+                            pool,
+                            _run_trial,
+                            self._strategy_class,
+                            self._freq,
+                            params,
+                            self._restriction,
+                            self._capital,
+                        )
+                    except Exception:
+                        logger.exception("Trial %s failed", params)
+                        return params, None
+                    return params, stats
+
+                coros = asyncio.as_completed([trial(params) for params in trials])
+                for i, coro in enumerate(coros, start=1):
+                    params, stats = await coro
+                    if stats is not None:
+                        self._store.append(params, stats)
+                    if i % max(1, len(trials) // 10) == 0:
+                        logger.info("Completed %s/%s trials", i, len(trials))
+        finally:
+            shared.close()
+            shared.unlink()
+        return self._store.load()
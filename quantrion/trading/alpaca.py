@@ -9,7 +9,13 @@ import httpx
 import websockets
 
 from .. import settings
-from ..utils import MaxRetryError, SingletonMeta, retry_request
+from ..utils import (
+    MaxRetryError,
+    RequestPriority,
+    SingletonMeta,
+    get_client,
+    retry_request,
+)
 from .base import CancelOrderError, OrderNotExecuted, TradingError, TradingProvider
 from .schemas import Account, Order, OrderType, Side, Status, TimeInForce
 
@@ -132,36 +138,40 @@ class AlpacaTradingProvider(TradingProvider):
     async def _request(
         self, method: str, path: str, json: Optional[dict] = None
     ) -> httpx.Response:
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "APCA-API-KEY-ID": settings.ALPACA_API_KEY_ID,
-                "APCA-API-SECRET-KEY": settings.ALPACA_API_KEY_SECRET,
-            }
-            url = urljoin(settings.ALPACA_TRADING_URL, path)
-            response = await retry_request(
-                client, method, url, json=json, headers=headers
-            )
-            return response
+        client = get_client()
+        headers = {
+            "APCA-API-KEY-ID": settings.ALPACA_API_KEY_ID,
+            "APCA-API-SECRET-KEY": settings.ALPACA_API_KEY_SECRET,
+        }
+        url = urljoin(settings.ALPACA_TRADING_URL, path)
+        response = await retry_request(
+            client,
+            method,
+            url,
+            json=json,
+            headers=headers,
+            priority=RequestPriority.TRADING,
+        )
+        return response
 
     def update_order(self, order_id: str, order: Order):
         self._id_to_order[order_id] = order
 
     async def _get_stop_order_from_oco(self, oco_order: Order) -> Order:
-        async with httpx.AsyncClient() as client:
-            response = await retry_request(
-                client,
-                "GET",
-                urljoin(settings.ALPACA_TRADING_URL, f"v2/orders"),
-                params={"nested": True, "symbols": oco_order.symbol},
-            )
-            response.raise_for_status()
-            data = response.json()
-            for order in data:
-                if order["id"] == oco_order.id:
-                    return _data_to_order(
-                        order["legs"][0], oco_order.type, oco_order.price
-                    )
-            raise TradingError("Failed to get stop order from OCO order")
+        client = get_client()
+        response = await retry_request(
+            client,
+            "GET",
+            urljoin(settings.ALPACA_TRADING_URL, f"v2/orders"),
+            params={"nested": True, "symbols": oco_order.symbol},
+            priority=RequestPriority.TRADING,
+        )
+        response.raise_for_status()
+        data = response.json()
+        for order in data:
+            if order["id"] == oco_order.id:
+                return _data_to_order(order["legs"][0], oco_order.type, oco_order.price)
+        raise TradingError("Failed to get stop order from OCO order")
 
     async def create_order(
         self,
@@ -1,7 +1,15 @@
 import asyncio
+import heapq
+import importlib.util
+import itertools
 import logging
+import time
 import traceback
+import weakref
 from abc import ABCMeta
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Dict, List, Optional
 
 import httpx
 from httpx import RequestError
@@ -17,15 +25,63 @@ class MaxRetryError(Exception):
 
 RETRIABLE_STATUS = [429, 500, 502, 503, 504]
 
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
 
-async def retry_request(client: httpx.AsyncClient, *args, **kwargs) -> httpx.Response:
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Returns the HTTP client shared by every component running in the current event
+    loop. The client keeps a pool of keep-alive connections, so that consecutive
+    requests to the same host skip the TCP and TLS handshakes.
+
+    Returns:
+        :obj:`httpx.AsyncClient`: The shared client.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        http2 = settings.HTTP2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requires the h2 package, falling back to HTTP/1.1")
+            http2 = False
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        client = httpx.AsyncClient(limits=limits, http2=http2)
+        _clients[loop] = client
+    return client
+
+
+async def close_client():
+    """
+    Closes the shared HTTP client of the current event loop, if any.
+    """
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def retry_request(
+    client: Optional[httpx.AsyncClient],
+    *args,
+    priority: Optional["RequestPriority"] = None,
+    **kwargs,
+) -> httpx.Response:
     """
     Auxiliary function to retry a request if the status code is in the list of retryable status codes.
 
     Args:
-        client: (:obj:`httpx.AsyncClient`) The client to use for the request.
-        *args: The arguments to pass to the request.
-        **kwargs: The keyword arguments to pass to the request.
+        client: (:obj:`httpx.AsyncClient`) The client to use for the request. The
+            shared client of :func:`get_client` is used if None.
+        *args: The arguments to pass to :meth:`httpx.AsyncClient.build_request`.
+        priority: (:obj:`RequestPriority`) The priority of the request in the
+            :class:`RequestScheduler` queue. Defaults to ``RequestPriority.DATA``.
+        **kwargs: The keyword arguments to pass to the request. The request is built
+            once and sent again on retries, its host selects the rate limit bucket.
 
     Returns:
         :obj:`httpx.Response`: The response of the request.
@@ -33,11 +89,24 @@ async def retry_request(client: httpx.AsyncClient, *args, **kwargs) -> httpx.Res
     Raises:
         :obj:`MaxRetryError`: If the maximum number of retries is reached.
     """
+    if client is None:
+        client = get_client()
+    if priority is None:
+        priority = RequestPriority.DATA
+    scheduler = RequestScheduler()
+    # The options of send are not accepted by build_request
+    send_kwargs = {
+        key: kwargs.pop(key) for key in ("auth", "follow_redirects") if key in kwargs
+    }
+    request = client.build_request(*args, **kwargs)
+    host = request.url.host
     retry_count = 0
     response = None
     while retry_count <= settings.MAX_RETRIES:
+        await scheduler.acquire(priority, host)
         try:
-            response = await client.request(*args, **kwargs)
+            response = await client.send(request, **send_kwargs)
+            scheduler.observe(response)
             if (
                 200 <= response.status_code < 300
             ) or response.status_code not in RETRIABLE_STATUS:
@@ -46,7 +115,10 @@ async def retry_request(client: httpx.AsyncClient, *args, **kwargs) -> httpx.Res
             if retry_count == settings.MAX_RETRIES:
                 logger.error(f"RequestError: {traceback.format_exc()}")
                 break
-        await asyncio.sleep(0.1 * 2**retry_count)
+        finally:
+            scheduler.release()
+        if not scheduler.blocked(host):
+            await asyncio.sleep(0.1 * 2**retry_count)
         retry_count += 1
     if response is not None:
         logger.error(
@@ -62,3 +134,160 @@ class SingletonMeta(ABCMeta):
         if cls not in cls._instances:
             cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
+
+
+class RequestPriority(IntEnum):
+    TRADING = 0
+    DATA = 1
+
+
+class TokenBucket:
+    """
+    Rate limit state of one host: a token bucket that follows the ``X-RateLimit-*``
+    headers of its responses and the queue of the requests waiting for it.
+    """
+
+    def __init__(self, capacity: float) -> None:
+        self.capacity = capacity
+        self.rate = capacity / 60
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.queue: List[list] = []
+
+    @property
+    def blocked(self) -> bool:
+        return self.blocked_until > time.monotonic()
+
+    def refill(self, now: float):
+        elapsed = now - self.updated
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        now = time.monotonic()
+        self.refill(now)
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def wake_head(self):
+        if len(self.queue) > 0 and not self.queue[0][2].done():
+            self.queue[0][2].set_result(None)
+
+    def observe(self, headers: httpx.Headers):
+        now = time.monotonic()
+        self.refill(now)
+        if (limit := headers.get("X-RateLimit-Limit")) is not None:
+            self.capacity = float(limit)
+            self.rate = self.capacity / 60
+        if (remaining := headers.get("X-RateLimit-Remaining")) is not None:
+            self.tokens = min(self.tokens, float(remaining))
+            reset = headers.get("X-RateLimit-Reset")
+            if float(remaining) < 1 and reset is not None:
+                self.block(now, float(reset) - time.time())
+        if (retry_after := headers.get("Retry-After")) is not None:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            self.block(now, delay)
+
+    def block(self, now: float, delay: float):
+        if delay > 0:
+            self.blocked_until = max(self.blocked_until, now + delay)
+
+
+class RequestScheduler(metaclass=SingletonMeta):
+    """
+    Process-wide scheduler that every request of :func:`retry_request` goes through.
+    Every host has its own :class:`TokenBucket`, since e.g. the trading and the data
+    APIs have separate limits, and requests to a host stop while a ``Retry-After`` or
+    an exhausted limit of that host is pending. Waiting requests are served by
+    priority, then in arrival order.
+    """
+
+    def __init__(self) -> None:
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._n_requests = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def bucket(self, host: str = "") -> TokenBucket:
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(float(settings.RATE_LIMIT_PER_MINUTE))
+        return self._buckets[host]
+
+    def blocked(self, host: str = "") -> bool:
+        return host in self._buckets and self._buckets[host].blocked
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the number of waiting and in flight requests and the wait times, in
+        seconds, of the requests that were sent.
+        """
+        return {
+            "queue_depth": sum(len(b.queue) for b in self._buckets.values()),
+            "in_flight": self._in_flight,
+            "requests": self._n_requests,
+            "total_wait": self._total_wait,
+            "mean_wait": self._total_wait / max(self._n_requests, 1),
+            "max_wait": self._max_wait,
+        }
+
+    async def acquire(
+        self, priority: RequestPriority = RequestPriority.DATA, host: str = ""
+    ):
+        """
+        Waits until the request can be sent to host and takes a token from its bucket.
+        """
+        bucket = self.bucket(host)
+        queue = bucket.queue
+        loop = asyncio.get_running_loop()
+        enqueued = time.monotonic()
+        entry = [int(priority), next(self._seq), loop.create_future()]
+        heapq.heappush(queue, entry)
+        try:
+            while True:
+                if queue[0] is entry:
+                    delay = bucket.delay()
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                else:
+                    entry[2] = loop.create_future()
+                    await entry[2]
+        except asyncio.CancelledError:
+            queue.remove(entry)
+            heapq.heapify(queue)
+            bucket.wake_head()
+            raise
+        heapq.heappop(queue)
+        bucket.tokens -= 1
+        self._in_flight += 1
+        wait = time.monotonic() - enqueued
+        self._n_requests += 1
+        self._total_wait += wait
+        self._max_wait = max(self._max_wait, wait)
+        if wait > 1:
+            logger.debug(
+                "Request to %s waited %.2fs for the rate limit, %s requests queued",
+                host,
+                wait,
+                len(queue),
+            )
+        bucket.wake_head()
+
+    def release(self):
+        self._in_flight -= 1
+
+    def observe(self, response: httpx.Response):
+        """
+        Updates the bucket of the host of a response from its rate limit headers.
+        """
+        self.bucket(response.request.url.host).observe(response.headers)
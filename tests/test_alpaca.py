@@ -1,16 +1,35 @@
 import asyncio
+import json
+import time
 from random import random
 from typing import Callable, Optional
+from unittest.mock import patch
 from urllib.parse import urlencode, urljoin
 
+import httpx
 import pandas as pd
+import pytest
 import pytz
 from httpx import RequestError
 from pytest_httpx import HTTPXMock
 
 from quantrion import settings
 from quantrion.asset.alpaca import AlpacaUSStock
-from quantrion.data.alpaca import BAR_FIELDS_TO_NAMES, AlpacaUSStockWebSocket
+from quantrion.data.alpaca import (
+    BAR_FIELDS_TO_NAMES,
+    AlpacaBarsBatcher,
+    AlpacaUSStockBarsProvider,
+    AlpacaUSStockWebSocket,
+    _data_to_df,
+)
+from quantrion.utils import (
+    RequestPriority,
+    RequestScheduler,
+    SingletonMeta,
+    close_client,
+    get_client,
+    retry_request,
+)
 
 
 def normalize_start_end(
@@ -126,16 +145,27 @@ async def test_get_bars_update(httpx_mock: HTTPXMock):
         },
     )
     result = await stock.bars.get(start1, end1)
-    url = get_bars_url(
-        "AAPL", result.index[-1] + pd.Timedelta(settings.DEFAULT_TIMEFRAME)
-    )
-    bars2 = generate_bars(result.index[-1] + pd.Timedelta(settings.DEFAULT_TIMEFRAME))
+    url = get_bars_url("AAPL", start2)
+    bars2 = generate_bars(start2)
     httpx_mock.add_response(
         url=url,
         json={
             "bars": bars2,
         },
     )
+    # Only the gap between both requests is retrieved afterwards
+    gap_start = result.index[-1] + pd.Timedelta(settings.DEFAULT_TIMEFRAME)
+    gap_end = start2.ceil(settings.DEFAULT_TIMEFRAME) - pd.Timedelta(
+        settings.DEFAULT_TIMEFRAME
+    )
+    url = get_bars_url("AAPL", gap_start, gap_end)
+    bars3 = generate_bars(gap_start, gap_end)
+    httpx_mock.add_response(
+        url=url,
+        json={
+            "bars": bars3,
+        },
+    )
     await stock.bars.get(start1, end1)
     await stock.bars.get(start2)
     actual_bars = await stock.bars.get(end1, start2)
@@ -280,3 +310,232 @@ async def test_subscribe_bars(start_ws_server: Callable):
         await ws._task
     except asyncio.CancelledError:
         pass
+
+
+async def test_get_bars_disk_cache(httpx_mock: HTTPXMock, tmp_path):
+    stock = AlpacaUSStock("AAPL")
+    now = stock.localize(pd.Timestamp.utcnow())
+    start = now - pd.Timedelta("3d")
+    end = now - pd.Timedelta("2d")
+    day_start = start.normalize()
+    day_end = end.normalize() + pd.Timedelta("1d") - pd.Timedelta("1min")
+    bars = generate_bars(day_start, day_end)
+    httpx_mock.add_response(
+        url=get_bars_url("AAPL", day_start, day_end),
+        json={
+            "bars": bars,
+        },
+    )
+    with patch("quantrion.settings.BARS_CACHE_DIR", str(tmp_path)):
+        expected = await stock.bars.get(start, end)
+        # A new provider is served from disk without requests
+        actual = await AlpacaUSStockBarsProvider(stock).get(start, end)
+    assert len(list(tmp_path.glob("AAPL/1min/all/*.npz"))) == 2
+    assert expected.shape[0] == 24 * 60
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+
+async def test_get_bars_chunked(httpx_mock: HTTPXMock):
+    stock = AlpacaUSStock("AAPL")
+    now = stock.localize(pd.Timestamp.utcnow())
+    start, end = normalize_start_end(now - pd.Timedelta("2d12h"))
+    expected_bars = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(
+            chunk_start + pd.Timedelta("1d") - pd.Timedelta(settings.DEFAULT_TIMEFRAME),
+            end,
+        )
+        chunk_bars = generate_bars(chunk_start, chunk_end)
+        httpx_mock.add_response(
+            url=get_bars_url("AAPL", chunk_start, chunk_end),
+            json={
+                "bars": chunk_bars,
+            },
+        )
+        expected_bars.extend(chunk_bars)
+        chunk_start += pd.Timedelta("1d")
+    with patch("quantrion.settings.RETRIEVE_CHUNK_SIZE", "1d"), patch(
+        "quantrion.settings.RETRIEVE_MAX_CONCURRENCY", 2
+    ):
+        bars = await stock.bars.get(now - pd.Timedelta("2d12h"))
+    assert len(httpx_mock.get_requests()) == 3
+    expected_bars = [
+        {BAR_FIELDS_TO_NAMES[key]: value for key, value in bar.items() if key != "t"}
+        for bar in expected_bars
+    ]
+    assert bars.to_dict("records") == expected_bars
+
+
+async def test_get_bars_batched(httpx_mock: HTTPXMock):
+    stocks = [AlpacaUSStock("AAPL"), AlpacaUSStock("MSFT")]
+    now = stocks[0].localize(pd.Timestamp.utcnow())
+    start, end = normalize_start_end(now - pd.Timedelta("3h"))
+    bars = {stock.symbol: generate_bars(start, end) for stock in stocks}
+    params = {
+        "symbols": "AAPL,MSFT",
+        "timeframe": settings.DEFAULT_TIMEFRAME,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "adjustment": "all",
+    }
+    url = urljoin(settings.ALPACA_DATA_URL, "/v2/stocks/bars")
+    httpx_mock.add_response(
+        url=f"{url}?{urlencode(params)}",
+        json={
+            "bars": {"AAPL": bars["AAPL"][:60], "MSFT": bars["MSFT"]},
+            "next_page_token": "token",
+        },
+    )
+    httpx_mock.add_response(
+        url=f"{url}?{urlencode({**params, 'page_token': 'token'})}",
+        json={"bars": {"AAPL": bars["AAPL"][60:]}, "next_page_token": None},
+    )
+    with patch("quantrion.settings.RETRIEVE_BATCH_WINDOW", 0.01):
+        results = await asyncio.gather(
+            *[stock.bars.get(now - pd.Timedelta("3h")) for stock in stocks]
+        )
+    assert len(httpx_mock.get_requests()) == 2
+    for stock, result in zip(stocks, results):
+        expected_bars = [
+            {
+                BAR_FIELDS_TO_NAMES[key]: value
+                for key, value in bar.items()
+                if key != "t"
+            }
+            for bar in bars[stock.symbol]
+        ]
+        assert result.to_dict("records") == expected_bars
+
+
+async def test_cancelled_batch_fails_retrievals():
+    stock = AlpacaUSStock("AAPL")
+    start, end = normalize_start_end(
+        stock.localize(pd.Timestamp.utcnow()) - pd.Timedelta("1h")
+    )
+    batcher = AlpacaBarsBatcher()
+    with patch("quantrion.settings.RETRIEVE_BATCH_WINDOW", 10):
+        retrieval = asyncio.create_task(batcher.retrieve(stock.bars, start, end))
+        await asyncio.sleep(0)
+        for task in list(batcher._tasks):
+            task.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(retrieval, timeout=1)
+    assert len(batcher._pending) == 0
+
+
+async def test_shared_client(httpx_mock: HTTPXMock):
+    stocks = [AlpacaUSStock("AAPL"), AlpacaUSStock("MSFT")]
+    start = stocks[0].localize(pd.Timestamp.utcnow()) - pd.Timedelta("2h")
+    for stock in stocks:
+        httpx_mock.add_response(
+            url=get_bars_url(stock.symbol, start), json={"bars": []}
+        )
+    client = get_client()
+    for stock in stocks:
+        await stock.bars.get(start)
+    assert len(httpx_mock.get_requests()) == 2
+    assert get_client() is client
+    assert not client.is_closed
+    await close_client()
+    assert client.is_closed
+    assert get_client() is not client
+    await close_client()
+
+
+@pytest.fixture
+def scheduler():
+    SingletonMeta._instances.pop(RequestScheduler, None)
+    with patch("quantrion.settings.RATE_LIMIT_PER_MINUTE", 600):
+        yield RequestScheduler()
+    SingletonMeta._instances.pop(RequestScheduler, None)
+
+
+async def test_scheduler_priority(scheduler: RequestScheduler):
+    scheduler.bucket().tokens = 0
+    order = []
+
+    async def request(name: str, priority: RequestPriority):
+        await scheduler.acquire(priority)
+        order.append(name)
+        scheduler.release()
+
+    tasks = [asyncio.create_task(request("data_1", RequestPriority.DATA))]
+    tasks.append(asyncio.create_task(request("data_2", RequestPriority.DATA)))
+    await asyncio.sleep(0.01)
+    tasks.append(asyncio.create_task(request("trading", RequestPriority.TRADING)))
+    await asyncio.gather(*tasks)
+    assert order == ["trading", "data_1", "data_2"]
+    assert scheduler.stats["queue_depth"] == 0
+    assert scheduler.stats["in_flight"] == 0
+    assert scheduler.stats["requests"] == 3
+    assert scheduler.stats["max_wait"] > 0.1
+
+
+async def test_scheduler_retry_after(
+    httpx_mock: HTTPXMock, scheduler: RequestScheduler
+):
+    url = urljoin(settings.ALPACA_DATA_URL, "/v2/stocks/AAPL/bars")
+    httpx_mock.add_response(url=url, status_code=429, headers={"Retry-After": "0.3"})
+    httpx_mock.add_response(
+        url=url,
+        json={},
+        headers={"X-RateLimit-Limit": "120", "X-RateLimit-Remaining": "10"},
+    )
+    start = time.monotonic()
+    response = await retry_request(None, "get", url)
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.3
+    bucket = scheduler.bucket(httpx.URL(url).host)
+    assert bucket.capacity == 120
+    assert bucket.tokens <= 10
+    await close_client()
+
+
+async def test_scheduler_buckets_per_host(
+    httpx_mock: HTTPXMock, scheduler: RequestScheduler
+):
+    data_url = urljoin(settings.ALPACA_DATA_URL, "/v2/stocks/AAPL/bars")
+    trading_url = "https://trading.example.com/v2/orders"
+    httpx_mock.add_response(
+        url=data_url,
+        json={},
+        headers={"X-RateLimit-Limit": "1000", "X-RateLimit-Remaining": "0"},
+    )
+    httpx_mock.add_response(
+        url=trading_url,
+        json={},
+        headers={"X-RateLimit-Limit": "200", "X-RateLimit-Remaining": "150"},
+    )
+    await retry_request(None, "get", data_url)
+    await retry_request(None, method="get", url=trading_url)
+    data_bucket = scheduler.bucket(httpx.URL(data_url).host)
+    trading_bucket = scheduler.bucket("trading.example.com")
+    assert data_bucket.capacity == 1000 and data_bucket.tokens < 1
+    assert trading_bucket.capacity == 200 and trading_bucket.tokens >= 149
+    # The exhausted data limit does not delay trading requests
+    assert trading_bucket.delay() == 0
+    await close_client()
+
+
+def test_websocket_decodes_batches():
+    stocks = [AlpacaUSStock("AAPL"), AlpacaUSStock("MSFT")]
+    now = stocks[0].localize(pd.Timestamp.utcnow())
+    start = now - pd.Timedelta("3min")
+    bars = {stock.symbol: generate_bars(start) for stock in stocks}
+    messages = [{"T": "success", "msg": "connected"}]
+    for aapl_bar, msft_bar in zip(bars["AAPL"], bars["MSFT"]):
+        messages += [{"T": "b", "S": "AAPL", **aapl_bar}]
+        messages += [{"T": "b", "S": "MSFT", **msft_bar}]
+    messages += [{"T": "b", "S": "TSLA", **bars["AAPL"][0]}]
+    ws = AlpacaUSStockWebSocket()
+    with patch.dict(ws._symbol_to_provider, {s.symbol: s.bars for s in stocks}):
+        ws._on_message(json.dumps(messages))
+    for stock in stocks:
+        expected = _data_to_df(bars[stock.symbol], BAR_FIELDS_TO_NAMES, stock)
+        pd.testing.assert_frame_equal(
+            stock.bars._bars,
+            expected[stock.bars._bars.columns],
+            check_dtype=False,
+            check_freq=False,
+        )
@@ -1,4 +1,14 @@
+import asyncio
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from quantrion.asset.alpaca import AlpacaUSStock
 from quantrion.asset.base import Asset, TradableAsset
+from quantrion.asset.calendar import NYSE_CALENDAR
+from quantrion.asset.file import CSVProvider, CSVUSStock
+from quantrion.asset.restriction import ComposedRestriction, TimeRestriction
 
 
 def test_asset_cached_per_subclass():
@@ -13,3 +23,138 @@ def test_asset_cached_per_subclass():
     b = B("AAPL")
     assert a is a2
     assert a is not b
+    assert a.init_args == ((), {})
+
+
+def test_asset_init_args(tmp_path):
+    path = tmp_path / "ARGS.csv"
+    path.write_text("start,close\n2022-08-01T13:30:00Z,1.0\n")
+    stock = CSVUSStock("ARGS", path=str(path))
+    # The sharded runner creates the assets again in its workers with these
+    assert stock.init_args == ((), {"path": str(path)})
+    args, kwargs = stock.init_args
+    assert type(stock)(stock.symbol, *args, **kwargs) is stock
+
+
+def test_csv_provider_memory_maps_bars(tmp_path):
+    index = pd.date_range("2022-08-01 13:30", periods=100, freq="1min", tz="UTC")
+    bars = pd.DataFrame(
+        {
+            "start": index.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "open": np.arange(100.0),
+            "close": np.arange(100.0) + 0.5,
+            "volume": np.arange(100),
+        }
+    )
+    path = tmp_path / "AAPL.csv"
+    bars.to_csv(path, index=False)
+    stock = CSVUSStock("AAPL", str(path))
+    df = stock.bars._df
+    assert (tmp_path / "AAPL.bars" / "values.npy").exists()
+    assert str(df.index.tz) == "US/Eastern"
+    assert (df.index == index).all()
+    assert df.columns.tolist() == ["open", "close", "volume"]
+    assert (df["close"].to_numpy() == bars["close"].to_numpy()).all()
+    # The bars are a read only view of the memory mapped file
+    assert not df.to_numpy().flags.writeable
+
+    # A second provider opens the converted file instead of parsing the CSV
+    with patch("pandas.read_csv") as read_csv:
+        CSVProvider(stock, str(path))
+    read_csv.assert_not_called()
+
+
+def test_nyse_calendar():
+    tz = "US/Eastern"
+    calendar = NYSE_CALENDAR
+    assert not calendar.is_open(pd.Timestamp("2023-07-04 12:00", tz=tz))
+    assert not calendar.is_open(pd.Timestamp("2023-04-07 12:00", tz=tz))
+    assert not calendar.is_open(pd.Timestamp("2023-07-08 12:00", tz=tz))
+    assert calendar.session(pd.Timestamp("2023-07-03 12:00", tz=tz)) == (
+        pd.Timestamp("2023-07-03 09:30", tz=tz),
+        pd.Timestamp("2023-07-03 13:00", tz=tz),
+    )
+    at = pd.Timestamp("2023-07-05 09:35", tz=tz)
+    assert calendar.minutes_before(at, 5) == pd.Timestamp("2023-07-05 09:30", tz=tz)
+    # July 4th is a holiday and July 3rd closes early
+    assert calendar.minutes_before(at, 6) == pd.Timestamp("2023-07-03 12:59", tz=tz)
+    assert calendar.minutes_before(at, 5 + 210 + 390) == pd.Timestamp(
+        "2023-06-30 09:30", tz=tz
+    )
+    assert calendar.sessions_before(at, 2) == pd.Timestamp("2023-06-30", tz=tz)
+    # New Year's Day on a Saturday is not observed, on a Sunday it is on Monday
+    assert calendar.is_open(pd.Timestamp("2021-12-31 12:00", tz=tz))
+    assert not calendar.is_open(pd.Timestamp("2023-01-02 12:00", tz=tz))
+
+
+def test_required_start_uses_calendar():
+    stock = AlpacaUSStock("SPY")
+    start = pd.Timestamp("2023-07-05 09:45", tz="US/Eastern")
+    required_start, _ = stock.bars._get_required_start_end(start, freq="5min", n=20)
+    assert required_start == pd.Timestamp("2023-07-03 11:35", tz="US/Eastern")
+    required_start, _ = stock.bars._get_required_start_end(start, freq="1d", n=3)
+    # The start is ceiled to 2023-07-06, which is three sessions after 2023-06-30
+    assert required_start == pd.Timestamp("2023-06-30", tz="US/Eastern")
+
+
+def test_us_stock_restriction():
+    tz = "US/Eastern"
+    restriction = AlpacaUSStock("SPY").restriction
+    index = pd.date_range("2023-06-26", "2023-07-10", freq="1min", tz=tz)
+    df = pd.DataFrame({"close": np.arange(len(index))}, index=index)
+    filtered = restriction.filter(df)
+    assert len(filtered) == 9 * 391
+    assert set(filtered.index.date) == set(
+        pd.bdate_range("2023-06-26", "2023-07-07").drop(pd.Timestamp("2023-07-04")).date
+    )
+    assert (filtered.index.time >= pd.Timestamp("09:30").time()).all()
+    assert (filtered.index.time <= pd.Timestamp("16:00").time()).all()
+    for ts in index[::97]:
+        assert restriction.is_trading(ts) == (ts in filtered.index)
+    assert restriction.is_trading(pd.Timestamp("2023-07-05 13:30"))
+    # Restrictions over midnight
+    overnight = TimeRestriction("04:00", "20:00", tz)
+    assert overnight.is_trading(pd.Timestamp("2023-07-05 22:00", tz=tz))
+    assert not overnight.is_trading(pd.Timestamp("2023-07-05 12:00", tz=tz))
+    assert len(overnight.filter(df.loc["2023-07-05"])) == 4 * 60 + 1 + 4 * 60
+
+
+def test_composed_restriction_timezones():
+    new_york = TimeRestriction("16:00", "09:30", "US/Eastern")
+    london = TimeRestriction("15:00", "08:00", "Europe/London")
+    composed = ComposedRestriction([new_york, london])
+    # The US and the UK change to summer time on different days
+    index = pd.date_range("2023-03-06", "2023-04-01", freq="1min", tz="UTC")
+    df = pd.DataFrame({"close": np.arange(len(index))}, index=index)
+    expected = new_york.filter(london.filter(df))
+    pd.testing.assert_frame_equal(composed.filter(df), expected)
+    assert len(expected.loc["2023-03-20"]) == 31 + 60
+    for ts in index[::61]:
+        assert composed.is_trading(ts) == (ts in expected.index)
+
+
+async def test_csv_provider_wait_for_next(tmp_path):
+    index = pd.date_range("2022-08-01 13:30", periods=10, freq="1min", tz="UTC")
+    bars = pd.DataFrame(
+        {
+            "start": index.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "open": np.arange(10.0),
+            "close": np.arange(10.0) + 0.5,
+            "volume": np.arange(10),
+        }
+    )
+    path = tmp_path / "WFN.csv"
+    bars.to_csv(path, index=False)
+    provider = CSVUSStock("WFN", str(path)).bars
+    await provider.subscribe()
+    # Every bar is returned once and in order
+    for i in range(5):
+        bar = await asyncio.wait_for(provider.wait_for_next(), timeout=1)
+        assert bar.name == index[i]
+        assert bar["close"] == i + 0.5
+    # The next bar of freq is aggregated from the following bars
+    bar = await asyncio.wait_for(provider.wait_for_next("5min"), timeout=1)
+    assert bar.name == index[5]
+    assert bar["open"] == 5.0
+    assert bar["close"] == 9.5
+    assert bar["volume"] == sum(range(5, 10))
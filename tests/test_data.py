@@ -0,0 +1,545 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantrion.asset.base import Asset
+from quantrion.clock import SimulatedClock, set_clock
+from quantrion.data.base import GenericBarsProvider, RealTimeProvider
+from quantrion.data.indicators import supertrend, supertrend_grid, true_range
+from quantrion.data.intervals import IntervalSet
+from quantrion.data.panel import BarPanel
+from quantrion.data.pyramid import bucket_labels
+from quantrion.data.queue import BarQueue, QueuePolicy
+from quantrion.data.store import BarStore
+from quantrion.data.streaming import (
+    StreamingATR,
+    StreamingBollingerBands,
+    StreamingIndicator,
+    StreamingSMA,
+    StreamingSupertrend,
+)
+
+
+class MemoryAsset(Asset):
+    _tz = "US/Eastern"
+
+
+class MemoryProvider(GenericBarsProvider):
+    def __init__(self, asset: Asset, df: pd.DataFrame) -> None:
+        super().__init__(asset)
+        self._df = df
+        self.retrieved = []
+
+    async def _retrieve(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        self.retrieved.append((start, end))
+        return self._df.loc[start:end]
+
+
+class MemoryRealTimeProvider(RealTimeProvider):
+    def __init__(self, asset: Asset, df: pd.DataFrame) -> None:
+        super().__init__(asset)
+        self._df = df
+        self.retrieved = []
+
+    _retrieve = MemoryProvider._retrieve
+
+    async def _subscribe(self) -> None:
+        pass
+
+
+def generate_df(
+    n: int, end: pd.Timestamp = None, freq: str = "1min", seed: int = 0
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    if end is None:
+        end = pd.Timestamp.utcnow().floor("1d") - pd.Timedelta("1d")
+    index = pd.date_range(end=end, periods=n, freq=freq).tz_convert("US/Eastern")
+    close = 100 + rng.normal(0, 0.1, n).cumsum()
+    open_ = close + rng.normal(0, 0.05, n)
+    return pd.DataFrame(
+        {
+            "open": open_,
+            "high": np.maximum(open_, close) + rng.random(n) * 0.1,
+            "low": np.minimum(open_, close) - rng.random(n) * 0.1,
+            "close": close,
+            "volume": rng.random(n) * 1000,
+            "price": (open_ + close) / 2,
+        },
+        index=pd.DatetimeIndex(index, name="start"),
+    )
+
+
+def iterrows_supertrend(data: pd.DataFrame, k: float) -> pd.DataFrame:
+    hla = (data["high"] + data["low"]) / 2
+    data["basic_upper"] = hla + k * data["atr"]
+    data["basic_lower"] = hla - k * data["atr"]
+    prev_row = data.iloc[0]
+    prev_final_upper, prev_final_lower, prev_supertrend = (
+        prev_row["basic_upper"],
+        prev_row["basic_lower"],
+        0,
+    )
+    result = [(0, False)]
+    for _, row in data.iloc[1:].iterrows():
+        if (
+            row["basic_upper"] < prev_final_upper
+            or prev_row["close"] > prev_final_upper
+        ):
+            curr_final_upper = row["basic_upper"]
+        else:
+            curr_final_upper = prev_final_upper
+        if (
+            row["basic_lower"] > prev_final_lower
+            or prev_row["close"] < prev_final_lower
+        ):
+            curr_final_lower = row["basic_lower"]
+        else:
+            curr_final_lower = prev_final_lower
+        if prev_supertrend == prev_final_upper:
+            bullish = row["close"] > curr_final_upper
+        else:
+            bullish = row["close"] >= curr_final_lower
+        curr_supertrend = curr_final_lower if bullish else curr_final_upper
+        prev_final_upper, prev_final_lower, prev_supertrend = (
+            curr_final_upper,
+            curr_final_lower,
+            curr_supertrend,
+        )
+        prev_row = row
+        result.append((curr_supertrend, bullish))
+    df = pd.DataFrame(result, columns=["supertrend", "bullish"], index=data.index)
+    df["bullish"] = df["bullish"].astype(bool)
+    return df
+
+
+def test_supertrend_kernel_parity():
+    data = generate_df(2000)
+    tr = (data["high"] - data["low"]).to_numpy()
+    data["atr"] = pd.Series(tr, index=data.index).rolling(10).mean()
+    data = data.dropna()
+    expected = iterrows_supertrend(data.copy(), 2.5)
+    values, bullish = supertrend(
+        data["high"].to_numpy(),
+        data["low"].to_numpy(),
+        data["close"].to_numpy(),
+        data["atr"].to_numpy(),
+        2.5,
+    )
+    np.testing.assert_array_equal(values, expected["supertrend"].to_numpy())
+    np.testing.assert_array_equal(bullish, expected["bullish"].to_numpy())
+
+
+async def test_get_supertrend_parity():
+    df = generate_df(3000)
+    asset = MemoryAsset("SPY")
+    provider = MemoryProvider(asset, df)
+    start, end = df.index[500], df.index[-1]
+    await provider.get(df.index[0], end)
+    result = await provider.get_supertrend(start, end, "5min", n=14, k=3)
+    data = await provider.get(start, end, "5min", 1)
+    data["atr"] = await provider.get_atr(data.index[0], end, "5min", 14)
+    expected = iterrows_supertrend(data.dropna(), 3)
+    expected = expected[expected["supertrend"] != 0].loc[start:]
+    pd.testing.assert_frame_equal(result, expected)
+
+
+async def test_streaming_indicators_match_batch():
+    df = generate_df(1201).iloc[:-1]
+    asset = MemoryAsset("QQQ")
+    provider = MemoryProvider(asset, df)
+    provider.add(df.iloc[:300])
+    sma = provider.register_indicator("sma", StreamingSMA(20))
+    bands = provider.register_indicator("bands", StreamingBollingerBands(20, 2), "5min")
+    atr = provider.register_indicator("atr", StreamingATR(14), "5min")
+    st = provider.register_indicator("st", StreamingSupertrend(14, 3), "5min")
+    for i in range(300, len(df)):
+        provider.add(df.iloc[i : i + 1])
+    assert provider.get_indicator("sma") is sma
+
+    close = df["close"]
+    assert sma.value == pytest.approx(close.rolling(20).mean().iloc[-1])
+    resampled = provider._resample(df.copy(), "5min").dropna()
+    rolling = resampled["close"].rolling(20)
+    lower, mid, upper = bands.value
+    assert mid == pytest.approx(rolling.mean().iloc[-1])
+    assert upper - lower == pytest.approx(4 * rolling.std().iloc[-1])
+    prev_close = resampled["close"].shift(1)
+    tr = pd.concat(
+        [
+            resampled["high"] - resampled["low"],
+            (resampled["high"] - prev_close).abs(),
+            (resampled["low"] - prev_close).abs(),
+        ],
+        axis=1,
+    ).max(axis=1)
+    resampled["atr"] = tr.rolling(14).mean()
+    assert atr.value == pytest.approx(resampled["atr"].iloc[-1])
+    resampled = resampled.dropna()
+    values, bullish = supertrend(
+        resampled["high"].to_numpy(),
+        resampled["low"].to_numpy(),
+        resampled["close"].to_numpy(),
+        resampled["atr"].to_numpy(),
+        3,
+    )
+    assert st.ready
+    assert st.value == (pytest.approx(values[-1]), bullish[-1])
+
+
+def test_bar_store_extend():
+    df = generate_df(300)
+    store = BarStore.from_frame(df.iloc[100:200], capacity=8)
+    view = store.frame()
+    for i in range(200, 300):
+        store.extend_frame(df.iloc[i : i + 1])
+    store.extend_frame(df.iloc[:100])
+    pd.testing.assert_frame_equal(store.frame(), df, check_freq=False)
+    pd.testing.assert_frame_equal(view, df.iloc[100:200], check_freq=False)
+    assert np.shares_memory(store.frame().to_numpy(), store.values)
+
+    overlap = df.iloc[150:160].copy()
+    overlap["close"] = -1.0
+    store.extend_frame(overlap)
+    assert len(store) == 300
+    assert (store.frame()["close"].iloc[150:160] == -1).all()
+    pd.testing.assert_frame_equal(view, df.iloc[100:200], check_freq=False)
+
+    # Replacing the last bar does not change the frames already returned
+    frame = store.frame()
+    last = df.iloc[-1:].copy()
+    last["close"] = -2.0
+    store.extend_frame(last)
+    assert frame["close"].iloc[-1] == df["close"].iloc[-1]
+    assert store.frame()["close"].iloc[-1] == -2.0
+    store.extend_frame(last.assign(close=-3.0))
+    assert store.frame()["close"].iloc[-1] == -3.0
+
+
+async def test_get_keeps_integer_dtypes():
+    df = generate_df(600)
+    df["volume"] = (df["volume"] * 100).astype(np.int64)
+    df["n_trades"] = np.arange(len(df), dtype=np.int64)
+    # An empty bucket in the middle of the bars
+    df = df.drop(df.index[300:310])
+    idx = df.index
+    provider = MemoryProvider(MemoryAsset("INTS"), df)
+    result = await provider.get(idx[0], idx[-1])
+    pd.testing.assert_frame_equal(result, df, check_freq=False)
+    resampled = await provider.get(idx[0], idx[-1], "5min")
+    assert resampled["volume"].dtype == np.int64
+    assert resampled["volume"].sum() == df.loc[resampled.index[0] :, "volume"].sum()
+
+
+@pytest.mark.parametrize("days", [0.5, 3, 60])
+def test_bucket_labels_across_dst(days):
+    # Spans that end around the fall DST change of New York
+    end = pd.Timestamp("2022-11-06 12:00", tz="UTC")
+    index = pd.date_range(end - pd.Timedelta(days=days), end, freq="7min")
+    labels = bucket_labels(index.asi8, "1h", "America/New_York")
+    local = index.tz_convert("America/New_York")
+    # Bars of the repeated hour keep their own offset
+    dst = np.array([bool(ts.dst()) for ts in local])
+    expected = local.floor("1h", ambiguous=dst)
+    np.testing.assert_array_equal(labels, expected.asi8)
+
+
+def test_interval_set():
+    ts = pd.Timestamp("2022-01-03 10:00")
+    m = pd.Timedelta("1min")
+    intervals = IntervalSet(m)
+    intervals.add(ts, ts + 9 * m)
+    intervals.add(ts + 20 * m, ts + 29 * m)
+    intervals.add(ts + 10 * m, ts + 12 * m)
+    assert list(intervals) == [(ts, ts + 12 * m), (ts + 20 * m, ts + 29 * m)]
+    assert intervals.missing(ts - 5 * m, ts + 40 * m) == [
+        (ts - 5 * m, ts - m),
+        (ts + 13 * m, ts + 19 * m),
+        (ts + 30 * m, ts + 40 * m),
+    ]
+    assert intervals.contains(ts + m, ts + 5 * m)
+    intervals.remove(ts + 5 * m, ts + 24 * m)
+    assert list(intervals) == [(ts, ts + 4 * m), (ts + 25 * m, ts + 29 * m)]
+
+
+async def test_update_data_fetches_only_gaps():
+    df = generate_df(600)
+    provider = MemoryProvider(MemoryAsset("IWM"), df)
+    idx = df.index
+    await provider.get(idx[100], idx[199])
+    await provider.get(idx[400], idx[499])
+    provider.retrieved.clear()
+    result = await provider.get(idx[50], idx[549])
+    assert provider.retrieved == [
+        (idx[50], idx[99]),
+        (idx[200], idx[399]),
+        (idx[500], idx[549]),
+    ]
+    pd.testing.assert_frame_equal(result, df.iloc[50:550], check_freq=False)
+
+    provider.drop(idx[300])
+    provider.retrieved.clear()
+    await provider.get(idx[250], idx[320])
+    assert provider.retrieved == [(idx[250], idx[299])]
+
+
+class RecordingIndicator(StreamingIndicator):
+    def __init__(self) -> None:
+        self.closes = []
+
+    def update(self, bar) -> None:
+        self.closes.append(bar["close"])
+
+    def reset(self) -> None:
+        self.closes = []
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    @property
+    def value(self):
+        return self.closes
+
+
+class SlowRangeProvider(MemoryProvider):
+    def __init__(self, asset: Asset, df: pd.DataFrame, slow_start: pd.Timestamp):
+        super().__init__(asset, df)
+        self._slow_start = slow_start
+
+    async def _retrieve(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        if start == self._slow_start:
+            await asyncio.sleep(0.05)
+        return await super()._retrieve(start, end)
+
+
+async def test_ranges_are_streamed_in_order():
+    df = generate_df(300)
+    idx = df.index
+    provider = SlowRangeProvider(MemoryAsset("ORDR"), df, idx[100])
+    provider.add(df.iloc[:100])
+    indicator = provider.register_indicator("closes", RecordingIndicator())
+    # The later range is retrieved first but streamed after the earlier one
+    await asyncio.gather(
+        provider.get(idx[100], idx[199]), provider.get(idx[200], idx[299])
+    )
+    assert indicator.value == df["close"].tolist()
+
+
+async def test_gap_filled_after_live_bars_reseeds_indicators():
+    df = generate_df(300)
+    idx = df.index
+    provider = SlowRangeProvider(MemoryAsset("GAPF"), df, idx[100])
+    provider.add(df.iloc[:100])
+    indicator = provider.register_indicator("closes", RecordingIndicator())
+    atr = provider.register_indicator("atr", StreamingATR(14), "5min")
+    # Live bars are added while the bars before them are still being retrieved
+    catch_up = asyncio.create_task(provider.get(idx[100], idx[199]))
+    await asyncio.sleep(0)
+    provider.add(df.iloc[200:250])
+    await catch_up
+    provider.add(df.iloc[250:])
+    assert indicator.value == df["close"].tolist()
+    expected = MemoryProvider(MemoryAsset("GAPF2"), df)
+    expected.add(df)
+    expected_atr = expected.register_indicator("atr", StreamingATR(14), "5min")
+    assert atr.value == pytest.approx(expected_atr.value)
+
+
+async def test_update_data_single_flight():
+    df = generate_df(600)
+    provider = MemoryProvider(MemoryAsset("QQQ"), df)
+    idx = df.index
+    results = await asyncio.gather(
+        provider.get(idx[100], idx[399]),
+        provider.get(idx[200], idx[299]),
+        provider.get(idx[0], idx[499]),
+    )
+    assert provider.retrieved == [
+        (idx[100], idx[399]),
+        (idx[0], idx[99]),
+        (idx[400], idx[499]),
+    ]
+    pd.testing.assert_frame_equal(results[1], df.iloc[200:300], check_freq=False)
+    pd.testing.assert_frame_equal(results[2], df.iloc[:500], check_freq=False)
+    assert len(provider._in_flight) == 0
+
+
+async def test_indicator_memo():
+    df = generate_df(600)
+    provider = MemoryProvider(MemoryAsset("XLF"), df)
+    idx = df.index
+    atr = await provider.get_atr(idx[100], idx[300], n=14)
+    cached = await provider.get_atr(idx[100], idx[300], n=14)
+    assert provider.memo_stats == {"hits": 1, "misses": 1, "size": 1}
+    pd.testing.assert_series_equal(atr, cached)
+    cached.iloc[:] = 0
+    pd.testing.assert_series_equal(
+        atr, await provider.get_atr(idx[100], idx[300], n=14)
+    )
+    await provider.get_supertrend(idx[100], idx[300], n=14, k=2)
+    assert provider.memo_stats["misses"] == 3
+    # Bars after the end of the memoized results do not invalidate them
+    provider.add(df.iloc[301:320])
+    await provider.get_supertrend(idx[100], idx[300], n=14, k=2)
+    assert provider.memo_stats == {"hits": 3, "misses": 3, "size": 3}
+    changed = df.iloc[300:301].copy()
+    changed["close"] += 1
+    provider.add(changed)
+    assert provider.memo_stats["size"] == 0
+    await provider.get_atr(idx[100], idx[300], n=14)
+    assert provider.memo_stats["misses"] == 4
+
+
+async def test_supertrend_grid():
+    df = generate_df(3000)
+    params = [(10, 1.5), (14, 2), (14, 3), (40, 3.6)]
+    high, low, close = (df[key].to_numpy() for key in ["high", "low", "close"])
+    atr, values, bullish = supertrend_grid(high, low, close, params)
+    tr = pd.Series(true_range(high, low, close))
+    for i, (n, k) in enumerate(params):
+        expected_atr = tr.rolling(n).mean().to_numpy()
+        np.testing.assert_allclose(atr[i], expected_atr, rtol=1e-9)
+        expected, expected_bullish = supertrend(
+            high[n - 1 :], low[n - 1 :], close[n - 1 :], atr[i, n - 1 :], k
+        )
+        np.testing.assert_array_equal(values[i, n - 1 :], expected)
+        np.testing.assert_array_equal(bullish[i, n - 1 :], expected_bullish)
+        assert (values[i, : n - 1] == 0).all()
+
+    provider = MemoryProvider(MemoryAsset("SPY"), df)
+    start = df.index[1000].ceil("5min")
+    index, atr, values, bullish = await provider.get_supertrend_grid(
+        start, freq="5min", params=params
+    )
+    assert index[0] == start and values.shape == (len(params), len(index))
+    for i, (n, k) in enumerate(params):
+        expected = await provider.get_supertrend(start, freq="5min", n=n, k=k)
+        # Both series converge once the different seeds are forgotten
+        np.testing.assert_allclose(values[i, -50:], expected["supertrend"][-50:])
+
+
+def test_bar_panel():
+    dfs = {symbol: generate_df(200, seed=seed) for seed, symbol in enumerate("ABC")}
+    dfs["C"] = dfs["C"].drop(dfs["C"].index[-1])
+    panel = BarPanel(window=50)
+    for symbol, df in dfs.items():
+        provider = MemoryProvider(MemoryAsset(symbol), df)
+        provider.add(df.iloc[:100])
+        panel.attach(provider)
+        provider.add(df.iloc[100:])
+    end = dfs["A"].index[-1]
+    assert panel.symbols == ["A", "B", "C"] and panel.end == end
+    volume = panel.values("volume", 30)
+    assert volume.shape == (3, 30)
+    np.testing.assert_array_equal(volume[0], dfs["A"]["volume"].iloc[-30:])
+    np.testing.assert_array_equal(volume[2, :-1], dfs["C"]["volume"].iloc[-29:])
+    assert np.isnan(volume[2, -1])
+    zscore = panel.zscore("volume", 20)
+    for i, symbol in enumerate("AB"):
+        volume = dfs[symbol]["volume"]
+        history = volume.iloc[-21:-1]
+        expected = (volume.iloc[-1] - history.mean()) / history.std()
+        assert zscore[i] == pytest.approx(expected)
+    assert np.isnan(zscore[2])
+    # Bars older than the window are forgotten
+    assert np.isnan(panel.values("close", 50)).sum() == 1
+    assert np.isnan(panel.values("close", 51)).all()
+
+
+async def test_resample_pyramid_matches_resample():
+    df = generate_df(3 * 1440)
+    df = df[(df.index.hour >= 9) & (df.index.hour < 16)]
+    df = df.drop(df.index[100:140])
+    provider = MemoryProvider(MemoryAsset("DIA"), df)
+    provider.add(df.iloc[:1000])
+    start = df.index[0]
+    for freq in ["15min", "1h", "1d"]:
+        await provider.get(start, df.index[999], freq)
+    for i in range(1000, len(df)):
+        provider.add(df.iloc[i : i + 1])
+    for freq in ["2min", "15min", "1h", "1d"]:
+        end = df.index[-1].floor(freq) - pd.Timedelta("1min")
+        expected = provider._resample(df.loc[start.ceil(freq) : end].copy(), freq)
+        result = await provider.get(start, end, freq)
+        pd.testing.assert_frame_equal(result, expected, check_freq=False)
+        # Lagged starts may not be aligned with freq
+        expected = provider._resample(df.loc[df.index[7] : end].copy(), freq)
+        result = provider._pyramid.get(provider._store, freq, df.index[7], end)
+        pd.testing.assert_frame_equal(result, expected, check_freq=False)
+
+
+async def test_bar_queue_policies():
+    df = generate_df(10)
+    bars = [bar for _, bar in df.iterrows()]
+    drop = BarQueue(3, QueuePolicy.DROP_OLDEST)
+    coalesce = BarQueue(3, QueuePolicy.COALESCE)
+    block = BarQueue(3, QueuePolicy.BLOCK)
+    for bar in bars[:5]:
+        for queue in [drop, coalesce, block]:
+            queue.put_nowait(bar)
+    assert [(await drop.get()).name for _ in range(3)] == list(df.index[2:5])
+    assert drop.stats == {"depth": 0, "max_depth": 3, "put": 5, "dropped": 2}
+    assert [(await coalesce.get()).name for _ in range(2)] == list(df.index[3:5])
+    assert coalesce.stats["dropped"] == 3
+    # Blocking queues keep every bar and make the producer wait
+    assert block.full and block.stats["dropped"] == 0
+    waiter = asyncio.create_task(block.wait_not_full())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    assert (await block.get()).name == df.index[0]
+    assert not waiter.done()
+    for _ in range(2):
+        await block.get()
+    await asyncio.wait_for(waiter, 1)
+    assert [(await block.get()).name for _ in range(2)] == list(df.index[3:5])
+
+
+async def test_wait_for_next_does_not_skip_bars():
+    df = generate_df(30, end=pd.Timestamp("2022-07-05 14:59", tz="UTC"))
+    provider = MemoryRealTimeProvider(MemoryAsset("SPY"), df)
+    provider.add(df.iloc[:10])
+    consumer = asyncio.create_task(provider.wait_for_next())
+    await asyncio.sleep(0)
+    # Bars added while the consumer is busy are queued
+    provider.add(df.iloc[10:13])
+    provider.add(df.iloc[13:14])
+    assert (await consumer).name == df.index[10]
+    for ts in df.index[11:14]:
+        assert (await provider.wait_for_next()).name == ts
+    provider.add(df.iloc[14:])
+    bar = await provider.wait_for_next("5min")
+    assert bar.name == pd.Timestamp("2022-07-05 10:40", tz="US/Eastern")
+    assert bar["close"] == df["close"].iloc[14]
+    bar = await provider.wait_for_next("5min")
+    assert bar.name == pd.Timestamp("2022-07-05 10:45", tz="US/Eastern")
+    assert bar["close"] == df["close"].iloc[19]
+    # The first bar of the next bucket is not lost
+    assert (await provider.wait_for_next()).name == df.index[20]
+    provider.close_queue(provider._queue)
+    provider.add(df.iloc[-1:])
+    assert provider._listeners == []
+
+
+async def test_wait_for_next_times_out_on_clock():
+    df = generate_df(30, end=pd.Timestamp("2022-07-05 14:59", tz="UTC"))
+    provider = MemoryRealTimeProvider(MemoryAsset("WFNC"), df)
+    # The last bar is received once it is closed
+    clock = SimulatedClock(df.index[13])
+    previous = set_clock(clock)
+    try:
+        consumer = asyncio.create_task(provider.wait_for_next("5min"))
+        await asyncio.sleep(0)
+        provider.add(df.iloc[10:13])
+        await clock.wait_for_sleeper({consumer})
+        # The bucket is not over until the clock reaches its end and grace period
+        assert clock.next_deadline == df.index[15] + pd.Timedelta(seconds=2)
+        assert not consumer.done()
+        await clock.advance_to(clock.next_deadline)
+        bar = await asyncio.wait_for(consumer, 1)
+    finally:
+        set_clock(previous)
+    # The bars that were not received are retrieved
+    assert bar.name == df.index[10]
+    assert bar["close"] == df["close"].iloc[14]
@@ -0,0 +1,421 @@
+import asyncio
+import json
+import multiprocessing as mp
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quantrion import settings
+from quantrion.asset.file import CSVReplay, CSVUSStock
+from quantrion.clock import get_clock
+from quantrion.data.base import StaticAssetListProvider
+from quantrion.data.indicators import supertrend, true_range
+from quantrion.strategy.backtest import backtest_universe, first_crossing
+from quantrion.strategy.base import Strategy
+from quantrion.strategy.scheduler import BarCloseScheduler
+from quantrion.strategy.sharded import BarFanOut, partition, receive_bars
+from quantrion.strategy.supertrend import SupertrendStrategy
+from quantrion.strategy.sweep import (
+    ParameterSweep,
+    ResultsStore,
+    SharedBars,
+    parameter_grid,
+)
+
+from .test_data import MemoryAsset, MemoryProvider, generate_df
+
+
+def memory_asset(symbol: str, df: pd.DataFrame) -> MemoryAsset:
+    asset = MemoryAsset(symbol)
+    asset.bars = MemoryProvider(asset, df)
+    asset.bars.add(df)
+    return asset
+
+
+class RecordingStrategy(Strategy):
+    def __init__(self, tl_provider=None) -> None:
+        super().__init__(tl_provider, "5min")
+        self.received = []
+
+    async def next(self, asset, last_bar):
+        if asset.symbol == "FAIL":
+            raise ValueError("Failed")
+        self.received.append((asset.symbol, last_bar.name))
+
+
+async def test_bar_close_scheduler_batches_closed_bars():
+    df = generate_df(600)
+    close = df.index[-1].floor("5min")
+    assets = [
+        memory_asset("SCH1", df),
+        memory_asset("SCH2", generate_df(600, seed=1)),
+        memory_asset("SCH3", df.loc[: close - pd.Timedelta("6min")]),
+    ]
+    scheduler = BarCloseScheduler("5min")
+    for asset in assets:
+        scheduler.register(asset)
+    assert scheduler.next_close(close - pd.Timedelta("30s")) == close
+    batch = await scheduler.collect(close)
+    assert [asset.symbol for asset, _ in batch] == ["SCH1", "SCH2"]
+    for asset, last_bar in batch:
+        bucket = asset.bars._df.loc[close - pd.Timedelta("5min") : close]
+        bucket = bucket.iloc[:-1]
+        assert last_bar.name == close - pd.Timedelta("5min")
+        assert last_bar["high"] == bucket["high"].max()
+        assert last_bar["close"] == bucket["close"].iloc[-1]
+
+    strategy = RecordingStrategy()
+    await strategy._dispatch(
+        [(memory_asset("FAIL", df), batch[0][1]), *batch],
+    )
+    assert strategy.received == [(asset.symbol, bar.name) for asset, bar in batch]
+
+
+async def test_bar_fan_out_sends_bars_to_shards():
+    df = generate_df(20)
+    parents = [memory_asset(f"FAN{i}", df.iloc[:10]) for i in range(5)]
+    # Assets are singletons per symbol, so the worker side uses other symbols
+    workers = {f"FAN{i}": memory_asset(f"FANW{i}", df.iloc[:10]) for i in range(5)}
+    shards = partition(parents, 2)
+    assert [[asset.symbol for asset in shard] for shard in shards] == [
+        ["FAN0", "FAN2", "FAN4"],
+        ["FAN1", "FAN3"],
+    ]
+    pipes = [mp.Pipe(duplex=False) for _ in shards]
+    fan_out = BarFanOut([writer for _, writer in pipes])
+    for worker, shard in enumerate(shards):
+        for asset in shard:
+            fan_out.attach(asset, worker)
+    for asset in parents:
+        asset.bars.add(df.iloc[10:15])
+    # Bars added in the same loop iteration are sent in one message
+    await asyncio.sleep(0)
+    assert len(pipes[0][0].recv()) == 3
+    for asset in parents:
+        asset.bars.add(df.iloc[15:])
+    fan_out.close()
+    for reader, _ in pipes:
+        await receive_bars(reader, workers)
+    # The first message of shard 0 was read by the test
+    assert len(workers["FAN0"].bars._bars) == 15
+    for symbol in ["FAN1", "FAN3"]:
+        pd.testing.assert_frame_equal(workers[symbol].bars._bars, df, check_freq=False)
+
+
+class BlockedConnection:
+    def __init__(self) -> None:
+        self.sending = threading.Event()
+        self.released = threading.Event()
+        self.sent = []
+
+    def send(self, message):
+        self.sending.set()
+        self.released.wait()
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+async def test_bar_fan_out_does_not_block_on_slow_shards():
+    df = generate_df(20)
+    asset = memory_asset("FANSLOW", df.iloc[:10])
+    conn = BlockedConnection()
+    fan_out = BarFanOut([conn], maxsize=2, policy="drop_oldest")
+    fan_out.attach(asset, 0)
+    asset.bars.add(df.iloc[10:11])
+    await asyncio.sleep(0)
+    assert conn.sending.wait(1)
+    # The worker is not reading, so the oldest pending message is dropped
+    for i in range(11, 14):
+        asset.bars.add(df.iloc[i : i + 1])
+        await asyncio.sleep(0)
+    assert fan_out.stats == {"pending": 2, "dropped": 1}
+    conn.released.set()
+    fan_out.close()
+    fan_out.join(1)
+    sent = [payload[1][0] for message in conn.sent[:-1] for payload in message]
+    assert sent == list(df.index[[10, 12, 13]].asi8)
+    assert conn.sent[-1] is None
+
+
+class SlowProvider(MemoryProvider):
+    running = 0
+    max_running = 0
+
+    async def _retrieve(self, start, end):
+        SlowProvider.running += 1
+        SlowProvider.max_running = max(SlowProvider.max_running, SlowProvider.running)
+        await asyncio.sleep(0.01)
+        SlowProvider.running -= 1
+        if self.asset.symbol == "WARMFAIL":
+            raise ValueError("Failed")
+        return await super()._retrieve(start, end)
+
+
+class LookbackStrategy(RecordingStrategy):
+    lookback = 30
+
+
+async def test_warm_up_retrieves_lookback(monkeypatch):
+    monkeypatch.setattr(settings, "WARMUP_MAX_CONCURRENCY", 2)
+    df = generate_df(1000, end=pd.Timestamp.utcnow().floor("1min"))
+    assets = []
+    for symbol in ["WARM1", "WARM2", "WARM3", "WARM4", "WARMFAIL"]:
+        asset = MemoryAsset(symbol)
+        asset.bars = SlowProvider(asset, df)
+        assets.append(asset)
+    await LookbackStrategy().warm_up(assets)
+    assert SlowProvider.max_running == 2
+    for asset in assets[:-1]:
+        assert len(asset.bars.retrieved) > 0
+        start = asset.bars._retrieved.start
+        assert start <= df.index[-1].floor("5min") - pd.Timedelta("155min")
+
+
+def test_first_crossing():
+    rng = np.random.default_rng(0)
+    values = rng.normal(0, 1, 1000).cumsum()
+    starts = rng.integers(0, 1001, 200)
+    levels = values[np.minimum(starts, 999)] + rng.normal(0, 5, 200)
+    for above in [True, False]:
+        expected = []
+        for start, level in zip(starts, levels):
+            hits = [
+                i
+                for i in range(start, len(values))
+                if (values[i] >= level if above else values[i] <= level)
+            ]
+            expected.append(hits[0] if hits else len(values))
+        result = first_crossing(values, starts, levels, above)
+        np.testing.assert_array_equal(result, expected)
+
+
+def test_supertrend_backtest():
+    df = generate_df(3000, seed=3)
+    df["volume"] = np.exp(np.random.default_rng(3).normal(5, 1, len(df)))
+    strategy = SupertrendStrategy(short_n=10, long_n=30, short_k=1.5)
+    entries, long, risk = strategy.entry_signals(df)
+    # The entry rules of next, with every supertrend seeded on the previous bar like
+    # get_supertrend does for a single bar
+    tr = true_range(df["high"], df["low"], df["close"])
+    atr = {n: pd.Series(tr).rolling(n).mean().to_numpy() for n in [10, 30]}
+    log_vol = np.log(df["volume"] + 1e-3)
+
+    def last_supertrend(i, n, k):
+        if i < 1 or np.isnan(atr[n][i - 1 : i + 1]).any():
+            return None
+        window = df.iloc[i - 1 : i + 1]
+        values, bullish = supertrend(
+            window["high"], window["low"], window["close"], atr[n][i - 1 : i + 1], k
+        )
+        return bullish[-1] if values[-1] != 0 else None
+
+    for i in range(len(df)):
+        previous = log_vol.iloc[max(i - 30, 0) : i]
+        st, lst = last_supertrend(i, 10, 1.5), last_supertrend(i, 30, 5.0)
+        expected = (
+            i >= 30
+            and log_vol.iloc[i] >= previous.mean() + 1.5 * previous.std()
+            and st is not None
+            and lst is not None
+            and st == lst
+        )
+        assert entries[i] == expected
+        if expected:
+            assert long[i] == st
+            assert risk[i] == pytest.approx(atr[30][i])
+    assert entries.sum() > 10
+
+    result = strategy.backtest(df)
+    trades = result.trades
+    assert len(trades) == entries.sum()
+    for trade in trades.itertuples():
+        is_long = trade.side == "buy"
+        after = df.loc[trade.entry_time :].iloc[1:]
+        stop_hit = after["low"] <= trade.stop_price
+        profit_hit = after["high"] >= trade.profit_price
+        if not is_long:
+            stop_hit = after["high"] >= trade.stop_price
+            profit_hit = after["low"] <= trade.profit_price
+        hit = after[stop_hit | profit_hit]
+        if hit.empty:
+            assert trade.exit_reason == "end" and trade.exit_time == df.index[-1]
+            continue
+        assert trade.exit_time == hit.index[0]
+        assert trade.exit_reason == ("stop" if stop_hit[hit.index[0]] else "profit")
+        direction = 1 if is_long else -1
+        expected_pnl = trade.size * direction * (trade.exit_price - trade.entry_price)
+        assert trade.pnl == pytest.approx(expected_pnl)
+    assert result.equity.iloc[-1] == pytest.approx(100000 + trades["pnl"].sum())
+
+    universe = backtest_universe(strategy, {"A": df, "B": df.iloc[1000:]})
+    assert set(universe.trades["symbol"]) == {"A", "B"}
+    assert universe.stats["trades"] == len(trades) + len(
+        strategy.backtest(df.iloc[1000:]).trades
+    )
+
+
+class TradeRecordingStrategy(SupertrendStrategy):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.trades = []
+
+    async def trade(self, asset, price, risk, long):
+        self.trades.append((price, risk, long))
+
+
+@pytest.mark.parametrize("gap", [False, True])
+async def test_supertrend_next_matches_entry_signals(gap):
+    df = generate_df(1500, seed=5)
+    df["volume"] = np.exp(np.random.default_rng(5).normal(5, 1, len(df)))
+    if gap:
+        df = df.drop(df.index[700:720])
+    asset = memory_asset(f"STPAR{int(gap)}", df)
+    strategy = TradeRecordingStrategy(freq="5min", short_n=10, long_n=30, short_k=1.5)
+    bars = await asset.bars.get(df.index[0], df.index[-1], "5min")
+    assert bars["close"].isna().any() == gap
+    entries, long, risk = strategy.entry_signals(bars)
+    empty = np.flatnonzero(bars["close"].isna())
+    n_checked = 0
+    # next reads the same supertrend and ATR values as get_supertrend and get_atr
+    for i, (_, bar) in enumerate(bars.iterrows()):
+        if np.isnan(bar["close"]):
+            # The empty buckets are not dispatched
+            assert not entries[i]
+            continue
+        n_trades = len(strategy.trades)
+        await strategy.next(asset, bar)
+        # The ATR windows of next count the empty buckets
+        if ((empty < i) & (empty >= i - 31)).any():
+            continue
+        assert (len(strategy.trades) > n_trades) == entries[i]
+        if entries[i]:
+            expected = (bar["close"], pytest.approx(risk[i]), long[i])
+            assert strategy.trades[-1] == expected
+            n_checked += 1
+    assert n_checked > 5
+
+
+def write_csv(path, df: pd.DataFrame):
+    bars = df.reset_index()
+    bars["start"] = bars["start"].dt.tz_convert("UTC").dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    bars.to_csv(path, index=False)
+
+
+async def test_csv_replay(tmp_path):
+    end = pd.Timestamp("2022-08-01 15:59", tz="US/Eastern")
+    dfs = {}
+    for i, symbol in enumerate(["REP1", "REP2", "REP3"]):
+        df = generate_df(390 + 60, end=end.tz_convert("UTC"), seed=i)
+        write_csv(tmp_path / f"{symbol}.csv", df)
+        dfs[symbol] = df
+    assets = [CSVUSStock(symbol, str(tmp_path / f"{symbol}.csv")) for symbol in dfs]
+    strategy = RecordingStrategy(StaticAssetListProvider(assets))
+    replay = CSVReplay(assets, start=pd.Timestamp("2022-08-01 09:30", tz="US/Eastern"))
+    clock = get_clock()
+    await replay.run(strategy.run())
+    assert get_clock() is clock
+    closes = pd.date_range(end.replace(hour=9, minute=30), end, freq="5min")
+    expected = [(symbol, ts) for ts in closes for symbol in dfs]
+    assert sorted(strategy.received, key=lambda x: (x[1], x[0])) == expected
+    # Bars before start are history and are not replayed
+    assert assets[0].bars._curr_idx == len(dfs["REP1"]) - 1
+
+
+async def test_run_over_csv_bars(tmp_path):
+    end = pd.Timestamp("2022-08-01 10:29", tz="US/Eastern")
+    assets = []
+    for i, symbol in enumerate(["CSVRUN1", "CSVRUN2"]):
+        df = generate_df(30, end=end.tz_convert("UTC"), seed=i)
+        write_csv(tmp_path / f"{symbol}.csv", df)
+        assets.append(CSVUSStock(symbol, str(tmp_path / f"{symbol}.csv")))
+    strategy = RecordingStrategy(StaticAssetListProvider(assets))
+    task = asyncio.create_task(strategy.run())
+    closes = pd.date_range(end.replace(minute=0), end, freq="5min")
+    expected = [(asset.symbol, ts) for asset in assets for ts in closes]
+    # The bars of the files are dispatched without waiting for their close times
+    for _ in range(100):
+        if len(strategy.received) == len(expected) or task.done():
+            break
+        await asyncio.sleep(0.01)
+    await strategy.stop()
+    await asyncio.gather(task, return_exceptions=True)
+    assert sorted(strategy.received) == expected
+
+
+async def test_parameter_sweep(tmp_path):
+    assets = []
+    for i, symbol in enumerate(["SWP1", "SWP2"]):
+        df = generate_df(6000, end=pd.Timestamp("2022-08-01 20:00", tz="UTC"), seed=i)
+        df["volume"] = np.exp(np.random.default_rng(i).normal(5, 1, len(df)))
+        if i == 1:
+            df = df.drop(df.index[3000:3100])
+        write_csv(tmp_path / f"{symbol}.csv", df)
+        assets.append(CSVUSStock(symbol, str(tmp_path / f"{symbol}.csv")))
+    bars = assets[0].bars.history("15min")
+    expected_bars = generate_df(6000, end=pd.Timestamp("2022-08-01 20:00", tz="UTC"))
+    assert len(bars) == len(expected_bars.resample("15min").first())
+    assert bars["high"].iloc[1] == pytest.approx(
+        expected_bars["high"].iloc[15:30].max()
+    )
+    # The empty buckets are included, like in get
+    bars = assets[1].bars.history("15min")
+    assert bars.index.equals(pd.date_range(bars.index[0], bars.index[-1], freq="15min"))
+    assert bars["close"].isna().sum() == 5
+    assert bars["volume"].notna().all()
+
+    space = {"short_n": [10, 14], "long_k": [3.0, 5.0]}
+    path = str(tmp_path / "results.jsonl")
+    with pytest.raises(TypeError):
+        ParameterSweep(RecordingStrategy, assets, space, path)
+    sweep = ParameterSweep(
+        SupertrendStrategy, assets, space, path, freq="15min", n_workers=2
+    )
+    results = await sweep.run()
+    assert len(results) == 4
+    universe = {asset.symbol: asset.bars.history("15min") for asset in assets}
+    for params in parameter_grid(space):
+        strategy = SupertrendStrategy(freq="15min", **params)
+        stats = backtest_universe(strategy, universe).stats
+        row = results[
+            (results["short_n"] == params["short_n"])
+            & (results["long_k"] == params["long_k"])
+        ].iloc[0]
+        assert row["trades"] == stats["trades"]
+        assert row["pnl"] == pytest.approx(stats["pnl"])
+
+    # Completed trials are not run again
+    space["short_n"].append(18)
+    results = await ParameterSweep(
+        SupertrendStrategy, assets, space, path, freq="15min", n_workers=2
+    ).run()
+    assert len(results) == 6
+    assert len(open(path).readlines()) == 6
+
+
+def test_shared_bars_columns():
+    df = generate_df(50)
+    bars = {"A": df, "B": df[df.columns[::-1]].iloc[10:]}
+    shared = SharedBars.create(bars)
+    try:
+        frames = shared.frames()
+        pd.testing.assert_frame_equal(frames["B"], df.iloc[10:], check_freq=False)
+    finally:
+        shared.close()
+        shared.unlink()
+    with pytest.raises(ValueError):
+        SharedBars.create({"A": df, "B": df.drop(columns="price")})
+
+
+def test_results_store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.jsonl"))
+    stats = {"trades": np.int64(0), "hit_ratio": np.nan, "pnl": np.float64(1.5)}
+    store.append({"short_n": 10}, stats)
+    with open(tmp_path / "results.jsonl") as f:
+        record = json.loads(f.read(), parse_constant=pytest.fail)
+    assert record == {"short_n": 10, "trades": 0, "hit_ratio": None, "pnl": 1.5}
+    assert isinstance(record["trades"], int)
+    assert store.completed(["short_n"]) == {(("short_n", 10),)}